@@ -2,6 +2,7 @@ import pandas as pd
 import sys
 
 sys.path.append("../utils")
+import http_cache
 from google_configs import gc_files, pull_sheet, update_sheet
 from logger import create_logger
 
@@ -159,7 +160,7 @@ class AgenciesSheetUpdate:
         """
         reads in the most recent list of filtered agency oris stored in s3 from the fbe cde
         """
-        cde = pd.read_csv(
+        cde = http_cache.read_csv(
             "https://rtci.s3.us-east-1.amazonaws.com/fbi/cde_filtered_oris.csv"
         ).sort_values(by="ori")
         return cde
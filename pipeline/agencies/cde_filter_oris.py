@@ -2,9 +2,11 @@ import json
 import numpy as np
 import os
 import pandas as pd
+import random
 import requests
 import sys
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime as dt
 from datetime import timedelta as td
 from dotenv import load_dotenv
@@ -12,8 +14,11 @@ from json.decoder import JSONDecodeError
 from time import sleep
 
 sys.path.append("../utils")
+import http_cache
 from aws import snapshot_df
 from logger import create_logger
+from parallelize import TokenBucket
+from requests_configs import mount_session
 
 
 load_dotenv()
@@ -30,6 +35,12 @@ to retrieve a filtered list of agency ORIs. Filtering criteria are:
 
 The output set of ORIs is saved on AWS as `rtci/fbi/cde_filtered_oris.csv`.
 
+Populations are looked up concurrently (`--threads`) under a shared request
+budget (`--rate`, requests per second), retrying rate limited and upstream
+errors with jittered exponential backoff. Looked-up populations are cached per
+(ORI, month) on AWS as `rtci/fbi/cde_populations.csv`, so repeated runs within
+the same month only query ORIs not seen yet.
+
 * To manually force the inclusion of an agency that would otherwise fail filtering,
 include it in the `self.overrides` list in `self.__init__`.
 """
@@ -66,9 +77,13 @@ class CdeGetFilterOris:
             "FL0160000": "City",
             "UT0180000": "City",
         }
-        self.geographies = pd.read_csv(
+        self.geographies = http_cache.read_csv(
             "https://rtci.s3.us-east-1.amazonaws.com/fbi/geographies.csv"
         )
+        self.session = mount_session()
+        self.bucket = TokenBucket(self.args.rate)
+        self.max_retries = 8
+        self.max_backoff = 60
 
     def scrape(self):
         """
@@ -115,10 +130,7 @@ class CdeGetFilterOris:
         self.logger.info(f"found oris: {len(all_oris)}")
 
         # filter down list of oris based on population thresholds
-        filtered_oris = list()
-        for n, ori in enumerate(all_oris):
-            self.logger.info(f"[{n}/{len(all_oris)}] attempting {ori}...")
-            filtered_oris.append(self.filter_oris(ori))
+        filtered_oris = self.get_populations(all_oris)
 
         # save the extended dataset of oris for the website geographies data table
         df = pd.DataFrame(filtered_oris)
@@ -173,37 +185,97 @@ class CdeGetFilterOris:
                 filename=f"cde_filtered_oris",
             )
 
-    def filter_oris(self, query):
+    def get_populations(self, oris):
         """
-        for a given ORI, retrieves most recently reported population
+        adds the most recently reported population to each ORI, from the
+        (ORI, month) population cache where available and otherwise from the API
         """
-        r = requests.get(
-            f"https://api.usa.gov/crime/fbi/cde/nibrs/agency/{query['ori']}/all?type=counts"
-            f"&from={self.last}"
-            f"&to={self.last}"
-            f"&ori={query['ori']}"
-            f"&API_KEY={self.api_key}"
-        )
+        cache = self.get_cache()
+        todo = [ori for ori in oris if (ori["ori"], self.last) not in cache]
+        self.logger.info(f"cached populations: {len(oris) - len(todo)}/{len(oris)}")
+
         try:
-            j = json.loads(r.text)
-            pop = j["populations"]["population"][query["name"]][self.last]
-            query.update({"pop": pop})
-            return query
-        except KeyError:
-            j = json.loads(r.text)
-            if j["error"]["code"] == "OVER_RATE_LIMIT":
-                self.logger.warning(f"retrying {query}...")
-                self.filter_oris(query)
-                sleep(5)
-            else:
-                raise BaseException
-        except JSONDecodeError:
-            if "upstream connect error" in r.text:
-                self.logger.warning(f"retrying {query}...")
-                self.filter_oris(query)
-                sleep(5)
-            else:
-                raise BaseException
+            with ThreadPoolExecutor(max_workers=self.args.threads) as executor:
+                futures = {
+                    executor.submit(self.filter_oris, ori): ori["ori"] for ori in todo
+                }
+                errors = dict()
+                for n, future in enumerate(as_completed(futures)):
+                    try:
+                        cache[(futures[future], self.last)] = future.result()["pop"]
+                    except Exception as e:
+                        self.logger.warning(f"{futures[future]} failed: {e}")
+                        errors[futures[future]] = e
+                    if (n + 1) % 500 == 0:
+                        self.logger.info(f"[{n + 1}/{len(todo)}] populations retrieved")
+
+            # fail the run only once every lookup has finished (and is cached)
+            if errors:
+                raise RuntimeError(
+                    f"population lookups failed for {len(errors)} oris"
+                ) from next(iter(errors.values()))
+        finally:
+            # keep whatever was retrieved, even if the run fails part way
+            if not self.args.test and todo:
+                snapshot_df(
+                    logger=self.logger,
+                    df=pd.DataFrame(
+                        [
+                            {"ori": k[0], "month": k[1], "pop": v}
+                            for k, v in cache.items()
+                        ]
+                    ),
+                    path="fbi/",
+                    filename=f"cde_populations",
+                )
+
+        return [ori | {"pop": cache[(ori["ori"], self.last)]} for ori in oris]
+
+    def get_cache(self):
+        """
+        reads the (ORI, month) population cache from AWS
+        """
+        try:
+            cache = http_cache.read_csv(
+                "https://rtci.s3.us-east-1.amazonaws.com/fbi/cde_populations.csv",
+                dtype={"ori": str, "month": str, "pop": "Int64"},
+            )
+        except OSError:
+            self.logger.warning("no population cache found")
+            return dict()
+        cache = cache.astype(object).where(cache.notna(), None)
+        return {(d["ori"], d["month"]): d["pop"] for d in cache.to_dict("records")}
+
+    def filter_oris(self, query):
+        """
+        for a given ORI, retrieves most recently reported population,
+        retrying rate limited and upstream errors with jittered backoff
+        """
+        for attempt in range(self.max_retries):
+            self.bucket.acquire()
+            r = self.session.get(
+                f"https://api.usa.gov/crime/fbi/cde/nibrs/agency/{query['ori']}/all?type=counts"
+                f"&from={self.last}"
+                f"&to={self.last}"
+                f"&ori={query['ori']}"
+                f"&API_KEY={self.api_key}"
+            )
+            try:
+                j = json.loads(r.text)
+                pop = j["populations"]["population"][query["name"]][self.last]
+                return query | {"pop": pop}
+            except KeyError:
+                if j.get("error", dict()).get("code") != "OVER_RATE_LIMIT":
+                    raise ValueError(f"unexpected response for {query}: {r.text}")
+            except JSONDecodeError:
+                if "upstream connect error" not in r.text:
+                    raise ValueError(f"unexpected response for {query}: {r.text}")
+
+            wait = random.uniform(0, min(self.max_backoff, 2 ** (attempt + 1)))
+            self.logger.warning(f"retrying {query['ori']} in {wait:.1f}s...")
+            sleep(wait)
+
+        raise ValueError(f"retries exhausted for {query}")
 
 
 if __name__ == "__main__":
@@ -216,6 +288,20 @@ if __name__ == "__main__":
         action="store_true",
         help="""If specified, no interactions with AWS S3 or sheets will take place.""",
     )
+    parser.add_argument(
+        "-th",
+        "--threads",
+        type=int,
+        default=8,
+        help="""Number of concurrent population lookups (default: 8).""",
+    )
+    parser.add_argument(
+        "-r",
+        "--rate",
+        type=float,
+        default=5,
+        help="""Maximum requests per second against the CDE API across all threads (default: 5).""",
+    )
     args = parser.parse_args()
 
     CdeGetFilterOris().scrape()
@@ -1,18 +1,29 @@
 import json
+import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import requests
+import shutil
 import sys
 import urllib3
+import zlib
 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime as dt
 from datetime import timedelta as td
-from time import time
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from time import sleep, time
 from urllib3.exceptions import InsecureRequestWarning
 
 sys.path.append("../utils")
-from aws import snapshot_df
+import http_cache
+from aws import scan_df, snapshot_parts
 from logger import create_logger
+from parallelize import TokenBucket
 from requests_configs import mount_session
 
 
@@ -27,6 +38,21 @@ For each ORI-crime combination, it obtains monthly counts and clearances,
 and saves this dataset to AWS as `rtci/fbi/cde_data_since_1985.csv`,
 where `self.args.first` is specified as an arg (defaulting to "01-1985")
 and `self.last` is the previous month.
+
+ORIs are downloaded concurrently (`--threads`) under a shared request budget
+against the CDE API (`--rate`, requests per second). Each finished ORI is
+checkpointed to its own local parquet file, so an interrupted run picks up where
+it left off, and the final dataset is streamed from those checkpoints to AWS
+(as csv and as parquet partitioned by year) without holding it all in memory.
+
+With `--incremental`, each ORI already in the published dataset is only
+re-requested for a trailing revision window (`--window` months back from its
+latest reported month) and merged with its stored history, while a rotating
+1/`--rotation` share of ORIs is still fully re-downloaded on every run, so the
+whole history is revalidated once per rotation. The stored history is streamed
+once into a local parquet copy (next to the checkpoints of the incremental run,
+which are kept apart from those of full runs), from which each ORI reads only
+its own rows.
 """
 
 
@@ -50,63 +76,255 @@ class CdeGetData:
         }
         self.url = "https://cde.ucr.cjis.gov/LATEST/summarized/agency/{}/{}?from={}&to={}&type=counts"
         self.session = mount_session()
+        self.bucket = TokenBucket(self.args.rate)
+        self.max_retries = 5
+
+        # per-ori checkpoints for this date range (a new month starts a fresh directory,
+        # and test runs keep theirs apart so a later real run never reuses them)
+        # incremental runs also keep theirs apart from full runs, which would
+        # otherwise resume from each other's partial files
+        self.checkpoints = os.path.join(
+            self.args.checkpoints,
+            f"{self.args.first}_{self.last}"
+            + ("_incremental" if self.args.incremental else "")
+            + ("_test" if self.args.test else ""),
+        )
+
+        # local copy of the stored history and per-ori request start months,
+        # for incremental runs
+        self.history_path = os.path.join(self.checkpoints, "history")
+        self.history = None
+        self.starts = dict()
 
         # Suppress the specific InsecureRequestWarning
         urllib3.disable_warnings(InsecureRequestWarning)
 
     def scrape(self):
         """
-        primary method, gets list of ORIs, queries each ORI for all crimes,
-        processes results per-ORI to limit memory usage, and saves to AWS
+        primary method, gets list of ORIs, queries them concurrently for all crimes,
+        checkpoints each finished ORI to disk and streams the results to AWS
         """
         # get set of filtered ORIs from AWS
-        df = pd.read_csv(
+        df = http_cache.read_csv(
             "https://rtci.s3.us-east-1.amazonaws.com/fbi/cde_filtered_oris.csv"
         )
-        oris = df.to_dict("records")
-        ori_columns = list(df.columns)
+        oris = df.sort_values(by=["state", "ori"]).to_dict("records")
+        schema = self.get_schema(df)
         self.logger.info(f"filtered oris: {len(oris)}")
 
-        # process one ORI at a time to limit memory usage
-        all_dfs = []
-        for i, ori in enumerate(oris):
-            try:
-                ori_df = self.process_ori(ori, ori_columns)
-                if ori_df is not None:
-                    all_dfs.append(ori_df)
-            except Exception as e:
-                self.logger.warning(f"failed {ori['ori']}: {e}")
+        # if incremental flagged, find how far back each ORI needs to be re-requested
+        os.makedirs(self.checkpoints, exist_ok=True)
+        if self.args.incremental:
+            self.get_history(df, schema)
 
-            if (i + 1) % 100 == 0:
-                self.logger.info(f"processed {i + 1}/{len(oris)} oris")
+        # skip ORIs already checkpointed by an earlier (interrupted) run
+        todo = [
+            ori for ori in oris if not os.path.exists(self.checkpoint_path(ori["ori"]))
+        ]
+        self.logger.info(f"resuming with {len(oris) - len(todo)} checkpointed oris")
 
-        self.logger.info(f"processed {len(oris)}/{len(oris)} oris")
+        failed = 0
+        with ThreadPoolExecutor(max_workers=self.args.threads) as executor:
+            futures = {
+                executor.submit(self.process_ori, ori, schema): ori for ori in todo
+            }
+            for i, future in enumerate(as_completed(futures)):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    self.logger.warning(f"failed {futures[future]['ori']}: {e}")
 
-        # concatenate all ORI dataframes
-        df = pd.concat(all_dfs, ignore_index=True)
-        df = df.sort_values(by=["state", "ori", "year", "month"])
-        df["last_updated"] = int(time())
+                if (i + 1) % 100 == 0:
+                    self.logger.info(f"processed {i + 1}/{len(todo)} oris")
 
-        # save results to AWS
-        self.logger.info(f"sample record: {df.to_dict('records')[0]}")
+        self.logger.info(f"processed {len(todo)}/{len(todo)} oris ({failed} failed)")
+
+        # stream checkpoints (sorted by state, ori) to AWS
+        parts = [
+            self.checkpoint_path(ori["ori"])
+            for ori in oris
+            if os.path.exists(self.checkpoint_path(ori["ori"]))
+        ]
+        if not parts:
+            raise RuntimeError(f"no oris retrieved ({failed} failed)")
+        sample = pq.read_table(parts[0]).slice(0, 1).to_pylist()
+        self.logger.info(f"sample record: {sample[0] if sample else None}")
         if not self.args.test:
-            snapshot_df(
+            snapshot_parts(
                 logger=self.logger,
-                df=df,
+                parts=parts,
+                schema=schema,
                 path="fbi/",
                 filename=f"cde_data_since_{dt.strptime(self.args.first,'%m-%Y').year}",
+                partition_cols=["year"],
+                constants={"last_updated": int(time())},
             )
 
-    def process_ori(self, ori, ori_columns):
+            # a complete run no longer needs its checkpoints, failed oris are retried next run
+            if not failed:
+                shutil.rmtree(self.checkpoints)
+
+    def get_schema(self, df):
+        """
+        returns the fixed output schema, so every ORI's checkpoint has the same column
+        types (crime counts and clearances as floats, since either may be missing)
+        """
+        fields = [pa.field("year", pa.int64()), pa.field("month", pa.int64())]
+        for crime in self.crimes.values():
+            fields.append(pa.field(crime, pa.float64()))
+            fields.append(pa.field(f"{crime}_clearance", pa.float64()))
+        fields.extend(pa.Schema.from_pandas(df, preserve_index=False))
+        fields.append(pa.field("last_updated", pa.int64()))
+        return pa.schema(fields)
+
+    def get_history(self, df, schema):
+        """
+        streams the published dataset for the filtered ORIs into a local parquet
+        copy and sets each ORI's request start month to `--window` months before
+        its latest reported month, except for this run's share of the
+        deep-revalidation rotation (and ORIs with no history), which are fully
+        re-requested from `--first`
+        """
+        first = dt.strptime(self.args.first, "%m-%Y")
+        starts = os.path.join(self.checkpoints, "starts.json")
+
+        # a resumed run reuses the copy made before it was interrupted
+        # (`starts.json` is only written once the copy is complete)
+        if not os.path.exists(starts):
+            latest = self.copy_history(df, schema, first)
+            if latest is None:
+                return
+
+            # the rotation share is fixed per ori (by hash) and advances monthly
+            last = dt.strptime(self.last, "%m-%Y")
+            turn = (last.year * 12 + last.month) % self.args.rotation
+            for ori, month in latest.items():
+                if zlib.crc32(ori.encode("utf-8")) % self.args.rotation == turn:
+                    continue
+                self.starts[ori] = int(
+                    max(month - self.args.window + 1, first.year * 12 + first.month - 1)
+                )
+            with open(starts, "w") as f:
+                json.dump(self.starts, f)
+        else:
+            with open(starts) as f:
+                self.starts = json.load(f)
+
+        self.history = ds.dataset(
+            self.history_path,
+            format="parquet",
+            partitioning=ds.partitioning(
+                pa.schema([("year", pa.int64())]), flavor="hive"
+            ),
+        )
+        self.logger.info(
+            f"incremental: {len(self.starts)} oris from a {self.args.window}-month "
+            f"window, {df['ori'].nunique() - len(self.starts)} fully requested"
+        )
+
+    def copy_history(self, df, schema, first):
+        """
+        copies the stored history of the filtered ORIs to local parquet (by year,
+        in small row groups so each ORI's rows are read without the rest) one
+        batch at a time, and returns the latest month with any reported count
+        per ORI (or None if there is no stored history)
+        """
+        columns = ["ori"] + [
+            f.name
+            for f in schema
+            if f.name not in df.columns and f.name != "last_updated"
+        ]
+        try:
+            scanner = scan_df(
+                f"fbi/cde_data_since_{first.year}",
+                columns=columns,
+                filters=[("ori", "in", list(df["ori"]))],
+                partition_cols=["year"],
+            )
+        except OSError as e:
+            self.logger.warning(f"no stored history, fully requesting all oris: {e}")
+            return None
+
+        latest = dict()
+
+        def batches():
+            for batch in scanner.to_batches():
+                history = batch.to_pandas()
+                reported = history[list(self.crimes.values())].notna().any(axis=1)
+                months = history["year"] * 12 + history["month"] - 1
+                for ori, month in (
+                    months[reported].groupby(history.loc[reported, "ori"]).max().items()
+                ):
+                    latest[ori] = max(latest.get(ori, month), month)
+                yield batch
+
+        shutil.rmtree(self.history_path, ignore_errors=True)
+        ds.write_dataset(
+            batches(),
+            self.history_path,
+            schema=scanner.projected_schema,
+            format="parquet",
+            partitioning=["year"],
+            partitioning_flavor="hive",
+            max_rows_per_group=10_000,
+        )
+        return latest
+
+    def checkpoint_path(self, ori):
+        return os.path.join(self.checkpoints, f"{ori}.parquet")
+
+    def get_json(self, url):
+        """
+        requests a CDE API url within the shared request budget, backing off
+        and retrying on rate limit (429) and server errors
+        """
+        for attempt in range(self.max_retries):
+            self.bucket.acquire()
+            response = self.session.get(url, verify=False)
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt < self.max_retries - 1:
+                    sleep(self.retry_after(response, attempt))
+                    continue
+            response.raise_for_status()
+            return json.loads(response.text)
+
+    @staticmethod
+    def retry_after(response, attempt):
+        """
+        returns the seconds to wait before retrying, from the Retry-After header
+        (in seconds or as an http date) or otherwise by exponential backoff
+        """
+        header = response.headers.get("Retry-After")
+        if header:
+            try:
+                return max(float(header), 0)
+            except ValueError:
+                pass
+            try:
+                date = parsedate_to_datetime(header)
+            except (TypeError, ValueError):
+                date = None
+            if date is not None:
+                if date.tzinfo is None:
+                    date = date.replace(tzinfo=timezone.utc)
+                return max((date - dt.now(timezone.utc)).total_seconds(), 0)
+        return 2 ** (attempt + 1)
+
+    def process_ori(self, ori, schema):
         """
-        queries all crimes for a single ORI and returns a merged dataframe
+        queries all crimes for a single ORI and checkpoints the merged results
         """
+        # incremental runs only request the revision window of ORIs with history
+        start = self.starts.get(ori["ori"])
+        first = (
+            self.args.first if start is None else f"{start % 12 + 1:02d}-{start // 12}"
+        )
+
         results = []
         for crime in self.crimes:
-            url = self.url.format(ori["ori"], crime, self.args.first, self.last)
-            data = json.loads(self.session.get(url, verify=False).text)["offenses"][
-                "actuals"
-            ]
+            url = self.url.format(ori["ori"], crime, first, self.last)
+            data = self.get_json(url)["offenses"]["actuals"]
             assert len(data.keys()) == 2
 
             # retrieve and format crime counts and clearances
@@ -128,13 +346,35 @@ class CdeGetData:
 
         # merge all crime results for this ORI
         merged = self.merge_dicts(results, ["year", "month"])
-        df = pd.DataFrame(merged)
+        df = pd.DataFrame(merged).reindex(
+            columns=[
+                f.name for f in schema if f.name not in ori and f.name != "last_updated"
+            ]
+        )
+
+        # prepend stored history from before the revision window
+        if start is not None:
+            history = self.history.to_table(
+                columns=list(df.columns),
+                filter=(ds.field("ori") == ori["ori"])
+                & (ds.field("year") * 12 + ds.field("month") - 1 < start),
+            ).to_pandas()
+            df = pd.concat([history, df], ignore_index=True)
 
         # add ORI metadata columns
-        for col in ori_columns:
+        for col in ori:
             df[col] = ori[col]
+        df = df.sort_values(by=["year", "month"])
 
-        return df
+        # write the checkpoint atomically so an interrupted run never leaves a partial file
+        table = pa.Table.from_pandas(
+            df,
+            schema=pa.schema([f for f in schema if f.name != "last_updated"]),
+            preserve_index=False,
+        )
+        tmp = self.checkpoint_path(ori["ori"]) + ".tmp"
+        pq.write_table(table, tmp)
+        os.replace(tmp, self.checkpoint_path(ori["ori"]))
 
     @staticmethod
     def merge_dicts(results, keys):
@@ -174,6 +414,47 @@ if __name__ == "__main__":
         default="01-1985",
         help="""Specify a start month/year in the format MM-YYYY (e.g., default "01-1985")""",
     )
+    parser.add_argument(
+        "-th",
+        "--threads",
+        type=int,
+        default=8,
+        help="""Number of ORIs to download concurrently (default: 8).""",
+    )
+    parser.add_argument(
+        "-r",
+        "--rate",
+        type=float,
+        default=10,
+        help="""Maximum requests per second against the CDE API across all threads (default: 10).""",
+    )
+    parser.add_argument(
+        "-c",
+        "--checkpoints",
+        type=str,
+        default="/tmp/rtci_cde_checkpoints",
+        help="""Directory for per-ORI checkpoints, used to resume interrupted runs.""",
+    )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        help="""If specified, only re-request a trailing window of months for ORIs already in the stored dataset.""",
+    )
+    parser.add_argument(
+        "-w",
+        "--window",
+        type=int,
+        default=12,
+        help="""Number of trailing months re-requested per ORI in incremental runs (default: 12).""",
+    )
+    parser.add_argument(
+        "-ro",
+        "--rotation",
+        type=int,
+        default=12,
+        help="""Number of runs over which all ORIs are fully revalidated in incremental runs (default: 12).""",
+    )
     args = parser.parse_args()
 
     CdeGetData().scrape()
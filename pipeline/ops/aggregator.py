@@ -1,16 +1,24 @@
-import numpy as np
 import pandas as pd
 import sys
 
 from datetime import datetime as dt
 from datetime import timedelta as td
-from time import sleep
+from requests.exceptions import HTTPError
 
 sys.path.append("../utils")
-from aws import list_directories, list_files, snapshot_df
+from aws import (
+    fetch_json_frames,
+    list_directories,
+    list_objects,
+    read_df,
+    snapshot_df,
+    snapshot_parquet,
+)
 from crimes import rtci_to_nibrs
+import http_cache
 from google_configs import gc_files, pull_sheet
 from logger import create_logger
+from parallelize import thread
 
 
 # TODO: fill in FBI CDE clearance data (in `agencies/cde_get_data.py`)
@@ -50,95 +58,96 @@ class Aggregator:
         self.agg = self.get_agg_data()
         self.fbi = self.get_fbi_data()
 
-    def run(self):
-        dfs = list()
+        # manifest of the snapshot each ori was last aggregated from
+        # (stored next to `data/aggregated.csv`, used for incremental runs)
+        self.manifest_cols = ["ori", "key", "etag", "last_modified"]
 
-        fns = self.get_files()
+        # concurrency and request rate (per second) for reading snapshots from s3
+        self.fetch_threads = 16
+        self.fetch_rate = 25
 
-        for fn in fns:
-            sleep(1.1)
-            self.logger.info(f"reading {fn}...")
-            df = pd.read_json(self.bucket_url + fn)
-            assert df["year"].dtype == "int"
-            assert df["month"].dtype == "int"
-            df = df.sort_values(by=["year", "month"])
-            ori = list(df["ori"].unique())
-            assert len(ori) == 1
-            ori = ori[0]
+    def run(self):
+        dfs = list()
 
-            # add in state, agency name, type (city/county)
+        files = self.get_files()
+
+        # if incremental flagged, only re-read snapshots that changed since the last aggregate
+        if getattr(self.args, "incremental", False):
+            changed = self.get_changed(files)
+        else:
+            changed = files
+        fns = [f["key"] for f in changed]
+        self.logger.info(f"reading {len(fns)} of {len(files)} latest snapshots")
+
+        # snapshots are downloaded concurrently and collected as they arrive
+        for fn, df in fetch_json_frames(
+            fns, threads=self.fetch_threads, rate=self.fetch_rate
+        ):
+            self.logger.info(f"read {fn}")
+            assert df["ori"].nunique() == 1
+            assert df["ori"].iloc[0] == fn.split("/")[2]
             df["state"] = fn.split("/")[-3]
-            agency = self.sheet[self.sheet["ori"] == fn.split("/")[2]]
-            assert len(agency) <= 1
-            name = agency.iloc[0]["name"]
-            df["name"] = name
-            city_county = agency.iloc[0]["type"]
-            df["type"] = city_county
-
-            # subset agg and fbi to the appropriate ori
-            agg = self.agg[self.agg["ori"] == ori]
-            fbi = self.fbi[self.fbi["ori"] == ori]
-            assert len(fbi) > 0
-
-            # if this is a new agency (not yet in the aggregated csv),
-            # insert into aggregated csv, otherwise upsert
-            if len(agg) == 0:
-                out = df
-            else:
-                out = self.incorporate_new(agg, df)
-
-            # logger checks to see if latest month incremented
-            self.logger.info(
-                f"previous range: "
-                f"{str(agg[agg['year'] == agg['year'].min()]['month'].min()).zfill(2)}/{agg['year'].min()} "
-                f"to {str(agg[agg['year'] == agg['year'].max()]['month'].max()).zfill(2)}/{agg['year'].max()}"
-            )
-            self.logger.info(
-                f"update range: "
-                f"{str(out[out['year'] == out['year'].min()]['month'].min()).zfill(2)}/{out['year'].min()} "
-                f"to {str(out[out['year'] == out['year'].max()]['month'].max()).zfill(2)}/{out['year'].max()} "
-            )
-
-            # merge in fbi data
-            out = pd.merge(
-                out,
-                fbi,
-                how="outer",
-                on=["ori", "year", "month"],
-            ).sort_values(by=["ori", "year", "month"])
-
-            # adjust data for crimes, clearances, and last updated date
-            for crime in self.crimes:
-                out[crime] = np.where(
-                    out[crime].isna(),
-                    out[f"fbi_{crime}"],
-                    out[crime],
-                )
-                out[f"{crime}_cleared"] = np.where(
-                    out[f"{crime}_cleared"].isna(),
-                    out[f"fbi_{crime}_clearance"],
-                    out[f"{crime}_cleared"],
-                )
+            dfs.append(df)
+
+        if not dfs:
+            self.logger.info("no changed snapshots since last aggregate")
+            return
+
+        # stack all new snapshots into one panel and validate dtypes once
+        new = pd.concat(dfs, ignore_index=True)
+        assert new["year"].dtype == "int"
+        assert new["month"].dtype == "int"
+        oris = new["ori"].unique()
+
+        # upsert the panel into the existing aggregated rows for the same oris
+        agg = self.agg[self.agg["ori"].isin(oris)]
+        out = self.upsert(agg, new)
+        self.log_ranges(agg, out)
+
+        # merge in fbi data for all oris at once
+        fbi = self.fbi[self.fbi["ori"].isin(oris)]
+        assert set(oris) <= set(fbi["ori"].unique())
+        out = pd.merge(
+            out,
+            fbi,
+            how="outer",
+            on=["ori", "year", "month"],
+        )
 
-            out["last_updated"] = np.where(
-                out["last_updated"].isna(),
-                out["fbi_last_updated"],
-                out["last_updated"],
+        # adjust data for crimes, clearances, and last updated date
+        for crime in self.crimes:
+            out[crime] = out[crime].fillna(out[f"fbi_{crime}"])
+            out[f"{crime}_cleared"] = out[f"{crime}_cleared"].fillna(
+                out[f"fbi_{crime}_clearance"]
             )
+        out["last_updated"] = out["last_updated"].fillna(out["fbi_last_updated"])
+
+        # remove fbi cols and clean up
+        out = out.loc[:, ~out.columns.str.startswith("fbi_")]
+
+        # add in state, agency name, type (city/county) (including fbi-only rows)
+        agencies = self.sheet[self.sheet["ori"].isin(oris)]
+        assert not agencies["ori"].duplicated().any()
+        assert set(oris) <= set(agencies["ori"].unique())
+        agencies = agencies.set_index("ori")
+        out["state"] = out["ori"].map(
+            new.drop_duplicates("ori").set_index("ori")["state"]
+        )
+        out["name"] = out["ori"].map(agencies["name"])
+        out["type"] = out["ori"].map(agencies["type"])
+        out["last_updated"] = out["last_updated"].astype(int)
 
-            # remove fbi cols and clean up
-            out = out.loc[:, ~out.columns.str.startswith("fbi_")]
-
-            # add in state, agency name, type (city/county), again...
-            out["state"] = fn.split("/")[-3]
-            out["name"] = name
-            out["type"] = city_county
-            out["last_updated"] = out["last_updated"].astype(int)
+        for col in ["year", "month", "last_updated"]:
+            assert out[col].dtype == "int"
 
-            for col in ["year", "month", "last_updated"]:
-                assert out[col].dtype == "int"
+        dfs = [out]
 
-            dfs.append(out)
+        # for incremental runs, carry over existing rows for oris whose snapshot is unchanged
+        if len(changed) < len(files):
+            unchanged = {f["key"].split("/")[2] for f in files} - {
+                f["key"].split("/")[2] for f in changed
+            }
+            dfs.append(self.agg[self.agg["ori"].isin(unchanged)])
 
         # stitch back together all dfs into one for export
         df = pd.concat(dfs)
@@ -165,37 +174,88 @@ class Aggregator:
                 path="data/",
                 filename=f"aggregated",
             )
+            snapshot_parquet(
+                logger=self.logger,
+                df=df,
+                path="data/",
+                filename=f"aggregated",
+            )
+            snapshot_df(
+                logger=self.logger,
+                df=self.to_manifest(files),
+                path="data/",
+                filename=f"aggregated_manifest",
+            )
 
     @staticmethod
     def get_files():
         """
-        returns a list of aws s3 filepaths
+        returns a list of aws s3 objects (key, etag, last modified)
         for each ori's latest scraped json data file
         """
-        fns = list()
-
         # get list of state directories from s3
         states = list_directories(prefix=f"scrapes/")
         assert len(states) > 0
 
-        # get list of ori directories for a given state
-        for state in states:
-            dirs = list_directories(prefix=f"{state}")
-            assert len(dirs) > 0
+        # list all snapshot files per state concurrently
+        # (one paginated listing per state rather than one per ori directory)
+        objects = thread(list_objects, states, threads=10)
+        assert objects
 
-            # get latest json file for each ori
-            for d in dirs:
-                files = list_files(prefix=f"{d}")
-                assert len(files) > 0
-                fns.append(files[-1])
+        # get latest json file for each ori
+        latest = dict()
+        for obj in objects:
+            if not obj["key"].endswith(".json"):
+                continue
+            d = obj["key"].rsplit("/", 1)[0]
+            if d not in latest or obj["key"] > latest[d]["key"]:
+                latest[d] = obj
 
-        return fns
+        return list(latest.values())
+
+    def get_manifest(self):
+        """
+        reads in the manifest of snapshots used for the existing `aggregated.csv` file
+        """
+        try:
+            manifest = http_cache.read_csv(
+                self.bucket_url + "data/aggregated_manifest.csv", dtype=str
+            )
+        except HTTPError:
+            self.logger.warning("no aggregate manifest found, reading all snapshots")
+            return pd.DataFrame(columns=self.manifest_cols)
+        return manifest
+
+    def get_changed(self, files):
+        """
+        returns the subset of latest snapshot files whose key or etag differs
+        from the manifest, or whose ori is missing from the existing aggregate
+        """
+        manifest = self.get_manifest()
+        manifest = {
+            d["ori"]: (d["key"], d["etag"]) for d in manifest.to_dict("records")
+        }
+        aggregated = set(self.agg["ori"].unique())
+        return [
+            f
+            for f in files
+            if manifest.get(f["key"].split("/")[2]) != (f["key"], f["etag"])
+            or f["key"].split("/")[2] not in aggregated
+        ]
+
+    def to_manifest(self, files):
+        """
+        converts the list of latest snapshot files into a manifest table
+        """
+        manifest = pd.DataFrame(files)
+        manifest["ori"] = manifest["key"].str.split("/").str[2]
+        return manifest[self.manifest_cols].sort_values(by="ori")
 
     def get_agg_data(self):
         """
         reads in existing `aggregated.csv` file
         """
-        agg = pd.read_csv(self.bucket_url + "data/aggregated.csv")
+        agg = read_df("data/aggregated")
         assert agg["year"].dtype == "int"
         assert agg["month"].dtype == "int"
         agg[["year", "month"]] = agg[["year", "month"]].astype(int)
@@ -210,7 +270,15 @@ class Aggregator:
         reads in fbi cde api data from 1985 on and subsets
         from first year (2017) to last month with non-missing data
         """
-        fbi = pd.read_csv(self.bucket_url + "fbi/cde_data_since_1985.csv")
+        fbi = read_df(
+            "fbi/cde_data_since_1985",
+            columns=["ori", "year", "month"]
+            + list(self.crimes.keys())
+            + [f"{crime}_clearance" for crime in self.crimes.keys()]
+            + ["last_updated"],
+            filters=[("year", ">=", self.first.year)],
+            partition_cols=["year"],
+        )
         fbi = fbi[
             fbi[
                 list(self.crimes.keys())
@@ -241,20 +309,48 @@ class Aggregator:
         return fbi
 
     @staticmethod
-    def incorporate_new(agg, df):
+    def upsert(agg, new):
         """
-        takes new data for a given ori and merges it into the existing aggregated data
+        takes a panel of new data for any number of oris and merges it into the
+        existing aggregated data in one indexed pass: existing ori-months are
+        updated with non-missing new values, and months later than an ori's
+        latest aggregated month are appended (all months, for new agencies)
         """
-        new = df[
-            (df["year"] == agg["year"].max())
-            & (df["month"] > agg[agg["year"] == agg["year"].max()]["month"].max())
+        keys = ["ori", "year", "month"]
+
+        # latest aggregated (year, month) per ori, as a comparable month count
+        latest = (agg["year"] * 12 + agg["month"]).groupby(agg["ori"]).max()
+        appended = new[
+            new["year"] * 12 + new["month"] > new["ori"].map(latest).fillna(-1)
         ]
-        agg = agg.set_index(["ori", "year", "month"])
-        df = df.set_index(["ori", "year", "month"])
-        agg.update(df)
-        agg = agg.reset_index()
-        agg = pd.concat([agg, new])
-        return agg
+
+        existing = agg.set_index(keys)
+        existing.update(new.set_index(keys))
+        return pd.concat([existing.reset_index(), appended], ignore_index=True)
+
+    def log_ranges(self, agg, out):
+        """
+        logs previous vs. updated data ranges per ori to check that latest months incremented
+        """
+        previous = (
+            (agg["year"] * 100 + agg["month"]).groupby(agg["ori"]).agg(["min", "max"])
+        )
+        update = (
+            (out["year"] * 100 + out["month"]).groupby(out["ori"]).agg(["min", "max"])
+        )
+
+        def fmt(i):
+            return f"{str(int(i) % 100).zfill(2)}/{int(i) // 100}"
+
+        for ori, row in update.iterrows():
+            if ori in previous.index:
+                self.logger.info(
+                    f"{ori} previous range: {fmt(previous.loc[ori, 'min'])} "
+                    f"to {fmt(previous.loc[ori, 'max'])}"
+                )
+            self.logger.info(
+                f"{ori} update range: {fmt(row['min'])} to {fmt(row['max'])}"
+            )
 
 
 if __name__ == "__main__":
@@ -267,6 +363,12 @@ if __name__ == "__main__":
         action="store_true",
         help="""If flagged, do not interact with sheet.""",
     )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        help="""If flagged, only re-read ori snapshots that changed since the last aggregate.""",
+    )
     args = parser.parse_args()
 
     Aggregator(args).run()
@@ -1,16 +1,22 @@
-import json
 import numpy as np
 import pandas as pd
-import requests
 import sys
 
 from datetime import datetime as dt
 from datetime import timedelta as td
 
 sys.path.append("../utils")
-from aws import list_directories, list_files, snapshot_df, snapshot_json
+from aws import (
+    list_directories,
+    list_files,
+    read_df,
+    snapshot_df,
+    snapshot_json,
+    snapshot_parquet,
+)
+import http_cache
 from logger import create_logger
-from parallelize import thread
+from rollups import membership_matrix, rollup
 
 
 class SiteCrimes:
@@ -48,9 +54,7 @@ class SiteCrimes:
         self.logger.info(f"date range: {self.start} to {self.end}")
 
         # read in `data/aggregated.csv`
-        self.agg = pd.read_csv(
-            "https://rtci.s3.us-east-1.amazonaws.com/data/aggregated.csv"
-        )
+        self.agg = read_df("data/aggregated")
 
         # add in total violent and property columns
         for k, v in self.crimes.items():
@@ -68,55 +72,18 @@ class SiteCrimes:
                 }
             )
 
-        # read in geographies table data produced by `db_geographies.py`
-        self.geographies = pd.read_csv(
-            "https://rtci.s3.us-east-1.amazonaws.com/data/site/geographies.csv"
-        )
-
         # read in the mapping of included oris to geographies in `data/site/geographies_included.json`
-        self.geographies_included = json.loads(
-            requests.get(
-                "https://rtci.s3.us-east-1.amazonaws.com/data/site/geographies_included.json"
-            ).text
+        self.geographies_included = http_cache.read_json(
+            "https://rtci.s3.us-east-1.amazonaws.com/data/site/geographies_included.json"
         )
 
-        self.df = None
-
     def run(self):
-        # merge geographic entity metadata into per-agency aggregated crime counts data
-        self.df = pd.merge(
-            self.agg,
-            self.geographies.drop(
-                columns=[
-                    "name",
-                    "state",
-                ]
-            ).rename(columns={"type": "geography_type"}),
-            how="left",
-            left_on="ori",
-            right_on="id",
-        )
-
-        # run through geographic entities and aggregate data
-        results = thread(
-            self.prepare_one_geography, self.geographies_included, threads=10
-        )
-        results = pd.DataFrame(results)
-
-        # reorder columns per specification
-        results = results[
-            [
-                "id",
-                "size",
-                "year",
-                "month",
-            ]
-            + [
-                col
-                for col in results.columns
-                if col not in ["id", "size", "year", "month"]
-            ]
-        ]
+        # sum crime counts per geographic entity and year-month, then derive ytd sums,
+        # rolling 12-month sums and ytd percent changes for all geographies at once
+        totals = self.get_totals()
+        totals = self.get_ytds(totals)
+        totals = self.get_rolls(totals)
+        results = self.get_deltas(totals).drop(columns=["geography"])
 
         # only include data from 1 year post-start (2017 + 1)
         results = results[results["year"] > self.start.year]
@@ -129,91 +96,102 @@ class SiteCrimes:
             snapshot_df(
                 self.logger, results, "data/site/", filename="current_crime_reported"
             )
+            snapshot_parquet(
+                self.logger, results, "data/site/", filename="current_crime_reported"
+            )
 
-    def prepare_one_geography(self, d):
-        # in the ytd percent changes there may be infinite values from division by zero
-        np.seterr(divide="ignore", invalid="ignore")
-
-        # only keep agencies that are in geographic entity and trim to specified date ranges
-        tmp = self.df[self.df["ori"].isin(d["agency_list"])].copy()
-        tmp.loc[:, "date"] = pd.to_datetime(tmp[["year", "month"]].assign(day=1))
-        tmp = tmp[(tmp["date"] >= self.start) & (tmp["date"] <= self.end)]
-
-        # sum crime counts across geographic entities and year-months
-        tmp = (
-            tmp.groupby(["year", "month"])[list(self.map.values())].sum().reset_index()
+    def get_totals(self):
+        """
+        sums crime counts across each geographic entity's agencies per year-month
+        as one sparse (geography x ori) by dense (ori x year-month x crime) product,
+        returned as a long (geography, year, month) table sorted in that order
+        """
+        crimes = list(self.map.values())
+
+        # trim to specified date range
+        months = self.agg["year"] * 12 + self.agg["month"] - 1
+        agg = self.agg[
+            (months >= self.start.year * 12 + self.start.month - 1)
+            & (months <= self.end.year * 12 + self.end.month - 1)
+        ]
+        months = months[agg.index]
+
+        # (ori x year-month x crime) counts, and whether an ori reported a year-month
+        oris = pd.Index(agg["ori"].unique())
+        periods = np.sort(months.unique())
+        rows = oris.get_indexer(agg["ori"])
+        cols = np.searchsorted(periods, months)
+        counts = np.zeros((len(oris), len(periods), len(crimes)))
+        np.add.at(counts, (rows, cols), agg[crimes].fillna(0).to_numpy(dtype=float))
+        reported = np.zeros((len(oris), len(periods)))
+        reported[rows, cols] = 1
+
+        # roll up to geographic entities, keeping year-months any member agency reported
+        matrix = membership_matrix(
+            [d["agency_list"] for d in self.geographies_included], oris
         )
-        tmp["id"] = d["id"]
-        tmp["size"] = d["size"]
-
-        # get total crime counts per geography-month
-        totals = self.get_totals(tmp)
-
-        # get ytd crime count sums per geography-month and merge into totals
-        ytds = self.get_ytds(tmp)
-        totals = pd.merge(
-            totals,
-            ytds,
-            how="left",
-            left_on=["id", "size", "year", "month"],
-            right_on=["id_ytd", "size_ytd", "year_ytd", "month_ytd"],
-        ).drop(columns=["id_ytd", "size_ytd", "year_ytd", "month_ytd"])
-
-        # get rollings 12-month crime count sums per geography-month and merge into totals
-        rolls = self.get_rolls(tmp)
-        totals = pd.merge(totals, rolls, how="left", on=["id", "size", "year", "month"])
-
-        # get percent changes in crime count sums for ytd vs. lytd per geography-month and merge into totals
-        totals = self.get_deltas(totals)
-
-        return totals.to_dict("records")
-
-    def get_totals(self, tmp):
-        return tmp.rename(
-            columns=lambda c: c + "_total" if c in list(self.map.values()) else c
+        sums = rollup(matrix, counts.reshape(len(oris), -1)).reshape(
+            -1, len(periods), len(crimes)
         )
+        geography, period = np.nonzero(rollup(matrix, reported))
+
+        included = pd.DataFrame(self.geographies_included)
+        totals = pd.DataFrame(
+            {
+                "geography": geography,
+                "id": included["id"].to_numpy()[geography],
+                "size": included["size"].to_numpy()[geography],
+                "year": periods[period] // 12,
+                "month": periods[period] % 12 + 1,
+            }
+        )
+        for k, crime in enumerate(crimes):
+            totals[f"{crime}_total"] = sums[geography, period, k]
+            if pd.api.types.is_integer_dtype(agg[crime]):
+                totals[f"{crime}_total"] = totals[f"{crime}_total"].astype(
+                    agg[crime].dtype
+                )
+        return totals
 
-    @staticmethod
-    def get_ytds(tmp):
-        ytds = list()
-        for year in tmp["year"].unique():
-            for month in tmp[tmp["year"] == year]["month"].unique():
-                ytd = tmp[(tmp["year"] == year) & (tmp["month"] <= month)]
-                ytd = ytd.groupby(["id", "size"]).sum().reset_index()
-                ytd["year"] = year
-                ytd["month"] = month
-                ytds.append(ytd)
-        ytd = pd.concat(ytds)
-        return ytd.add_suffix("_ytd")
-
-    def get_rolls(self, tmp):
-        roll = tmp.copy()
-        roll.loc[:, "date"] = pd.to_datetime(roll[["year", "month"]].assign(day=1))
-        roll = roll.set_index("date")
-        for col in list(self.map.values()):
-            roll[f"{col}_roll"] = roll[col].rolling(window="365D", min_periods=12).sum()
-            roll = roll.drop(columns=[col])
-        return roll.reset_index().drop(columns=["date"])
+    def get_ytds(self, totals):
+        """
+        adds year-to-date crime count sums (cumulative within geography and year)
+        """
+        for col in self.map.values():
+            totals[f"{col}_ytd"] = totals.groupby(["geography", "year"])[
+                f"{col}_total"
+            ].cumsum()
+        return totals
+
+    def get_rolls(self, totals):
+        """
+        adds rolling 12-month crime count sums, only where all 12 months are present
+        """
+        months = totals["year"] * 12 + totals["month"]
+        by = totals["geography"]
+
+        # the 12th row back is exactly 11 months earlier only if no month is missing
+        complete = months - months.groupby(by).shift(11) == 11
+        for col in self.map.values():
+            cumsum = totals.groupby(by)[f"{col}_total"].cumsum()
+            roll = cumsum - cumsum.groupby(by).shift(12).fillna(0)
+            totals[f"{col}_roll"] = roll.where(complete).astype(float)
+        return totals
 
     def get_deltas(self, totals):
-        for year in totals["year"].unique():
-            for month in totals[totals["year"] == year]["month"].unique():
-                cy = totals[(totals["year"] == year) & (totals["month"] == month)].iloc[
-                    0
-                ]
-                py = totals[(totals["year"] == year - 1) & (totals["month"] == month)]
-                assert len(py) <= 1
-
-                if len(py) == 1:
-                    py = py.iloc[0]
-                    for v in list(self.map.values()):
-                        totals.loc[
-                            (totals["year"] == year) & (totals["month"] == month),
-                            f"{v}_change",
-                        ] = round(
-                            ((cy[f"{v}_ytd"] - py[f"{v}_ytd"]) / py[f"{v}_ytd"] * 100),
-                            1,
-                        )
+        """
+        adds percent changes in ytd crime count sums vs. the same month of the prior year
+        """
+        keys = ["geography", "year", "month"]
+        ytds = [f"{col}_ytd" for col in self.map.values()]
+        prior = totals[keys + ytds].assign(year=totals["year"] + 1)
+        prior = pd.merge(totals[keys], prior, how="left", on=keys)
+
+        # in the ytd percent changes there may be infinite values from division by zero
+        for col in self.map.values():
+            totals[f"{col}_change"] = (
+                (totals[f"{col}_ytd"] - prior[f"{col}_ytd"]) / prior[f"{col}_ytd"] * 100
+            ).round(1)
         return totals
 
 
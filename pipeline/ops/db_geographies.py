@@ -7,8 +7,17 @@ from datetime import datetime as dt
 from datetime import timedelta as td
 
 sys.path.append("../utils")
-from aws import list_directories, list_files, snapshot_df, snapshot_json
+from aws import (
+    list_directories,
+    list_files,
+    read_df,
+    snapshot_df,
+    snapshot_json,
+    snapshot_parquet,
+)
+import http_cache
 from logger import create_logger
+from rollups import membership_matrix, rollup
 
 
 # TODO: accidentally forcing data to span most recent month instead of second-to-most-recent?
@@ -21,12 +30,10 @@ class SiteGeographies:
         self.args = arguments
 
         # read in `data/aggregated.csv` and `fbi/cde_oris.csv`
-        self.oris = pd.read_csv(
+        self.oris = http_cache.read_csv(
             "https://rtci.s3.us-east-1.amazonaws.com/fbi/cde_oris.csv"
         )
-        self.agg = pd.read_csv(
-            "https://rtci.s3.us-east-1.amazonaws.com/data/aggregated.csv"
-        )
+        self.agg = read_df("data/aggregated", columns=["ori", "year", "month"])
 
         # stash a mapping of all agencies included for a given geographic entity
         self.included = {
@@ -104,6 +111,7 @@ class SiteGeographies:
         )
         if not self.args.test:
             snapshot_df(self.logger, records, "data/site/", filename="geographies")
+            snapshot_parquet(self.logger, records, "data/site/", filename="geographies")
             snapshot_json(
                 self.logger,
                 included_agencies,
@@ -124,58 +132,75 @@ class SiteGeographies:
         return df
 
     def aggregate_geographies(self):
-        aggregates = list()
-
-        # iterate through geographic entities (other than city/county agency)
-        for field in self.order:
-            df = self.oris.copy()
-
-            # only keep agencies that span default date range (2017-01 to second-to-most-recent month)
-            df = df[(df["start"] <= self.start) & (df["end"] >= self.end)]
-            df["start"] = dt.strftime(self.start, "%Y-%m")
-            df["end"] = dt.strftime(self.end, "%Y-%m")
-
-            # run through unique values of geography
-            for f in df[field].unique():
-                g = df.copy()
-                g = g[g[field] == f]
-                g["name"] = f
-                g["type"] = field
-                g[["latitude", "longitude"]] = None, None
-
-                # run through all population size bins
-                for p in self.pop_bins:
-                    s = g[
-                        (self.pop_bins[p][0] <= g["population"])
-                        & (g["population"] <= self.pop_bins[p][1])
-                    ]
-                    s.loc[:, "size"] = p
-                    s.loc[:, "agencies"] = s["ori"].nunique()
-                    pop = s["population"].sum()
-                    agencies = s["ori"].tolist()
-
-                    # some geographies may have no agencies in the specified population bin
-                    if len(s) == 0:
-                        continue
-
-                    s = s.iloc[0]
-                    s["id"] = s[f"{field}_abbr"]
-                    s["population"] = pop
-                    s["agency_list"] = agencies
-                    s["name"] = s["name"] + self.pop_bins[p][2]
-                    del s["ori"]
-
-                    for o in self.order:
-                        s[o] = s[f"{o}_abbr"]
-                        del s[f"{o}_abbr"]
-
-                    # remove values for sub-entities of this geography
-                    for o in self.order[: self.order.index(field)]:
-                        s[o] = None
-
-                    aggregates.append(s)
-
-        return pd.DataFrame(aggregates)
+        """
+        aggregates agencies into every (geographic level, value, population bin)
+        entity in one grouped pass, returning one row per entity with its
+        included agency list
+        """
+        # only keep agencies that span default date range (2017-01 to second-to-most-recent month)
+        df = self.oris[
+            (self.oris["start"] <= self.start) & (self.oris["end"] >= self.end)
+        ]
+
+        # one row per agency and population size bin it falls in
+        bins = pd.concat(
+            [
+                df[(lo <= df["population"]) & (df["population"] <= hi)].assign(
+                    size=p, bin=i
+                )
+                for i, (p, (lo, hi, _)) in enumerate(self.pop_bins.items())
+            ]
+        )
+
+        # one row per agency, population size bin and geographic level (grouping sets)
+        levels = pd.concat(
+            [
+                bins.assign(
+                    level=i,
+                    rank=pd.Series(pd.factorize(df[field])[0], index=df.index)
+                    .reindex(bins.index)
+                    .to_numpy(),
+                    value=bins[field],
+                    id=bins[f"{field}_abbr"],
+                    type=field,
+                )
+                for i, field in enumerate(self.order)
+            ]
+        )
+        levels = levels[levels["value"].notna()]
+
+        # order entities by level, first appearance of each value, then population bin
+        levels = levels.sort_values(by=["level", "rank", "bin"], kind="stable")
+        keys = ["level", "value", "size"]
+        grouped = levels.groupby(keys, sort=False)
+        aggregates = grouped.head(1).reset_index(drop=True)
+        aggregates["agencies"] = grouped["ori"].nunique().to_numpy()
+        aggregates["agency_list"] = grouped["ori"].agg(list).to_numpy()
+
+        aggregates["name"] = aggregates["value"] + aggregates["size"].map(
+            {p: v[2] for p, v in self.pop_bins.items()}
+        )
+        aggregates[["latitude", "longitude"]] = None, None
+        aggregates["start"] = dt.strftime(self.start, "%Y-%m")
+        aggregates["end"] = dt.strftime(self.end, "%Y-%m")
+
+        # use ids for containing geographies and remove values for sub-entities
+        for i, o in enumerate(self.order):
+            aggregates[o] = aggregates[f"{o}_abbr"].where(
+                aggregates["level"] <= i, None
+            )
+
+        # sum member agency populations for all geographic entities at once
+        population = self.oris.drop_duplicates("ori").set_index("ori")["population"]
+        matrix = membership_matrix(aggregates["agency_list"].tolist(), population.index)
+        aggregates["population"] = rollup(matrix, population.to_numpy())
+        if pd.api.types.is_integer_dtype(population):
+            aggregates["population"] = aggregates["population"].astype(population.dtype)
+
+        return aggregates.drop(
+            columns=["ori", "bin", "level", "rank", "value"]
+            + [f"{o}_abbr" for o in self.order]
+        )
 
     def get_date_ranges(self):
         # get earliest and latest scrape dates for each ori in self.agg
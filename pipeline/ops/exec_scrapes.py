@@ -1,18 +1,19 @@
 import os
-import pandas as pd
 import re
 import subprocess
 import sys
-import threading
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime as dt
-from time import sleep
+from multiprocessing import get_context
 
 sys.path.append("../utils")
 from aggregator import Aggregator
-from google_configs import gc_files, pull_sheet, update_sheet
+from google_configs import gc_files, pull_sheet
 from logger import create_logger
+from scheduler import ScrapeScheduler, historical_durations
+from scrape_worker import run_scraper, warm_worker
+from sheet_sync import SheetSync
 
 
 """
@@ -20,8 +21,15 @@ The ScrapeRunner class below determines which scrapers are available to run
 based on the presence of Python scripts for them and their exclusion/inclusion
 in the Google Sheet `agencies.sample`.
 
-It executes their Python scripts in parallel, and each scraper updates its own
-row in the Google Sheet `agencies.scraping` immediately upon completion.
+It executes their Python scripts in parallel (scheduled by resource class,
+longest first, see `scheduler.py`). Each scraper records its results in an
+in-memory copy of the Google Sheet `agencies.scraping` upon completion, which
+is synced to the sheet in batches during and at the end of the run (see
+`sheet_sync.py`).
+
+By default each scraper runs as its own `python3` subprocess; with `--inprocess`
+they are instead run inside a pool of pre-warmed worker processes (see
+`scrape_worker.py`), which avoids re-importing dependencies for every scraper.
 """
 
 
@@ -42,13 +50,14 @@ class ScrapeRunner:
             "status",
         ]
         self.sheet = None
-        self.sheet_lock = threading.Lock()
+        self.sheet_sync = None
+        self.pool = None
 
     def run(self):
         """
         primary method, determines list of scrapers to run, links them to oris,
         verifies with the `agencies.sample` sheet and threads through them,
-        updating the `agencies.scraping` tracker sheet after each scraper completes
+        syncing the `agencies.scraping` tracker sheet as scrapers complete
         """
         # retrieve list of all scraper filenames from the `rtci/scrapers/` directory
         scrapers = list()
@@ -128,23 +137,51 @@ class ScrapeRunner:
         if not scrapers:
             return
 
-        # run scrapers in parallel with a thread pool
-        max_workers = self.args.workers if hasattr(self.args, "workers") and self.args.workers else 2
-        self.logger.info(f"running scrapers with {max_workers} parallel workers")
-
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {
-                executor.submit(self.scrape_one, scraper): scraper
-                for scraper in scrapers
-            }
-            for future in as_completed(futures):
-                scraper = futures[future]
-                try:
-                    future.result()
-                except Exception as e:
-                    self.logger.warning(
-                        f"unexpected error in {scraper['scraper']}: {e}"
-                    )
+        # run scrapers in parallel, with separate worker limits per resource class
+        # (browser/textract/http) and the longest historical runs started first
+        limits = {
+            "browser": getattr(self.args, "browser_workers", None) or 1,
+            "textract": getattr(self.args, "textract_workers", None) or 2,
+            "http": getattr(self.args, "workers", None) or 2,
+        }
+        self.logger.info(f"running scrapers with parallel workers: {limits}")
+        scheduler = ScrapeScheduler(
+            self.logger, limits, historical_durations(scraping_sheet)
+        )
+
+        # if in-process flagged, scrapers run in a pool of warm worker processes
+        # (scheduler threads only orchestrate the jobs and the sheet updates);
+        # workers are started from a fork server rather than forked from this
+        # process, which by then runs the sheet sync and scheduler threads
+        if getattr(self.args, "inprocess", False):
+            self.logger.info(
+                f"starting {sum(limits.values())} in-process scraper workers"
+            )
+            self.pool = ProcessPoolExecutor(
+                max_workers=sum(limits.values()),
+                mp_context=get_context("forkserver"),
+                initializer=warm_worker,
+            )
+
+        # scraper results are written back to `agencies.scraping` in batches
+        if not self.args.test:
+            self.sheet_sync = SheetSync(
+                self.logger,
+                sheet="scraping",
+                url=gc_files["agencies"],
+                cols=self.scraping_sheet_cols,
+                df=scraping_sheet,
+            )
+
+        try:
+            scheduler.run(self.scrape_one, scrapers)
+        finally:
+            if self.sheet_sync:
+                self.sheet_sync.close()
+                self.sheet_sync = None
+            if self.pool:
+                self.pool.shutdown()
+                self.pool = None
 
         # remove any hanging pdfs or csvs from failed scrape attempts
         for state in states:
@@ -155,7 +192,7 @@ class ScrapeRunner:
 
     def scrape_one(self, scrape):
         """
-        runs one scraper, updates the Google Sheet immediately with results
+        runs one scraper, records its results for the Google Sheet
         """
         # confirms which oris are being attempted based on the
         # (manually specified) `scraper` col in `agencies.sample`
@@ -163,47 +200,32 @@ class ScrapeRunner:
             "ori"
         ].unique()
 
-        # gets path to correct scraper, and runs a subprocess
-        path = f"../scrapers/{scrape['state']}"
-        start_time = dt.now()
-
-        # if test flagged, only test run scrapes, otherwise send results to s3
-        command = (
-            ["python3", scrape["scraper"], "-t"]
-            if self.args.test
-            else ["python3", scrape["scraper"]]
-        )
-
-        # if full flagged, full rerun (from 2017-01-01)
-        if self.args.full:
-            command = command + ["-f"]
-
-        result = subprocess.run(
-            command,
-            cwd=path,
-            capture_output=True,
-            text=True,
-            check=False,
-        )
+        # run the scraper either in a warm worker process or as its own subprocess
+        if self.pool:
+            try:
+                result = self.pool.submit(
+                    run_scraper,
+                    scrape["state"],
+                    scrape["scraper"],
+                    self.args.test,
+                    self.args.full,
+                ).result()
+            except Exception as e:
+                # e.g. a worker process died and left the pool broken
+                result = {"status": "bad", "duration": 0, "error": repr(e)}
+        else:
+            result = self.run_subprocess(scrape)
         end_time = dt.now()
-        duration = end_time - start_time
 
         output = list()
 
         # if scrape succeeds, ensure oris line up and return good status
-        if result.returncode == 0:
+        if result["status"] == "good":
             self.logger.info(f"succeeded: {scrape['scraper']}")
+            if result["records"] is not None:
+                self.logger.info(f"{scrape['scraper']} records: {result['records']}")
 
-            # print output if debugged flagged
-            if self.args.log:
-                self.logger.info(result.stderr)
-
-            collected_oris = [
-                ln for ln in result.stderr.split("\n") if "completed oris: " in ln
-            ]
-            assert len(collected_oris) == 1
-            collected_oris = re.findall(r"'([A-Z0-9]{9})'", collected_oris[0])
-
+            collected_oris = result["oris"]
             if set(attempted_oris).difference(set(collected_oris)):
                 raise ValueError(
                     f"the following oris were attempted but not included: "
@@ -215,20 +237,6 @@ class ScrapeRunner:
                     f"{set(collected_oris).difference(set(attempted_oris))}"
                 )
 
-            # collect logged earliest and latest data dates from `super.py` stderr
-            data_from = [
-                ln for ln in result.stderr.split("\n") if "earliest data: " in ln
-            ]
-            data_to = [ln for ln in result.stderr.split("\n") if "latest data: " in ln]
-            assert len(data_from) == 1
-            assert len(data_to) == 1
-            data_from = re.findall(r"([0-9]{4}-[0-9]{2})", data_from[0])
-            data_to = re.findall(r"([0-9]{4}-[0-9]{2})", data_to[0])
-            assert len(data_from) == 1
-            assert len(data_to) == 1
-            data_from = data_from[0]
-            data_to = data_to[0]
-
             for ori in attempted_oris:
                 output.append(
                     {
@@ -236,9 +244,9 @@ class ScrapeRunner:
                         "scraper": scrape["scraper"][:-3],
                         "last_attempt": dt.strftime(end_time.date(), "%Y-%m-%d"),
                         "last_success": dt.strftime(end_time.date(), "%Y-%m-%d"),
-                        "duration": duration.seconds,
-                        "data_from": data_from,
-                        "data_to": data_to,
+                        "duration": result["duration"],
+                        "data_from": result["data_from"],
+                        "data_to": result["data_to"],
                         "status": "good",
                     }
                 )
@@ -249,7 +257,7 @@ class ScrapeRunner:
 
             # print output if debugged flagged
             if self.args.debug or self.args.log:
-                self.logger.warning(result.stderr)
+                self.logger.warning(result["error"])
 
             for ori in attempted_oris:
                 output.append(
@@ -257,87 +265,76 @@ class ScrapeRunner:
                         "ori": ori,
                         "scraper": scrape["scraper"][:-3],
                         "last_attempt": dt.strftime(end_time.date(), "%Y-%m-%d"),
-                        "duration": duration.seconds,
+                        "duration": result["duration"],
                         "status": "bad",
                     }
                 )
 
-        # immediately update the Google Sheet for this scraper's results
-        if not self.args.test:
-            self._update_sheet_for_scraper(output)
+        # record this scraper's results for the next batched sheet update
+        if self.sheet_sync:
+            self.sheet_sync.record(output)
 
-    def _update_sheet_for_scraper(self, results):
+    def run_subprocess(self, scrape):
         """
-        thread-safe update of the `agencies.scraping` sheet for one scraper's results.
-        pulls the current sheet, upserts the new rows, and pushes it back.
-        retries with exponential backoff on rate limit errors.
+        runs one scraper as a `python3` subprocess and parses its logged
+        oris and data range from stderr into the same result structure
+        returned by `scrape_worker.run_scraper`
         """
-        max_retries = 5
-        for attempt in range(max_retries):
-            with self.sheet_lock:
-                try:
-                    scraping_sheet = pull_sheet(sheet="scraping", url=gc_files["agencies"])
-                    if len(scraping_sheet) == 0:
-                        scraping_sheet = pd.DataFrame(columns=self.scraping_sheet_cols)
-
-                    for row in results:
-                        ori = row["ori"]
-                        if ori in scraping_sheet["ori"].values:
-                            idx = scraping_sheet.index[scraping_sheet["ori"] == ori][0]
-                            existing = scraping_sheet.loc[idx]
-
-                            # always update last_attempt, duration, status
-                            scraping_sheet.loc[idx, "last_attempt"] = row["last_attempt"]
-                            scraping_sheet.loc[idx, "duration"] = row["duration"]
-                            scraping_sheet.loc[idx, "status"] = row["status"]
-                            scraping_sheet.loc[idx, "scraper"] = row["scraper"]
-
-                            if row["status"] == "good":
-                                scraping_sheet.loc[idx, "last_success"] = row["last_success"]
-                                scraping_sheet.loc[idx, "data_from"] = row["data_from"]
-                                scraping_sheet.loc[idx, "data_to"] = row["data_to"]
-                                # preserve overall_from if it already exists
-                                if existing["overall_from"] == "" or pd.isna(existing["overall_from"]):
-                                    scraping_sheet.loc[idx, "overall_from"] = row["data_from"]
-                            # on failure, preserve existing last_success, data_from, data_to, overall_from
-                        else:
-                            # new ori — insert row
-                            new_row = {
-                                "ori": ori,
-                                "scraper": row["scraper"],
-                                "last_attempt": row["last_attempt"],
-                                "last_success": row.get("last_success", ""),
-                                "duration": row["duration"],
-                                "overall_from": row.get("data_from", ""),
-                                "data_from": row.get("data_from", ""),
-                                "data_to": row.get("data_to", ""),
-                                "status": row["status"],
-                            }
-                            scraping_sheet = pd.concat(
-                                [scraping_sheet, pd.DataFrame([new_row])],
-                                ignore_index=True,
-                            )
-
-                    update_sheet(
-                        sheet="scraping",
-                        df=scraping_sheet.sort_values(by="ori"),
-                        url=gc_files["agencies"],
-                    )
-                    self.logger.info(
-                        f"updated sheet for {results[0]['scraper']} ({results[0]['status']})"
-                    )
-                    return
-                except Exception as e:
-                    if "429" in str(e) and attempt < max_retries - 1:
-                        wait = 2 ** (attempt + 1)
-                        self.logger.info(
-                            f"rate limited updating {results[0]['scraper']}, retrying in {wait}s..."
-                        )
-                    else:
-                        self.logger.warning(f"failed to update sheet for {results[0]['scraper']}: {e}")
-                        return
-            # sleep outside the lock so other threads can proceed
-            sleep(wait)
+        # gets path to correct scraper, and runs a subprocess
+        path = f"../scrapers/{scrape['state']}"
+        start_time = dt.now()
+
+        # if test flagged, only test run scrapes, otherwise send results to s3
+        command = (
+            ["python3", scrape["scraper"], "-t"]
+            if self.args.test
+            else ["python3", scrape["scraper"]]
+        )
+
+        # if full flagged, full rerun (from 2017-01-01)
+        if self.args.full:
+            command = command + ["-f"]
+
+        result = subprocess.run(
+            command,
+            cwd=path,
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        duration = dt.now() - start_time
+
+        if result.returncode != 0:
+            return {"status": "bad", "duration": duration.seconds, "error": result.stderr}
+
+        # print output if debugged flagged
+        if self.args.log:
+            self.logger.info(result.stderr)
+
+        collected_oris = [
+            ln for ln in result.stderr.split("\n") if "completed oris: " in ln
+        ]
+        assert len(collected_oris) == 1
+        collected_oris = re.findall(r"'([A-Z0-9]{9})'", collected_oris[0])
+
+        # collect logged earliest and latest data dates from `super.py` stderr
+        data_from = [ln for ln in result.stderr.split("\n") if "earliest data: " in ln]
+        data_to = [ln for ln in result.stderr.split("\n") if "latest data: " in ln]
+        assert len(data_from) == 1
+        assert len(data_to) == 1
+        data_from = re.findall(r"([0-9]{4}-[0-9]{2})", data_from[0])
+        data_to = re.findall(r"([0-9]{4}-[0-9]{2})", data_to[0])
+        assert len(data_from) == 1
+        assert len(data_to) == 1
+
+        return {
+            "status": "good",
+            "oris": collected_oris,
+            "data_from": data_from[0],
+            "data_to": data_to[0],
+            "records": None,
+            "duration": duration.seconds,
+        }
 
 
 if __name__ == "__main__":
@@ -399,7 +396,27 @@ if __name__ == "__main__":
         "--workers",
         type=int,
         default=2,
-        help="""Number of parallel workers (default: 2).""",
+        help="""Number of parallel workers for plain http scrapers (default: 2).""",
+    )
+    parser.add_argument(
+        "-wb",
+        "--browser_workers",
+        type=int,
+        default=1,
+        help="""Number of parallel workers for selenium/chrome scrapers (default: 1).""",
+    )
+    parser.add_argument(
+        "-wt",
+        "--textract_workers",
+        type=int,
+        default=2,
+        help="""Number of parallel workers for pdf/textract scrapers (default: 2).""",
+    )
+    parser.add_argument(
+        "-ip",
+        "--inprocess",
+        action="store_true",
+        help="""If specified, run scrapers inside a pool of pre-warmed worker processes instead of one subprocess each.""",
     )
     args = parser.parse_args()
 
@@ -0,0 +1,119 @@
+import ast
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+"""
+The ScrapeScheduler class below orders and throttles scraper runs for
+`exec_scrapes.py` by resource class:
+
+- `browser`: selenium scrapers holding a headless Chrome (memory heavy)
+- `textract`: pdf scrapers that mostly wait on AWS Textract jobs
+- `http`: everything else (plain requests/json/csv scrapers)
+
+Each class gets its own concurrency limit, so cheap http scrapers are never
+stuck behind a pair of Chrome-bound ones, and within each class the longest
+scrapers (per the historical `duration` column of `agencies.scraping`) start
+first so the nightly run finishes close to the duration of its slowest scraper.
+
+A scraper's class is inferred from the script's imports.
+"""
+
+
+RESOURCE_CLASSES = ["browser", "textract", "http"]
+
+
+def resource_class(path):
+    """
+    determines the resource class of a scraper script without importing it
+    (importing a scraper runs it), from the modules it imports
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read())
+
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.add(node.module.split(".")[0])
+
+    if modules & {"selenium", "selenium_actions", "selenium_configs"}:
+        return "browser"
+    if "pdfs" in modules:
+        return "textract"
+    return "http"
+
+
+def historical_durations(scraping_sheet):
+    """
+    returns a mapping of scraper name to its last recorded duration (in seconds)
+    from the `agencies.scraping` sheet
+    """
+    if len(scraping_sheet) == 0 or "duration" not in scraping_sheet.columns:
+        return dict()
+    durations = pd.to_numeric(scraping_sheet["duration"], errors="coerce")
+    return (
+        durations.groupby(scraping_sheet["scraper"]).max().dropna().to_dict()
+    )
+
+
+class ScrapeScheduler:
+    def __init__(self, logger, limits, durations=None):
+        self.logger = logger
+        self.limits = limits
+        self.durations = durations or dict()
+
+    def plan(self, scrapers):
+        """
+        groups scrapers by resource class and orders each group longest first
+        (scrapers with no recorded duration are treated as the longest,
+        since new or previously failing scrapers have the least predictable runtimes)
+        """
+        queues = {rc: list() for rc in RESOURCE_CLASSES}
+        for scrape in scrapers:
+            rc = resource_class(f"../scrapers/{scrape['state']}/{scrape['scraper']}")
+            queues[rc].append(scrape)
+
+        for rc in queues:
+            queues[rc] = sorted(
+                queues[rc],
+                key=lambda d: self.durations.get(d["scraper"][:-3], float("inf")),
+                reverse=True,
+            )
+            if queues[rc]:
+                self.logger.info(
+                    f"{rc} scrapers ({self.limits[rc]} workers): "
+                    f"{[d['scraper'][:-3] for d in queues[rc]]}"
+                )
+        return queues
+
+    def run(self, worker, scrapers):
+        """
+        runs `worker` over all scrapers, with a separate
+        bounded thread pool per resource class
+        """
+        queues = self.plan(scrapers)
+        executors = {
+            rc: ThreadPoolExecutor(max_workers=self.limits[rc])
+            for rc in RESOURCE_CLASSES
+            if queues[rc]
+        }
+        try:
+            futures = {
+                executors[rc].submit(worker, scrape): scrape
+                for rc in executors
+                for scrape in queues[rc]
+            }
+            for future in as_completed(futures):
+                scrape = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    self.logger.warning(
+                        f"unexpected error in {scrape['scraper']}: {e}"
+                    )
+        finally:
+            for executor in executors.values():
+                executor.shutdown()
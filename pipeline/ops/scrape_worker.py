@@ -0,0 +1,83 @@
+import os
+import runpy
+import sys
+import traceback
+
+from time import time
+
+sys.path.append("../utils")
+
+
+"""
+Worker functions for running scrapers in-process (`exec_scrapes.py --inprocess`).
+
+Instead of launching a fresh `python3` interpreter per scraper, the ScrapeRunner
+keeps a pool of worker processes that import the shared heavy dependencies
+(pandas, us, boto3, gspread and the `super.Scraper` base class) once on startup.
+Each job then executes a scraper script inside an already-warm worker and hands
+back a structured result dict instead of log lines to be parsed from stderr.
+"""
+
+
+SCRAPERS_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scrapers")
+)
+
+
+def warm_worker():
+    """
+    process pool initializer, imports shared dependencies once per worker
+    """
+    import boto3  # noqa: F401
+    import gspread  # noqa: F401
+    import pandas  # noqa: F401
+    import us  # noqa: F401
+
+    import super  # noqa: F401
+
+
+def run_scraper(state, scraper, test=False, full=False):
+    """
+    executes one scraper script in the current (warm) process and returns a
+    structured result with the completed oris, data range, record count and duration
+    """
+    import super
+
+    result = {
+        "state": state,
+        "scraper": scraper[:-3],
+        "status": "bad",
+        "oris": [],
+        "data_from": None,
+        "data_to": None,
+        "records": 0,
+        "duration": 0,
+        "error": None,
+    }
+
+    # scrapers read their args from `sys.argv` and their state from the cwd,
+    # so mimic the subprocess invocation for the duration of the run
+    argv = [scraper] + (["-t"] if test else []) + (["-f"] if full else [])
+    cwd, sys_argv = os.getcwd(), sys.argv
+    super.Scraper.last_result = None
+
+    start_time = time()
+    try:
+        os.chdir(os.path.join(SCRAPERS_DIR, state))
+        sys.argv = argv
+        runpy.run_path(scraper, run_name="__main__")
+
+        # populated by `Scraper.run` only once data has been collected and exported
+        if super.Scraper.last_result is None:
+            raise RuntimeError(f"{scraper} did not complete a run")
+        result.update(super.Scraper.last_result)
+        result["status"] = "good"
+    except (Exception, SystemExit):
+        result["error"] = traceback.format_exc()
+    finally:
+        os.chdir(cwd)
+        sys.argv = sys_argv
+        super.Scraper.last_result = None
+    result["duration"] = int(time() - start_time)
+
+    return result
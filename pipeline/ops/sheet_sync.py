@@ -0,0 +1,169 @@
+import pandas as pd
+import sys
+import threading
+
+from gspread.utils import rowcol_to_a1
+from time import sleep
+
+sys.path.append("../utils")
+from google_configs import invalidate_sheet, open_sheet
+
+
+"""
+The SheetSync class below is a write-behind copy of a Google Sheet ledger
+(used by `exec_scrapes.py` for `agencies.scraping`).
+
+The sheet is read once when a run starts and kept in memory keyed by ori.
+Scraper results are upserted into that copy, which costs nothing against the
+Sheets API, and the changed rows are marked dirty. A background thread flushes
+the dirty rows every `interval` seconds, and once more on `close()`. Since other
+runs (the long and short scraper containers) write the same sheet, each flush
+re-reads the sheet's ori column to find the current row of every dirty ori, then
+writes one batched range update for rows already in the sheet plus one append
+for new rows, after which the sheet is re-sorted by ori. Rate limit errors (429)
+are retried by the flush thread only, so the scraper workers never block on them.
+"""
+
+
+class SheetSync:
+    def __init__(self, logger, sheet, url, cols, df, interval=30, max_retries=5):
+        self.logger = logger
+        self.interval = interval
+        self.max_retries = max_retries
+        self.sheet = sheet
+        self.url = url
+        self.worksheet = open_sheet(sheet, url=url)
+
+        # in-memory ledger and pending changes
+        self.cols = list(df.columns) if len(df) > 0 else list(cols)
+        self.cols += [c for c in cols if c not in self.cols]
+        self.header_dirty = len(df) == 0 or len(self.cols) > len(df.columns)
+        self.rows = dict()
+        for row in df.fillna("").to_dict("records"):
+            self.rows[row["ori"]] = {c: row.get(c, "") for c in self.cols}
+        self.dirty = set()
+
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def record(self, results):
+        """
+        upserts one scraper's result rows into the in-memory ledger,
+        to be written to the sheet on the next flush
+        """
+        with self.lock:
+            for result in results:
+                ori = result["ori"]
+                row = self.rows.get(ori)
+                if row is None:
+                    # new ori, insert row
+                    row = {c: "" for c in self.cols}
+                    row["overall_from"] = result.get("data_from", "")
+                    self.rows[ori] = row
+
+                # always update last_attempt, duration, status
+                for col in ["ori", "scraper", "last_attempt", "duration", "status"]:
+                    row[col] = result[col]
+
+                # on failure, preserve existing last_success, data_from, data_to, overall_from
+                if result["status"] == "good":
+                    for col in ["last_success", "data_from", "data_to"]:
+                        row[col] = result[col]
+                    if row["overall_from"] == "" or pd.isna(row["overall_from"]):
+                        row["overall_from"] = result["data_from"]
+
+                self.dirty.add(ori)
+
+    def loop(self):
+        """
+        background thread, flushes pending rows every `interval` seconds
+        """
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def row_numbers(self):
+        """
+        re-reads the sheet's ori column and returns the current sheet row number
+        (1 is the header) of every ori in it
+        """
+        oris = self.worksheet.col_values(self.cols.index("ori") + 1)
+        return {ori: i + 1 for i, ori in enumerate(oris) if i > 0 and ori != ""}
+
+    def flush(self):
+        """
+        writes all dirty rows to the sheet in (at most) one batched range update
+        and one append, retrying with exponential backoff on rate limit errors
+        """
+        with self.flush_lock:
+            with self.lock:
+                if not self.dirty and not self.header_dirty:
+                    return
+                oris = sorted(self.dirty)
+                self.dirty = set()
+                values = {ori: [self.rows[ori][c] for c in self.cols] for ori in oris}
+                header_dirty = self.header_dirty
+
+            for attempt in range(self.max_retries):
+                try:
+                    # rows are matched by ori just before writing, since other runs
+                    # may have added or re-sorted rows since the last flush
+                    row_numbers = self.row_numbers()
+                    updates = [
+                        {
+                            "range": f"{rowcol_to_a1(row_numbers[ori], 1)}:"
+                            f"{rowcol_to_a1(row_numbers[ori], len(self.cols))}",
+                            "values": [values[ori]],
+                        }
+                        for ori in oris
+                        if ori in row_numbers
+                    ]
+                    if header_dirty:
+                        updates.append(
+                            {
+                                "range": f"A1:{rowcol_to_a1(1, len(self.cols))}",
+                                "values": [self.cols],
+                            }
+                        )
+                    appends = [values[ori] for ori in oris if ori not in row_numbers]
+
+                    if updates:
+                        self.worksheet.batch_update(updates)
+                    if appends:
+                        self.worksheet.append_rows(appends, table_range="A1")
+
+                        # keep the sheet sorted by ori, as it was when rewritten whole
+                        last = max(row_numbers.values(), default=1) + len(appends)
+                        self.worksheet.sort(
+                            (self.cols.index("ori") + 1, "asc"),
+                            range=f"A2:{rowcol_to_a1(last, len(self.cols))}",
+                        )
+                    with self.lock:
+                        self.header_dirty = self.header_dirty and not header_dirty
+                    invalidate_sheet(self.sheet, url=self.url)
+                    self.logger.info(f"synced {len(oris)} rows to sheet")
+                    return
+                except Exception as e:
+                    if "429" in str(e) and attempt < self.max_retries - 1:
+                        wait = 2 ** (attempt + 1)
+                        self.logger.info(
+                            f"rate limited syncing sheet, retrying in {wait}s..."
+                        )
+                        sleep(wait)
+                    else:
+                        self.logger.warning(f"failed to sync sheet: {e}")
+                        break
+
+            # keep failed rows pending for the next flush
+            with self.lock:
+                self.dirty.update(oris)
+
+    def close(self):
+        """
+        stops the background thread and flushes any remaining rows
+        """
+        self.stopped.set()
+        self.thread.join()
+        self.flush()
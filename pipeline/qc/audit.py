@@ -6,7 +6,7 @@ from datetime import timedelta as td
 
 sys.path.append("../utils")
 
-from aws import snapshot_df
+from aws import read_df, snapshot_df
 from crimes import rtci_to_nibrs
 from google_configs import gc_files, pull_sheet, update_sheet
 from logger import create_logger
@@ -16,7 +16,6 @@ class Auditor:
     def __init__(self, arguments):
         self.logger = create_logger()
         self.args = arguments
-        self.stem = "https://rtci.s3.us-east-1.amazonaws.com/data/"
 
         self.last = (
             dt.now().replace(day=1, hour=23, minute=59, second=59, microsecond=999999)
@@ -39,85 +38,68 @@ class Auditor:
         self.property = [k for k in self.crimes if self.crimes[k] == "Property"]
 
         self.sheet = pull_sheet(sheet="audit", url=gc_files["agencies"])
-        self.removals = list()
         self.removal_cols = ["r1", "r2", "r3", "r4", "r5", "s5", "r6", "s6", "r7"]
 
-    def run(self):
-        df = pd.read_csv(self.stem + "aggregated.csv")
-        df["date"] = pd.to_datetime(
-            df["year"].astype(str) + "-" + df["month"].astype(str), format="%Y-%m"
-        )
-        df["property"] = df[self.property].sum(axis=1)
-
-        for ori in df["ori"].unique():
-            tmp = df[df["ori"] == ori]
-            latest = tmp[
-                (tmp["year"] == self.max_year) & (tmp["month"] == self.max_month)
-            ]
-            assert 0 <= len(latest) <= 1
-
+        # audit rules, checked in order against the per-ori features from `get_features`
+        # (each ori is flagged by the first rule it fails, plus that rule's score feature if any)
+        self.rules = [
             # 1 — no data row for second-to-most-recent month
-            if len(latest) == 0:
-                self.removals.append({"ori": ori, "r1": 1})
-                continue
-
+            {"flag": "r1", "check": lambda f: ~f["latest"]},
             # 2 — row of all missing crime cols for second-to-most-recent month
-            if latest[list(self.crimes.keys())].isna().all().all():
-                self.removals.append({"ori": ori, "r2": 1})
-                continue
-
+            {"flag": "r2", "check": lambda f: f["latest_null"]},
             # 3 — row of all zero crime cols for second-to-most-recent month
-            if latest[list(self.crimes.keys())].iloc[0].sum() == 0:
-                self.removals.append({"ori": ori, "r3": 1})
-                continue
-
+            {"flag": "r3", "check": lambda f: f["latest_total"] == 0},
             # 4 — zero theft in second-to-most-recent month
-            if latest["theft"].iloc[0] == 0:
-                self.removals.append({"ori": ori, "r4": 1})
-                continue
-
+            {"flag": "r4", "check": lambda f: f["latest_theft"] == 0},
             # 5 — property crimes in second-to-most-recent month > 2 deviations of last-twelve mean
             # TODO: what do we do if not all last 12 months are present?
-            year = tmp[tmp["date"] >= self.first]
-            property_mean = year["property"].mean()
-            property_std = year["property"].std()
-            latest_devs = (latest.iloc[0]["property"] - property_mean) / property_std
-            if (
-                not property_mean - (2 * property_std)
-                <= latest.iloc[0]["property"]
-                <= property_mean + (2 * property_std)
-            ):
-                self.removals.append({"ori": ori, "r5": 1, "s5": latest_devs})
-                continue
-
+            {
+                "flag": "r5",
+                "score": "s5",
+                "check": lambda f: ~(
+                    (f["property_mean"] - 2 * f["property_std"] <= f["latest_property"])
+                    & (
+                        f["latest_property"]
+                        <= f["property_mean"] + 2 * f["property_std"]
+                    )
+                ),
+            },
             # 6 — property crimes in any of most recent 12 months > 3 deviations of last-twelve mean
             # TODO: (same as 5) what do we do if not all last 12 months are present?
             # TODO: what if there are multiple months that are outside range?
-            if (year["property"] >= property_mean + (3 * property_std)).any() or (
-                year["property"] <= property_mean - (3 * property_std)
-            ).any():
-                flagged_devs = (
-                    year[
-                        (year["property"] >= property_mean + (3 * property_std))
-                        | (year["property"] <= property_mean - (3 * property_std))
-                    ].iloc[0]["property"]
-                    - property_mean
-                ) / property_std
-                self.removals.append({"ori": ori, "r6": 1, "s6": flagged_devs})
-                continue
-
+            {
+                "flag": "r6",
+                "score": "s6",
+                "check": lambda f: f["flagged"],
+            },
             # 7 — second-to-most-recent month thefts lowest overall
             # TODO: same question do we discount from this analysis if missing x number of rows?
             # TODO: also what if the same min appears more than once across the data?
-            overall_min = tmp["theft"].min()
-            overall_min = tmp[tmp["theft"] == overall_min].iloc[-1]
-            if (
-                overall_min["year"] == self.max_year
-                and overall_min["month"] == self.max_month
-            ):
-                self.removals.append({"ori": ori, "r7": 1})
-
-        rem = pd.DataFrame(self.removals)
+            {"flag": "r7", "check": lambda f: f["latest_theft_min"]},
+        ]
+
+    def run(self):
+        df = read_df("data/aggregated")
+        df["date"] = pd.to_datetime(
+            df["year"].astype(str) + "-" + df["month"].astype(str), format="%Y-%m"
+        )
+        df["property"] = df[self.property].sum(axis=1)
+
+        # evaluate every rule for every ori at once, then keep each ori's first failed rule
+        features = self.get_features(df)
+        flags = self.get_flags(features)
+        first = flags.idxmax(axis=1)[flags.any(axis=1)]
+
+        rem = pd.DataFrame({"ori": first.index})
+        for rule in self.rules:
+            matched = (first == rule["flag"]).to_numpy()
+            if matched.any():
+                rem.loc[matched, rule["flag"]] = 1
+                if "score" in rule:
+                    rem.loc[matched, rule["score"]] = features.loc[
+                        first.index[matched], rule["score"]
+                    ].to_numpy()
+
         for col in self.removal_cols:
             if col not in rem:
                 rem[col] = None
@@ -214,6 +196,71 @@ class Auditor:
         #     print("   ", d["ori"], d["name"])
         # print()
 
+    def get_features(self, df):
+        """
+        computes the per-ori statistics used by the audit rules in one grouped pass:
+        the second-to-most-recent month's counts, the mean and standard deviation of
+        property crimes over the last twelve months (and deviations from them),
+        and whether the latest month holds an ori's (last) theft minimum
+        """
+        oris = pd.Index(df["ori"].unique(), name="ori")
+        features = pd.DataFrame(index=oris)
+
+        # second-to-most-recent month
+        latest = df[(df["year"] == self.max_year) & (df["month"] == self.max_month)]
+        assert not latest["ori"].duplicated().any()
+        latest = latest.set_index("ori").reindex(oris)
+        features["latest"] = latest["year"].notna()
+        features["latest_null"] = latest[list(self.crimes.keys())].isna().all(axis=1)
+        features["latest_total"] = latest[list(self.crimes.keys())].sum(axis=1)
+        features["latest_theft"] = latest["theft"]
+        features["latest_property"] = latest["property"]
+
+        # property crime mean and standard deviation over the last twelve months
+        year = df[df["date"] >= self.first]
+        stats = year.groupby("ori")["property"].agg(["mean", "std"]).reindex(oris)
+        features["property_mean"] = stats["mean"]
+        features["property_std"] = stats["std"]
+        features["s5"] = (
+            features["latest_property"] - features["property_mean"]
+        ) / features["property_std"]
+
+        # first month of the last twelve with property crimes > 3 deviations of the mean
+        mean = year["ori"].map(stats["mean"])
+        std = year["ori"].map(stats["std"])
+        outliers = year[
+            (year["property"] >= mean + (3 * std))
+            | (year["property"] <= mean - (3 * std))
+        ].drop_duplicates("ori")
+        outliers = outliers.set_index("ori")["property"].reindex(oris)
+        features["flagged"] = outliers.notna()
+        features["s6"] = (outliers - features["property_mean"]) / features[
+            "property_std"
+        ]
+
+        # last month at which each ori's overall theft minimum occurs
+        minima = df[df["theft"] == df.groupby("ori")["theft"].transform("min")]
+        minima = (
+            minima.drop_duplicates("ori", keep="last").set_index("ori").reindex(oris)
+        )
+        features["latest_theft_min"] = (minima["year"] == self.max_year) & (
+            minima["month"] == self.max_month
+        )
+
+        return features
+
+    def get_flags(self, features):
+        """
+        evaluates all audit rules against the per-ori features as one flag matrix
+        """
+        return pd.DataFrame(
+            {
+                rule["flag"]: rule["check"](features).fillna(False)
+                for rule in self.rules
+            },
+            index=features.index,
+        ).astype(bool)
+
 
 if __name__ == "__main__":
     import argparse
@@ -6,6 +6,7 @@ from datetime import datetime as dt
 sys.path.append("../utils")
 
 from crimes import rtci_to_nibrs
+import http_cache
 from logger import create_logger
 
 
@@ -35,7 +36,7 @@ class Grapher:
         sample["Source"] = "final_sample.csv"
 
         # read in scraped data
-        df = pd.read_csv(self.scrape_url)
+        df = http_cache.read_csv(self.scrape_url)
         df["Source"] = "scraper"
 
         if self.args.oris:
@@ -1,10 +1,12 @@
 import pandas as pd
-import requests
 import sys
 
 from collections import ChainMap
+from datetime import datetime as dt
 
 sys.path.append("../../utils")
+from arcgis import features, find_field, layer_info, monthly_statistics
+from crimes import to_matrix
 from super import Scraper
 
 
@@ -15,7 +17,7 @@ class KY0568000(Scraper):
         self.prefix = (
             "https://services1.arcgis.com/79kfd2K6fskCAkyg/arcgis/rest/services/"
         )
-        self.suffix = "/FeatureServer/0/query"
+        self.suffix = "/FeatureServer/0"
         self.mapping = dict(
             ChainMap(
                 *[{d["Offense Code"]: k for d in self.crimes[k]} for k in self.crimes]
@@ -45,94 +47,48 @@ class KY0568000(Scraper):
         assert self.years[-1][0] == self.last.year
 
     def scrape(self):
-        all_years_records = list()
+        counts = list()
 
         for year in self.years:
             self.logger.info(f"collecting {year[0]}...")
 
-            # post for full record count
-            data = {
-                "f": "json",
-                "where": "1=1",
-                "outFields": "*",
-                "returnCountOnly": True,
-            }
-            count = requests.post(year[1], data=data).json()["count"]
-            self.logger.info(f"{count} records found")
-
-            # update payload for data retrieval
-            del data["returnCountOnly"]
-            data.update(
-                {"returnGeometry": False, "resultOffset": 0, "resultRecordCount": 1_000}
-            )
-            records = [
-                d["attributes"]
-                for d in requests.post(year[1], data=data).json()["features"]
-            ]
-
-            # iterate through offsets until all records collected
-            while data["resultOffset"] <= count:
-                data["resultOffset"] += 1_000
-                records.extend(
-                    [
-                        d["attributes"]
-                        for d in requests.post(year[1], data=data).json()["features"]
-                    ]
-                )
-
-            assert len(records) == count
-
-            try:
-                df = pd.DataFrame(records)[
-                    ["DATE_REPORTED", "DATE_OCCURED", "NIBRS_CODE"]
-                ].rename(
-                    columns={
-                        "DATE_REPORTED": "date_reported",
-                        "DATE_OCCURED": "date_occurred",
-                        "NIBRS_CODE": "nibrs_code",
-                    }
-                )
-            except KeyError:
-                df = pd.DataFrame(records)[
-                    ["date_reported", "date_occurred", "nibrs_code"]
-                ]
-
             # different date field depending on the year
-            # (from 2023 on, `date_occurred` is used rather than `date_reported`)
+            # (from 2023 on, `date_occurred` is used rather than `date_reported`),
+            # and field names differ in case (and spelling) between layers
+            info = layer_info(year[1])
+            code = find_field(info, "NIBRS_CODE")
             if year[2] == "reported":
-                df["date"] = df["date_reported"]
-                df = df.drop(columns=["date_reported"])
+                date = find_field(info, "DATE_REPORTED")
             elif year[2] == "occurred":
-                df["date"] = df["date_occurred"]
-            df = df.drop(columns=["date_occurred"])
-
-            # extract year/month
-            if df["date"].dtype != object:
-                df["date"] = pd.to_datetime(df["date"], unit="ms")
+                date = find_field(info, "date_occurred", "DATE_OCCURED")
+
+            # monthly counts per nibrs code from the server, unless the layer
+            # stores dates as text, in which case its rows are counted here
+            date_type = [f["type"] for f in info["fields"] if f["name"] == date][0]
+            if date_type == "esriFieldTypeDate":
+                df = monthly_statistics(
+                    year[1],
+                    date=date,
+                    category=code,
+                    first=dt(year[0], 1, 1),
+                    last=min(dt(year[0], 12, 31), self.last),
+                )
             else:
-                df["date"] = pd.to_datetime(df["date"])
-            df["year"] = df["date"].dt.year
-            df["month"] = df["date"].dt.month
-            df = df.drop(columns=["date"])
-
-            # extract crime
-            df = df[df["nibrs_code"].isin(self.mapping)]
-            df["nibrs_code"] = df["nibrs_code"].map(self.mapping)
-
-            df = (
-                df.groupby(["year", "month"])["nibrs_code"]
-                .value_counts()
-                .reset_index()
-                .pivot(index=["year", "month"], columns="nibrs_code", values="count")
-                .reset_index()
-            )
-
-            all_years_records.extend(df.to_dict("records"))
+                df = pd.DataFrame(features(year[1], [date, code]))
+                df[date] = pd.to_datetime(df[date])
+                df = df[df[date].dt.year == year[0]]
+                df = (
+                    df.groupby([df[date].dt.year, df[date].dt.month, df[code]])
+                    .size()
+                    .rename_axis(["year", "month", "category"])
+                    .reset_index(name="count")
+                )
+            self.logger.info(f"{df['count'].sum()} records found")
+            counts.append(df)
 
-        # drop duplicates on year/month from getting previous month data in pdfs
-        df = pd.DataFrame(all_years_records)
+        # map nibrs codes to crimes and get monthly counts
+        df = to_matrix(pd.concat(counts), self.mapping)
         df[["year", "month"]] = df[["year", "month"]].astype(int)
-        df = df.drop_duplicates(["year", "month"])
         df = df.sort_values(by=["year", "month"])
         data = df.to_dict("records")
         return data
@@ -19,11 +19,24 @@ from selenium_actions import (
     drag_element,
     hide_element,
     wait_for_element,
+    wait_for_idle,
 )
-from selenium_configs import chrome_driver
+from selenium_configs import chrome_driver, reset_driver
+from platforms.beyond2020 import Beyond2020, http_enabled, report_records
 from super import Scraper
 
 
+MAP = {
+    "a. Murder and Nonnegligent Homicide": "murder",
+    "2. Forcible Rape Total": "rape",
+    "3. Robbery Total": "robbery",
+    "Aggravated Assault Total": "aggravated_assault",
+    "5. Burglary Total": "burglary",
+    "6. Larceny - Theft Total": "theft",
+    "7. Motor Vehicle Theft Total": "motor_vehicle_theft",
+}
+
+
 class Massachusetts(Scraper):
     def __init__(self):
         super().__init__()
@@ -36,15 +49,7 @@ class Massachusetts(Scraper):
         self.exclude_oris = []
         self.agencies = self.get_agencies(self.exclude_oris)
         self.oris = list(self.agencies.values())
-        self.map = {
-            "a. Murder and Nonnegligent Homicide": "murder",
-            "2. Forcible Rape Total": "rape",
-            "3. Robbery Total": "robbery",
-            "Aggravated Assault Total": "aggravated_assault",
-            "5. Burglary Total": "burglary",
-            "6. Larceny - Theft Total": "theft",
-            "7. Motor Vehicle Theft Total": "motor_vehicle_theft",
-        }
+        self.map = MAP
 
     def scrape(self):
         self.driver.get(self.url)
@@ -54,7 +59,7 @@ class Massachusetts(Scraper):
             self.driver.quit()
             r = requests.get(self.url)
             raise Exception(f"bad response ({r.status_code})")
-        sleep(7)
+        wait_for_idle(self)
 
         # get list of year, month and agency values from site
         soup = bS(self.driver.page_source, "lxml")
@@ -84,14 +89,14 @@ class Massachusetts(Scraper):
                 self.click_report(agency, month)
                 soup = bS(self.driver.page_source, "lxml")
                 self.process_soup(soup, agency, month)
-                sleep(2)
+                wait_for_idle(self)
 
         # process and return records
         return self.process_records()
 
     def select_agency(self, agency):
         self.logger.info(f"attempting {agency}...")
-        sleep(5)
+        wait_for_idle(self)
         try:
             click_select_element_value(
                 self,
@@ -102,10 +107,8 @@ class Massachusetts(Scraper):
             )
         except (NotImplementedError, TimeoutException):
             self.logger.warning("retrying...")
-            self.driver.quit()
             sleep(5)
-            self.driver = chrome_driver(self)
-            self.driver.get(self.url)
+            reset_driver(self)
             click_select_element_value(
                 self,
                 "select",
@@ -116,7 +119,7 @@ class Massachusetts(Scraper):
 
     def select_month(self, agency, month):
         self.logger.info(f"attempting {month}...")
-        sleep(5)
+        wait_for_idle(self)
         try:
             click_select_element_value(
                 self,
@@ -127,10 +130,8 @@ class Massachusetts(Scraper):
             )
         except (NotImplementedError, TimeoutException):
             self.logger.warning("retrying...")
-            self.driver.quit()
             sleep(5)
-            self.driver = chrome_driver(self)
-            self.driver.get(self.url)
+            reset_driver(self)
             self.select_agency(agency)
             click_select_element_value(
                 self,
@@ -141,7 +142,7 @@ class Massachusetts(Scraper):
             )
 
     def click_report(self, agency, month):
-        sleep(5)
+        wait_for_idle(self)
         try:
             click_element(
                 self,
@@ -159,13 +160,11 @@ class Massachusetts(Scraper):
             wait_for_element(self, "div", "text", "Grand Total", 30)
         except TimeoutException:
             self.logger.warning("retrying...")
-            self.driver.quit()
             sleep(15)
-            self.driver = chrome_driver(self)
-            self.driver.get(self.url)
+            reset_driver(self)
             self.select_agency(agency)
             self.select_month(agency, month)
-            sleep(5)
+            wait_for_idle(self)
             click_element(
                 self,
                 "input",
@@ -183,35 +182,17 @@ class Massachusetts(Scraper):
 
     def process_soup(self, soup, agency, month):
         month, year = month.split("\xa0")
-        for field in self.map:
-            tds = soup.find_all("td", string=field)
-            assert len(tds) == 1
-            td = tds[0]
-            reported = td.find_next_sibling("td").text.strip()
-            if reported == "":
-                reported = 0
-            else:
-                reported = int(reported)
-            cleared = (
-                td.find_next_sibling("td")
-                .find_next_sibling("td")
-                .find_next_sibling("td")
-                .find_next_sibling("td")
-                .text.strip()
+        self.records.extend(
+            report_records(
+                soup,
+                agency,
+                int(year),
+                dt.strptime(month, "%b"),
+                self.map,
+                cleared_column=4,
+                blanks=True,
             )
-            if cleared == "":
-                cleared = 0
-            else:
-                cleared = int(cleared)
-            datum = {
-                "field": field,
-                "reported": reported,
-                "cleared": cleared,
-            }
-            tmp = {"ori": agency, "year": int(year), "month": dt.strptime(month, "%b")}
-            tmp.update(datum)
-            tmp["ori"] = tmp["ori"].replace("\xa0", " ").rsplit(" - ", 1)[-1]
-            self.records.append(tmp)
+        )
 
     def process_records(self):
         # relabel field names and sum components
@@ -260,4 +241,21 @@ class Massachusetts(Scraper):
         return self.records.to_dict("records")
 
 
-Massachusetts().run()
+class MassachusettsHttp(Beyond2020):
+    def __init__(self):
+        super().__init__()
+        self.url = "https://ma.beyond2020.com/ma_public/View/RSReport.aspx?ReportId=584"
+        self.agency_select = "ctl00$MainContent$RptViewer$ctl08$ctl03$ddValue"
+        self.year_select = None
+        self.exclude_oris = []
+        self.map = MAP
+        self.cleared_column = 4
+        self.blank_counts = True
+
+
+# the http client of the report viewer (`platforms/beyond2020.py`) only runs
+# with `RTCI_BEYOND2020_HTTP=1`, until it has been validated against the live viewer
+if http_enabled():
+    MassachusettsHttp().run()
+else:
+    Massachusetts().run()
@@ -1,11 +1,10 @@
-import pandas as pd
-import requests
 import sys
 
-from bs4 import BeautifulSoup as bS
-from io import StringIO
+from datetime import datetime as dt
 
 sys.path.append("../../utils")
+from crimes import rtci_to_nibrs, to_matrix
+from socrata import monthly_counts
 from super import Scraper
 
 
@@ -13,25 +12,30 @@ class MD0160400(Scraper):
     def __init__(self):
         super().__init__()
         self.oris = ["MD0160400"]
-        self.url = (
-            "https://data.montgomerycountymd.gov/api/v3/views/icn6-v9z3/query.json"
-        )
+        self.map = {
+            k: v
+            for e in [
+                {d["Offense Code"]: crime for d in rtci_to_nibrs[crime]}
+                for crime in rtci_to_nibrs
+            ]
+            for k, v in e.items()
+        }
 
     def scrape(self):
-        data = (
-            '{"clientContext":{"clientContextVariables":[]},"query":"SELECT\n  `date`,\n  `start_date`,\n  `end_date`,'
-            '\n  `nibrs_code`,\n  `victims`\nWHERE\n  `start_date`\n    BETWEEN "2025-10-01T00:00:00" :: '
-            'floating_timestamp\n    AND "2025-10-21T01:03:54" :: floating_timestamp\n  AND caseless_one_of('
-            '`nibrs_code`, "09B", "09C", "13A", "120")\nORDER BY `start_date` DESC NULL FIRST",'
-            '"page":{"pageNumber":1,"pageSize":100},"parameters":{}}'
-        )
-        r = requests.get(
-            self.url,
-            data=data,
-            headers={"X-App-Token": "U29jcmF0YS0td2VraWNrYXNz0"},
+        # sum victims per month and nibrs code on the server
+        counts = monthly_counts(
+            "data.montgomerycountymd.gov",
+            "icn6-v9z3",
+            date="start_date",
+            category="nibrs_code",
+            total="victims",
+            where=f"`start_date` >= '{dt.strftime(self.first, '%Y-%m-%d')}T00:00:00'",
         )
-        print(r.text)
-        df = pd.read_csv(StringIO(r.decode("utf-8")))
+
+        # map nibrs codes to crimes and get monthly counts
+        df = to_matrix(counts, self.map)
+
+        return df.to_dict("records")
 
 
 MD0160400().run()
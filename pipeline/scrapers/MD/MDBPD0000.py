@@ -1,11 +1,8 @@
-import pandas as pd
-import requests
 import sys
 
-from io import StringIO
-
 sys.path.append("../../utils")
-from crimes import rtci_to_nibrs
+from arcgis import monthly_statistics
+from crimes import rtci_to_nibrs, to_matrix
 from super import Scraper
 
 
@@ -14,8 +11,8 @@ class MDBPD0000(Scraper):
         super().__init__()
         self.oris = ["MDBPD0000"]
         self.url = (
-            "https://services1.arcgis.com/UWYHeuuJISiGmgXx/arcgis/rest/services/NIBRS_GroupA_Crime_Data"
-            "/FeatureServer/replicafilescache/NIBRS_GroupA_Crime_Data_8914151926081121180.csv"
+            "https://services1.arcgis.com/UWYHeuuJISiGmgXx/arcgis/rest/services"
+            "/NIBRS_GroupA_Crime_Data/FeatureServer/0"
         )
         self.map = {
             k: v
@@ -27,27 +24,19 @@ class MDBPD0000(Scraper):
         }
 
     def scrape(self):
-        # get csv from source
-        r = requests.get(self.url).content
-        df = pd.read_csv(StringIO(r.decode("utf-8")), low_memory=False)[
-            ["CrimeDateTime", "CrimeCode", "Total_Incidents"]
-        ]
-        df["CrimeDateTime"] = pd.to_datetime(df["CrimeDateTime"])
-        df = df[df["CrimeCode"].isin(self.map)]
-        df["CrimeCode"] = df["CrimeCode"].map(self.map)
-        df["year"] = df["CrimeDateTime"].dt.year
-        df["month"] = df["CrimeDateTime"].dt.month
-        df = (
-            df.groupby(["year", "month", "CrimeCode"])["Total_Incidents"]
-            .sum()
-            .reset_index()
-            .rename(columns={"CrimeCode": "crime", "Total_Incidents": "count"})
+        # sum incidents per (local) month and crime code on the server
+        counts = monthly_statistics(
+            self.url,
+            date="CrimeDateTime",
+            category="CrimeCode",
+            first=self.first,
+            last=self.last,
+            statistics=[("sum", "Total_Incidents", "count")],
+            tz="America/New_York",
         )
-        df = df.pivot(
-            index=["year", "month"],
-            columns="crime",
-            values="count",
-        ).reset_index()
+
+        # map crime codes to crimes and get monthly counts
+        df = to_matrix(counts, self.map)
         return df.to_dict("records")
 
 
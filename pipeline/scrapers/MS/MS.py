@@ -20,11 +20,31 @@ from selenium_actions import (
     drag_element,
     hide_element,
     wait_for_element,
+    wait_for_idle,
 )
-from selenium_configs import chrome_driver
+from selenium_configs import chrome_driver, reset_driver
+from platforms.beyond2020 import Beyond2020, http_enabled, report_records
 from super import Scraper
 
 
+MAP = {
+    "Murder and Nonnegligent Manslaughter": "murder",
+    "All Rape": "rape",
+    "Aggravated Assault": "aggravated_assault",
+    "Burglary/Breaking & Entering": "burglary",
+    "Robbery": "robbery",
+    "Pocket-picking": "theft",
+    "Purse-snatching": "theft",
+    "Shoplifting": "theft",
+    "Theft From Building": "theft",
+    "Theft From Coin Operated Machine or Device": "theft",
+    "Theft From Motor Vehicle": "theft",
+    "Theft of Motor Vehicle Parts/Accessories": "theft",
+    "All Other Larceny": "theft",
+    "Motor Vehicle Theft": "motor_vehicle_theft",
+}
+
+
 class Mississippi(Scraper):
     def __init__(self):
         super().__init__()
@@ -37,22 +57,7 @@ class Mississippi(Scraper):
         self.exclude_oris = []
         self.agencies = self.get_agencies(self.exclude_oris)
         self.oris = list(self.agencies.values())
-        self.map = {
-            "Murder and Nonnegligent Manslaughter": "murder",
-            "All Rape": "rape",
-            "Aggravated Assault": "aggravated_assault",
-            "Burglary/Breaking & Entering": "burglary",
-            "Robbery": "robbery",
-            "Pocket-picking": "theft",
-            "Purse-snatching": "theft",
-            "Shoplifting": "theft",
-            "Theft From Building": "theft",
-            "Theft From Coin Operated Machine or Device": "theft",
-            "Theft From Motor Vehicle": "theft",
-            "Theft of Motor Vehicle Parts/Accessories": "theft",
-            "All Other Larceny": "theft",
-            "Motor Vehicle Theft": "motor_vehicle_theft",
-        }
+        self.map = MAP
 
     def scrape(self):
         self.driver.get(self.url)
@@ -62,7 +67,7 @@ class Mississippi(Scraper):
             self.driver.quit()
             r = requests.get(self.url)
             raise Exception(f"bad response ({r.status_code})")
-        sleep(3)
+        wait_for_idle(self)
 
         # get list of year, month and agency values from site
         soup = bS(self.driver.page_source, "lxml")
@@ -94,14 +99,14 @@ class Mississippi(Scraper):
                         self.click_report(agency, year, month)
                         soup = bS(self.driver.page_source, "lxml")
                         self.process_soup(soup, agency, year, month)
-                        sleep(1)
+                        wait_for_idle(self)
 
         # process and return records
         return self.process_records()
 
     def select_agency(self, agency):
         self.logger.info(f"attempting {agency}...")
-        sleep(3)
+        wait_for_idle(self)
         try:
             click_select_element_value(
                 self,
@@ -112,10 +117,8 @@ class Mississippi(Scraper):
             )
         except (NotImplementedError, TimeoutException):
             self.logger.warning("retrying...")
-            self.driver.quit()
             sleep(5)
-            self.driver = chrome_driver(self)
-            self.driver.get(self.url)
+            reset_driver(self)
             click_select_element_value(
                 self,
                 "select",
@@ -126,7 +129,7 @@ class Mississippi(Scraper):
 
     def select_year(self, agency, year):
         self.logger.info(f"attempting {year}...")
-        sleep(3)
+        wait_for_idle(self)
         try:
             click_select_element_value(
                 self,
@@ -137,10 +140,8 @@ class Mississippi(Scraper):
             )
         except (NotImplementedError, TimeoutException):
             self.logger.warning("retrying...")
-            self.driver.quit()
             sleep(5)
-            self.driver = chrome_driver(self)
-            self.driver.get(self.url)
+            reset_driver(self)
             self.select_agency(agency)
             click_select_element_value(
                 self,
@@ -152,7 +153,7 @@ class Mississippi(Scraper):
 
     def select_month(self, agency, year, month):
         self.logger.info(f"attempting {month}...")
-        sleep(3)
+        wait_for_idle(self)
         try:
             click_select_element_value(
                 self,
@@ -163,10 +164,8 @@ class Mississippi(Scraper):
             )
         except (NotImplementedError, TimeoutException):
             self.logger.warning("retrying...")
-            self.driver.quit()
             sleep(5)
-            self.driver = chrome_driver(self)
-            self.driver.get(self.url)
+            reset_driver(self)
             self.select_agency(agency)
             self.select_year(agency, year)
             click_select_element_value(
@@ -178,7 +177,7 @@ class Mississippi(Scraper):
             )
 
     def click_report(self, agency, year, month):
-        sleep(3)
+        wait_for_idle(self)
         try:
             click_element(
                 self,
@@ -195,14 +194,12 @@ class Mississippi(Scraper):
             )
         except TimeoutException:
             self.logger.warning("retrying...")
-            self.driver.quit()
             sleep(15)
-            self.driver = chrome_driver(self)
-            self.driver.get(self.url)
+            reset_driver(self)
             self.select_agency(agency)
             self.select_year(agency, year)
             self.select_month(agency, year, month)
-            sleep(3)
+            wait_for_idle(self)
             click_element(
                 self,
                 "input",
@@ -218,23 +215,7 @@ class Mississippi(Scraper):
             )
 
     def process_soup(self, soup, agency, year, month):
-        for field in self.map:
-            tds = soup.find_all("td", string=field)
-            assert len(tds) == 1
-            td = tds[0]
-            reported = int(td.find_next_sibling("td").text.strip())
-            cleared = int(
-                td.find_next_sibling("td").find_next_sibling("td").text.strip()
-            )
-            datum = {
-                "field": field,
-                "reported": reported,
-                "cleared": cleared,
-            }
-            tmp = {"ori": agency, "year": year, "month": month}
-            tmp.update(datum)
-            tmp["ori"] = tmp["ori"].replace("\xa0", " ").rsplit(" - ", 1)[-1]
-            self.records.append(tmp)
+        self.records.extend(report_records(soup, agency, year, month, self.map))
 
     def process_records(self):
         # relabel field names and sum components
@@ -283,4 +264,19 @@ class Mississippi(Scraper):
         return self.records.to_dict("records")
 
 
-Mississippi().run()
+class MississippiHttp(Beyond2020):
+    def __init__(self):
+        super().__init__()
+        self.url = (
+            "https://mscrimestats.dps.ms.gov/public/View/RSReport.aspx?ReportId=233"
+        )
+        self.exclude_oris = []
+        self.map = MAP
+
+
+# the http client of the report viewer (`platforms/beyond2020.py`) only runs
+# with `RTCI_BEYOND2020_HTTP=1`, until it has been validated against the live viewer
+if http_enabled():
+    MississippiHttp().run()
+else:
+    Mississippi().run()
@@ -20,11 +20,34 @@ from selenium_actions import (
     drag_element,
     hide_element,
     wait_for_element,
+    wait_for_idle,
 )
-from selenium_configs import chrome_driver
+from selenium_configs import chrome_driver, reset_driver
+from platforms.beyond2020 import Beyond2020, http_enabled, report_records
 from super import Scraper
 
 
+PERSON_MAP = {
+    "Murder and Nonnegligent Manslaughter": "murder",
+    "Aggravated Assault": "aggravated_assault",
+    "All Rape": "rape",
+}
+
+PROPERTY_MAP = {
+    "Burglary/Breaking & Entering": "burglary",
+    "Robbery": "robbery",
+    "Pocket-picking": "theft",
+    "Purse-snatching": "theft",
+    "Shoplifting": "theft",
+    "Theft From Building": "theft",
+    "Theft From Coin Operated Machine or Device": "theft",
+    "Theft From Motor Vehicle": "theft",
+    "Theft of Motor Vehicle Parts/Accessories": "theft",
+    "All Other Larceny": "theft",
+    "Motor Vehicle Theft": "motor_vehicle_theft",
+}
+
+
 class NorthDakota(Scraper):
     def __init__(self):
         super().__init__()
@@ -37,24 +60,8 @@ class NorthDakota(Scraper):
         self.exclude_oris = []
         self.agencies = self.get_agencies(self.exclude_oris)
         self.oris = list(self.agencies.values())
-        self.person_map = {
-            "Murder and Nonnegligent Manslaughter": "murder",
-            "Aggravated Assault": "aggravated_assault",
-            "All Rape": "rape",
-        }
-        self.property_map = {
-            "Burglary/Breaking & Entering": "burglary",
-            "Robbery": "robbery",
-            "Pocket-picking": "theft",
-            "Purse-snatching": "theft",
-            "Shoplifting": "theft",
-            "Theft From Building": "theft",
-            "Theft From Coin Operated Machine or Device": "theft",
-            "Theft From Motor Vehicle": "theft",
-            "Theft of Motor Vehicle Parts/Accessories": "theft",
-            "All Other Larceny": "theft",
-            "Motor Vehicle Theft": "motor_vehicle_theft",
-        }
+        self.person_map = PERSON_MAP
+        self.property_map = PROPERTY_MAP
 
     def scrape(self):
         self.driver.get(self.url)
@@ -64,7 +71,7 @@ class NorthDakota(Scraper):
             self.driver.quit()
             r = requests.get(self.url)
             raise Exception(f"bad response ({r.status_code})")
-        sleep(3)
+        wait_for_idle(self)
 
         # get list of year, month and agency values from site
         soup = bS(self.driver.page_source, "lxml")
@@ -96,14 +103,14 @@ class NorthDakota(Scraper):
                         self.click_report(agency, year, month)
                         soup = bS(self.driver.page_source, "lxml")
                         self.process_soup(soup, agency, year, month)
-                        sleep(1)
+                        wait_for_idle(self)
 
         # process and return records
         return self.process_records()
 
     def select_agency(self, agency):
         self.logger.info(f"attempting {agency}...")
-        sleep(3)
+        wait_for_idle(self)
         try:
             click_select_element_value(
                 self,
@@ -114,10 +121,8 @@ class NorthDakota(Scraper):
             )
         except (NotImplementedError, TimeoutException):
             self.logger.warning("retrying...")
-            self.driver.quit()
             sleep(5)
-            self.driver = chrome_driver(self)
-            self.driver.get(self.url)
+            reset_driver(self)
             click_select_element_value(
                 self,
                 "select",
@@ -128,7 +133,7 @@ class NorthDakota(Scraper):
 
     def select_year(self, agency, year):
         self.logger.info(f"attempting {year}...")
-        sleep(3)
+        wait_for_idle(self)
         try:
             click_select_element_value(
                 self,
@@ -139,10 +144,8 @@ class NorthDakota(Scraper):
             )
         except (NotImplementedError, TimeoutException):
             self.logger.warning("retrying...")
-            self.driver.quit()
             sleep(5)
-            self.driver = chrome_driver(self)
-            self.driver.get(self.url)
+            reset_driver(self)
             self.select_agency(agency)
             click_select_element_value(
                 self,
@@ -154,7 +157,7 @@ class NorthDakota(Scraper):
 
     def select_month(self, agency, year, month):
         self.logger.info(f"attempting {month}...")
-        sleep(3)
+        wait_for_idle(self)
         try:
             click_select_element_value(
                 self,
@@ -165,10 +168,8 @@ class NorthDakota(Scraper):
             )
         except (NotImplementedError, TimeoutException):
             self.logger.warning("retrying...")
-            self.driver.quit()
             sleep(5)
-            self.driver = chrome_driver(self)
-            self.driver.get(self.url)
+            reset_driver(self)
             self.select_agency(agency)
             self.select_year(agency, year)
             click_select_element_value(
@@ -180,7 +181,7 @@ class NorthDakota(Scraper):
             )
 
     def click_report(self, agency, year, month):
-        sleep(3)
+        wait_for_idle(self)
         try:
             click_element(
                 self,
@@ -197,14 +198,12 @@ class NorthDakota(Scraper):
             )
         except TimeoutException:
             self.logger.warning("retrying...")
-            self.driver.quit()
             sleep(15)
-            self.driver = chrome_driver(self)
-            self.driver.get(self.url)
+            reset_driver(self)
             self.select_agency(agency)
             self.select_year(agency, year)
             self.select_month(agency, year, month)
-            sleep(3)
+            wait_for_idle(self)
             click_element(
                 self,
                 "input",
@@ -222,42 +221,14 @@ class NorthDakota(Scraper):
     def process_soup(self, soup, agency, year, month):
         # for crimes against persons values appear in two separate tables,
         # so we have to handle separately
-        for field in self.person_map:
-            tds = soup.find_all("td", string=field)
-            assert len(tds) == 2
-            td = tds[1]
-            reported = int(td.find_next_sibling("td").text.strip())
-            cleared = int(
-                td.find_next_sibling("td").find_next_sibling("td").text.strip()
-            )
-            datum = {
-                "field": field,
-                "reported": reported,
-                "cleared": cleared,
-            }
-            tmp = {"ori": agency, "year": year, "month": month}
-            tmp.update(datum)
-            tmp["ori"] = tmp["ori"].replace("\xa0", " ").rsplit(" - ", 1)[-1]
-            self.records.append(tmp)
+        self.records.extend(
+            report_records(soup, agency, year, month, self.person_map, occurrences=2)
+        )
 
         # crimes against property appear only once
-        for field in self.property_map:
-            tds = soup.find_all("td", string=field)
-            assert len(tds) == 1
-            td = tds[0]
-            reported = int(td.find_next_sibling("td").text.strip())
-            cleared = int(
-                td.find_next_sibling("td").find_next_sibling("td").text.strip()
-            )
-            datum = {
-                "field": field,
-                "reported": reported,
-                f"cleared": cleared,
-            }
-            tmp = {"ori": agency, "year": year, "month": month}
-            tmp.update(datum)
-            tmp["ori"] = tmp["ori"].replace("\xa0", " ").rsplit(" - ", 1)[-1]
-            self.records.append(tmp)
+        self.records.extend(
+            report_records(soup, agency, year, month, self.property_map)
+        )
 
     def process_records(self):
         # relabel field names and sum components
@@ -308,4 +279,26 @@ class NorthDakota(Scraper):
         return self.records.to_dict("records")
 
 
-NorthDakota().run()
+class NorthDakotaHttp(Beyond2020):
+    def __init__(self):
+        super().__init__()
+        self.url = "https://crimestats.nd.gov/public/View/RSReport.aspx?ReportId=94"
+        self.exclude_oris = []
+        self.person_map = PERSON_MAP
+        self.property_map = PROPERTY_MAP
+        self.map = self.person_map | self.property_map
+
+    def process_soup(self, soup, agency, year, month):
+        # for crimes against persons values appear in two separate tables,
+        # so we have to handle separately
+        return report_records(
+            soup, agency, int(year), month, self.person_map, occurrences=2
+        ) + report_records(soup, agency, int(year), month, self.property_map)
+
+
+# the http client of the report viewer (`platforms/beyond2020.py`) only runs
+# with `RTCI_BEYOND2020_HTTP=1`, until it has been validated against the live viewer
+if http_enabled():
+    NorthDakotaHttp().run()
+else:
+    NorthDakota().run()
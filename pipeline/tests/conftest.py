@@ -0,0 +1,17 @@
+import os
+import sys
+
+
+"""
+Shared pytest setup. Pipeline scripts import their shared modules by directory
+(`sys.path.append("../utils")`, relative to where they are run), so the tests
+put those directories on the path instead. Run from `pipeline/` with
+`python -m pytest tests`.
+"""
+
+
+PIPELINE = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+for directory in ["agencies", "qc", "ops", "utils", "utils/platforms"]:
+    sys.path.insert(0, os.path.join(PIPELINE, directory))
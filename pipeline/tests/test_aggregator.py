@@ -0,0 +1,90 @@
+import logging
+import numpy as np
+import pandas as pd
+
+from aggregator import Aggregator
+
+
+def panel(ori, months, value, last_updated=1):
+    return pd.DataFrame(
+        [
+            {
+                "ori": ori,
+                "year": year,
+                "month": month,
+                "murder": value,
+                "murder_cleared": value,
+                "last_updated": last_updated,
+            }
+            for year, month in months
+        ]
+    )
+
+
+def aggregator(agg, manifest):
+    a = Aggregator.__new__(Aggregator)
+    a.logger = logging.getLogger()
+    a.agg = agg
+    a.manifest_cols = ["ori", "key", "etag", "last_modified"]
+    a.get_manifest = lambda: pd.DataFrame(manifest, columns=a.manifest_cols)
+    return a
+
+
+def test_upsert_updates_existing_months_and_appends_later_ones():
+    agg = panel("A", [(2024, 11), (2024, 12)], 1.0)
+    new = panel("A", [(2024, 10), (2024, 12), (2025, 1)], 2.0, last_updated=2)
+
+    out = Aggregator.upsert(agg, new).sort_values(["year", "month"])
+
+    # months before the latest aggregated month are only updated, never added
+    assert list(zip(out["year"], out["month"])) == [(2024, 11), (2024, 12), (2025, 1)]
+    assert list(out["murder"]) == [1.0, 2.0, 2.0]
+    assert list(out["last_updated"]) == [1, 2, 2]
+
+
+def test_upsert_keeps_existing_values_where_new_ones_are_missing():
+    agg = panel("A", [(2024, 12)], 1.0)
+    new = panel("A", [(2024, 12)], np.nan, last_updated=2)
+
+    out = Aggregator.upsert(agg, new)
+
+    assert out["murder"].tolist() == [1.0]
+    assert out["last_updated"].tolist() == [2]
+
+
+def test_upsert_appends_all_months_of_new_agencies():
+    agg = panel("A", [(2024, 12)], 1.0)
+    new = pd.concat(
+        [panel("A", [(2025, 1)], 2.0), panel("B", [(2020, 1), (2020, 2)], 3.0)],
+        ignore_index=True,
+    )
+
+    out = Aggregator.upsert(agg, new)
+
+    assert sorted(out["ori"]) == ["A", "A", "B", "B"]
+    assert out[out["ori"] == "B"]["murder"].tolist() == [3.0, 3.0]
+
+
+def test_get_changed_selects_new_modified_and_unaggregated_snapshots():
+    files = [
+        {"key": "scrapes/TX/A/1.json", "etag": "a"},
+        {"key": "scrapes/TX/B/2.json", "etag": "b"},
+        {"key": "scrapes/TX/C/3.json", "etag": "c"},
+        {"key": "scrapes/TX/D/4.json", "etag": "d"},
+        {"key": "scrapes/TX/E/5.json", "etag": "e"},
+    ]
+    manifest = [
+        # unchanged
+        {"ori": "A", "key": "scrapes/TX/A/1.json", "etag": "a"},
+        # newer snapshot
+        {"ori": "B", "key": "scrapes/TX/B/1.json", "etag": "b"},
+        # same key, rewritten
+        {"ori": "C", "key": "scrapes/TX/C/3.json", "etag": "old"},
+        # unchanged, but missing from the aggregate
+        {"ori": "E", "key": "scrapes/TX/E/5.json", "etag": "e"},
+    ]
+    agg = pd.concat([panel(ori, [(2024, 12)], 1.0) for ori in "ABCD"])
+
+    changed = aggregator(agg, manifest).get_changed(files)
+
+    assert [f["key"].split("/")[2] for f in changed] == ["B", "C", "D", "E"]
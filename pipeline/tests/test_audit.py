@@ -0,0 +1,46 @@
+import logging
+import os
+import pandas as pd
+
+from argparse import Namespace
+from datetime import datetime as dt
+from datetime import timedelta as td
+
+import audit
+
+from conftest import FIXTURES
+
+
+"""
+`expected.csv` holds the flags per ori that the per-ori audit loop (replaced by
+the rule table) produced for `aggregated.csv`, which has a few agencies
+failing each rule.
+"""
+
+
+def test_run_flags_each_ori_by_its_first_failed_rule(monkeypatch):
+    snapshots = list()
+    monkeypatch.setattr(audit, "create_logger", logging.getLogger)
+    monkeypatch.setattr(audit, "pull_sheet", lambda **kwargs: None)
+    monkeypatch.setattr(
+        audit,
+        "read_df",
+        lambda path: pd.read_csv(os.path.join(FIXTURES, "audit", "aggregated.csv")),
+    )
+    monkeypatch.setattr(
+        audit, "snapshot_df", lambda **kwargs: snapshots.append(kwargs["df"])
+    )
+
+    auditor = audit.Auditor(Namespace(test=False))
+    auditor.last = dt(2025, 8, 31, 23, 59, 59, 999999)
+    auditor.first = auditor.last - td(days=365)
+    auditor.max_year = auditor.last.year
+    auditor.max_month = auditor.last.month
+    auditor.run()
+
+    flags = snapshots[0].drop_duplicates("ori")[["ori"] + auditor.removal_cols]
+    expected = pd.read_csv(os.path.join(FIXTURES, "audit", "expected.csv"))
+    pd.testing.assert_frame_equal(
+        flags.reset_index(drop=True).astype({c: float for c in auditor.removal_cols}),
+        expected,
+    )
@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from argparse import Namespace
+from datetime import datetime as dt
+from datetime import timedelta as td
+from datetime import timezone
+from email.utils import format_datetime
+
+import cde_get_data
+from cde_get_data import CdeGetData
+
+
+class Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def cde(tmp_path, **args):
+    c = CdeGetData.__new__(CdeGetData)
+    c.args = Namespace(
+        **{
+            "test": True,
+            "first": "01-2024",
+            "threads": 2,
+            "incremental": False,
+            "window": 12,
+            "rotation": 3,
+        }
+        | args
+    )
+    c.logger = logging.getLogger()
+    c.last = "03-2024"
+    c.crimes = {"HOM": "murder", "ROB": "robbery"}
+    c.url = "https://cde/{}/{}?from={}&to={}"
+    c.checkpoints = str(tmp_path)
+    c.history_path = os.path.join(c.checkpoints, "history")
+    c.history = None
+    c.starts = dict()
+    return c
+
+
+def actuals(months, value):
+    """
+    a CDE API response with the same count and clearance in every month
+    """
+    return {
+        "offenses": {
+            "actuals": {
+                "Agency Offenses": {month: value for month in months},
+                "Agency Clearances": {month: value for month in months},
+            }
+        }
+    }
+
+
+def test_scrape_resumes_from_checkpointed_oris(tmp_path, monkeypatch):
+    oris = pd.DataFrame({"ori": ["TX0020000", "TX0010000"], "state": ["TX", "TX"]})
+    monkeypatch.setattr(cde_get_data.http_cache, "read_csv", lambda url: oris)
+    c = cde(tmp_path)
+    urls = list()
+
+    def get_json(url):
+        urls.append(url)
+        return actuals(["01-2024", "02-2024", "03-2024"], len(urls))
+
+    c.get_json = get_json
+
+    # an interrupted earlier run already finished one ori
+    c.process_ori({"ori": "TX0010000", "state": "TX"}, c.get_schema(oris))
+    urls.clear()
+    before = pq.read_table(c.checkpoint_path("TX0010000"))
+
+    c.scrape()
+
+    assert sorted(url.split("/")[3] for url in urls) == ["TX0020000"] * 2
+    assert pq.read_table(c.checkpoint_path("TX0010000")).equals(before)
+    assert pq.read_table(c.checkpoint_path("TX0020000")).num_rows == 3
+
+
+def test_process_ori_checkpoints_merged_counts_and_clearances(tmp_path):
+    oris = pd.DataFrame({"ori": ["TX0010000"], "state": ["TX"]})
+    c = cde(tmp_path)
+    c.get_json = lambda url: actuals(["02-2024", "01-2024"], 4.0)
+
+    c.process_ori({"ori": "TX0010000", "state": "TX"}, c.get_schema(oris))
+
+    checkpoint = pq.read_table(c.checkpoint_path("TX0010000")).to_pylist()
+    assert [(r["year"], r["month"]) for r in checkpoint] == [(2024, 1), (2024, 2)]
+    assert checkpoint[0]["murder"] == checkpoint[0]["robbery_clearance"] == 4.0
+    assert checkpoint[0]["ori"] == "TX0010000"
+    assert not os.path.exists(c.checkpoint_path("TX0010000") + ".tmp")
+
+
+def test_retry_after_reads_seconds_and_dates_or_backs_off():
+    later = format_datetime(dt.now(timezone.utc) + td(seconds=30))
+
+    assert CdeGetData.retry_after(Response({"Retry-After": "7"}), 0) == 7
+    assert 25 < CdeGetData.retry_after(Response({"Retry-After": later}), 0) <= 30
+    assert CdeGetData.retry_after(Response({"Retry-After": "soon"}), 1) == 4
+    assert CdeGetData.retry_after(Response(dict()), 2) == 8
+
+
+def test_get_history_sets_window_starts_except_for_the_rotation_share(tmp_path):
+    oris = pd.DataFrame({"ori": ["TX0010000", "TX0020000", "CA0010000", "NY0010000"]})
+    c = cde(tmp_path, incremental=True, first="01-2020")
+    c.last = "09-2025"
+    copies = list()
+
+    def copy_history(df, schema, first):
+        copies.append(first)
+        os.makedirs(c.history_path)
+        return {
+            "TX0010000": 2025 * 12 + 7,
+            "TX0020000": 2020 * 12 + 3,
+            "CA0010000": 2025 * 12 + 7,
+        }
+
+    c.copy_history = copy_history
+    c.get_history(oris, c.get_schema(oris))
+
+    # CA0010000 falls in this month's share of the 3-run rotation (crc32 % 3 == 0),
+    # so it is fully re-requested like NY0010000, which has no stored history
+    assert copies == [dt(2020, 1, 1)]
+    assert c.starts == {"TX0010000": 2024 * 12 + 8, "TX0020000": 2020 * 12}
+    with open(os.path.join(c.checkpoints, "starts.json")) as f:
+        assert json.load(f) == c.starts
+
+
+def test_get_history_reuses_the_copy_of_an_interrupted_run(tmp_path):
+    oris = pd.DataFrame({"ori": ["TX0010000"]})
+    c = cde(tmp_path, incremental=True)
+    os.makedirs(c.history_path)
+    with open(os.path.join(c.checkpoints, "starts.json"), "w") as f:
+        json.dump({"TX0010000": 2024 * 12}, f)
+
+    def copy_history(df, schema, first):
+        raise AssertionError("history copied again")
+
+    c.copy_history = copy_history
+    c.get_history(oris, c.get_schema(oris))
+
+    assert c.starts == {"TX0010000": 2024 * 12}
+
+
+def test_process_ori_requests_the_window_and_prepends_stored_history(tmp_path):
+    oris = pd.DataFrame({"ori": ["TX0010000"], "state": ["TX"]})
+    c = cde(tmp_path, incremental=True)
+    schema = c.get_schema(oris)
+
+    # the stored history copy, as `copy_history` writes it (one ori is outside the run)
+    columns = [pa.field("ori", pa.string())] + [
+        f for f in schema if f.name not in oris.columns and f.name != "last_updated"
+    ]
+    stored = pd.DataFrame(
+        {
+            "ori": ["TX0010000"] * 3 + ["TX0020000"],
+            "year": [2023, 2023, 2024, 2023],
+            "month": [11, 12, 1, 12],
+            "murder": [1.0, 2.0, 3.0, 4.0],
+        }
+    ).reindex(columns=[f.name for f in columns])
+    ds.write_dataset(
+        pa.Table.from_pandas(stored, schema=pa.schema(columns), preserve_index=False),
+        c.history_path,
+        format="parquet",
+        partitioning=["year"],
+        partitioning_flavor="hive",
+    )
+    with open(os.path.join(c.checkpoints, "starts.json"), "w") as f:
+        json.dump({"TX0010000": 2024 * 12}, f)
+    c.get_history(oris, schema)
+    urls = list()
+
+    def get_json(url):
+        urls.append(url)
+        return actuals(["01-2024", "02-2024", "03-2024"], 9.0)
+
+    c.get_json = get_json
+    c.process_ori({"ori": "TX0010000", "state": "TX"}, schema)
+
+    checkpoint = pq.read_table(c.checkpoint_path("TX0010000")).to_pandas()
+    assert all("from=01-2024&" in url for url in urls)
+    assert list(zip(checkpoint["year"], checkpoint["month"])) == [
+        (2023, 11),
+        (2023, 12),
+        (2024, 1),
+        (2024, 2),
+        (2024, 3),
+    ]
+    assert checkpoint["murder"].tolist() == [1.0, 2.0, 9.0, 9.0, 9.0]
+    assert checkpoint["state"].tolist() == ["TX"] * 5
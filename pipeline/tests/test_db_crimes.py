@@ -0,0 +1,49 @@
+import json
+import os
+import pandas as pd
+
+from datetime import datetime as dt
+
+from conftest import FIXTURES
+from db_crimes import SiteCrimes
+
+
+"""
+`expected.csv` was produced from the same inputs by the per-geography
+implementation (`prepare_one_geography`) that `get_totals` and friends replaced.
+"""
+
+
+def site_crimes():
+    s = SiteCrimes.__new__(SiteCrimes)
+    s.start = dt(2017, 1, 1)
+    s.end = dt(2020, 8, 1)
+    s.map = {
+        "violent": "violent",
+        "murder": "murder",
+        "rape": "rape",
+        "robbery": "robbery",
+        "aggravated_assault": "assault",
+        "property": "property",
+        "burglary": "burglary",
+        "theft": "theft",
+        "motor_vehicle_theft": "motor",
+    }
+    s.agg = pd.read_csv(os.path.join(FIXTURES, "db_crimes", "aggregated.csv"))
+    with open(os.path.join(FIXTURES, "db_crimes", "geographies_included.json")) as f:
+        s.geographies_included = json.load(f)
+    return s
+
+
+def test_totals_ytds_rolls_and_deltas_match_per_geography_results():
+    s = site_crimes()
+
+    totals = s.get_totals()
+    totals = s.get_ytds(totals)
+    totals = s.get_rolls(totals)
+    results = s.get_deltas(totals).drop(columns=["geography"])
+
+    expected = pd.read_csv(os.path.join(FIXTURES, "db_crimes", "expected.csv"))
+    pd.testing.assert_frame_equal(
+        results.reset_index(drop=True), expected, check_dtype=False
+    )
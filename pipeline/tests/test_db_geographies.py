@@ -0,0 +1,44 @@
+import json
+import numpy as np
+import os
+import pandas as pd
+
+from datetime import datetime as dt
+
+from conftest import FIXTURES
+from db_geographies import SiteGeographies
+
+
+"""
+`expected.json` was produced from the same agencies by the per-geography loop
+that the grouped `aggregate_geographies` replaced.
+"""
+
+
+def site_geographies():
+    s = SiteGeographies.__new__(SiteGeographies)
+    s.start = dt(2017, 1, 1)
+    s.end = dt(2025, 8, 1)
+    s.pop_bins = {
+        "all": (0, np.inf, ""),
+        "sm": (0, 99_999, " (Agencies of <100k)"),
+        "md": (100_000, 249_999, " (Agencies of 100k-250k)"),
+        "lg": (250_000, 999_999, " (Agencies of 250k-1m)"),
+        "xl": (1_000_000, np.inf, " (Agencies of 1m+)"),
+    }
+    s.order = ["state", "division", "region", "nation"]
+    s.oris = pd.read_csv(
+        os.path.join(FIXTURES, "db_geographies", "oris.csv"),
+        parse_dates=["start", "end"],
+    )
+    return s
+
+
+def test_aggregate_geographies_matches_per_geography_results():
+    with open(os.path.join(FIXTURES, "db_geographies", "expected.json")) as f:
+        expected = json.load(f)
+
+    aggregates = site_geographies().aggregate_geographies()
+
+    records = aggregates[list(expected[0])].to_dict("records")
+    assert records == expected
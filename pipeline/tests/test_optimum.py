@@ -0,0 +1,49 @@
+from optimum import Optimum
+
+
+def optimum():
+    o = Optimum.__new__(Optimum)
+    o.crimes = {"murder": list(), "theft": list()}
+    return o
+
+
+def test_merge_series_joins_each_agencys_crimes_by_date():
+    series = [
+        {"ori": "A", "crime": "theft", "dates": ["2024-01", "2024-02"], "data": [5, 6]},
+        {"ori": "B", "crime": "murder", "dates": ["2024-01"], "data": [7]},
+        {
+            "ori": "A",
+            "crime": "murder",
+            "dates": ["2024-01", "2024-02"],
+            "data": [1, 2],
+        },
+        {"ori": "B", "crime": "theft", "dates": ["2024-01"], "data": [8]},
+    ]
+
+    records = optimum().merge_series(series)
+
+    assert records == [
+        {"date": "2024-01", "murder": 1, "theft": 5, "ori": "A"},
+        {"date": "2024-02", "murder": 2, "theft": 6, "ori": "A"},
+        {"date": "2024-01", "murder": 7, "theft": 8, "ori": "B"},
+    ]
+
+
+def test_merge_series_keeps_only_dates_reported_for_every_crime():
+    series = [
+        {
+            "ori": "A",
+            "crime": "murder",
+            "dates": ["2024-01", "2024-02"],
+            "data": [1, 2],
+        },
+        {"ori": "A", "crime": "theft", "dates": ["2024-02"], "data": [6]},
+    ]
+
+    assert optimum().merge_series(series) == [
+        {"date": "2024-02", "murder": 2, "theft": 6, "ori": "A"}
+    ]
+
+
+def test_merge_series_without_results_is_empty():
+    assert optimum().merge_series(None) == []
@@ -0,0 +1,92 @@
+import parallelize
+import threading
+
+from parallelize import AdaptiveLimiter, TokenBucket
+
+
+class Clock:
+    """
+    stands in for `monotonic` and `sleep`, advancing only when slept on
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = list()
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_allows_a_burst_then_the_sustained_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(parallelize, "monotonic", clock.monotonic)
+    monkeypatch.setattr(parallelize, "sleep", clock.sleep)
+    bucket = TokenBucket(rate=2, capacity=3)
+
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.slept == []
+
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.slept == [0.5, 0.5]
+
+
+def test_token_bucket_refills_up_to_capacity_while_idle(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(parallelize, "monotonic", clock.monotonic)
+    monkeypatch.setattr(parallelize, "sleep", clock.sleep)
+    bucket = TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        bucket.acquire()
+
+    clock.now += 60
+    for _ in range(4):
+        bucket.acquire()
+
+    assert clock.slept == [0.5]
+
+
+def test_adaptive_limiter_halves_on_overload_and_grows_after_a_window():
+    limiter = AdaptiveLimiter(8, minimum=3, maximum=9, window=2)
+
+    limiter.acquire()
+    limiter.release(overloaded=True)
+    assert limiter.limit == 4
+    limiter.acquire()
+    limiter.release(overloaded=True)
+    assert limiter.limit == 3
+
+    # an overload restarts the count of healthy calls
+    for overloaded in [False, True, False, False, False, False]:
+        limiter.acquire()
+        limiter.release(overloaded)
+    assert limiter.limit == 5
+
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.limit == 9
+    assert limiter.active == 0
+
+
+def test_adaptive_limiter_blocks_callers_beyond_the_limit():
+    limiter = AdaptiveLimiter(1)
+    limiter.acquire()
+    acquired = threading.Event()
+
+    def worker():
+        limiter.acquire()
+        acquired.set()
+
+    t = threading.Thread(target=worker)
+    t.start()
+    assert not acquired.wait(0.2)
+
+    limiter.release()
+    assert acquired.wait(5)
+    t.join()
@@ -0,0 +1,17 @@
+import numpy as np
+
+from rollups import membership_matrix, rollup
+
+
+def test_membership_matrix_ignores_unknown_and_repeated_members():
+    matrix = membership_matrix([["A", "B", "B"], ["C", "X"], []], ["A", "B", "C"])
+
+    assert matrix.toarray().tolist() == [[1, 1, 0], [0, 0, 1], [0, 0, 0]]
+
+
+def test_rollup_sums_member_rows_treating_missing_as_zero():
+    matrix = membership_matrix([["A", "C"], ["B"]], ["A", "B", "C"])
+    values = np.array([[1.0, 2.0], [np.nan, 5.0], [3.0, np.nan]])
+
+    assert rollup(matrix, values).tolist() == [[4.0, 2.0], [0.0, 5.0]]
+    assert rollup(matrix, [10, 20, 30]).tolist() == [40.0, 20.0]
@@ -0,0 +1,48 @@
+import json
+import os
+import pandas as pd
+
+from datetime import datetime as dt
+
+from conftest import FIXTURES
+from crimes import rtci_to_nibrs
+from super import Scraper
+
+
+"""
+`expected.json` was produced from `records.json` by the per-value
+`check_for_comma` normalization that `Scraper.to_numeric` replaced.
+"""
+
+
+def scraper():
+    s = Scraper.__new__(Scraper)
+    s.first = dt(2017, 1, 1)
+    s.last = dt(2021, 12, 31)
+    s.oris = ["A", "B"]
+    s.crimes = rtci_to_nibrs
+    s.run_time = 1735689600
+    return s
+
+
+def test_process_matches_per_value_normalization():
+    with open(os.path.join(FIXTURES, "super", "records.json")) as f:
+        records = [dict(r, date=pd.Timestamp(r["date"])) for r in json.load(f)]
+    with open(os.path.join(FIXTURES, "super", "expected.json")) as f:
+        expected = json.load(f)
+
+    s = scraper()
+    processed = s.process(records)
+
+    assert json.loads(processed.to_json(orient="records")) == expected
+    assert (s.collected_earliest, s.collected_latest) == ("2018-01", "2021-09")
+
+
+def test_to_numeric_strips_separators_and_treats_blanks_as_missing():
+    col = pd.Series(["1,234", "", " 3 ", None, 5])
+
+    out = Scraper.to_numeric(col)
+
+    assert out.dtype == float
+    assert out.isna().tolist() == [False, True, False, True, False]
+    assert out.dropna().tolist() == [1234.0, 3.0, 5.0]
@@ -0,0 +1,171 @@
+import json
+import pandas as pd
+
+from datetime import datetime as dt
+from datetime import timezone
+from dateutil.relativedelta import relativedelta
+from zoneinfo import ZoneInfo
+
+from parallelize import thread
+from requests_configs import mount_session
+
+
+"""
+A small client for ArcGIS feature layers (`.../FeatureServer/<layer>`), used by
+scrapers of city open data incident layers.
+
+Instead of downloading every incident (csv exports, `createReplica`) and
+counting them in pandas, `monthly_statistics` asks the server for statistics
+(`outStatistics` grouped by an offense code field via
+`groupByFieldsForStatistics`), one query per calendar month, with the month
+partitions run concurrently. Each query returns one row per offense code,
+paged with `resultOffset` in steps of the layer's `maxRecordCount` when
+needed. `features` pages through raw rows the same way, for layers whose date
+field cannot be filtered by timestamp. `crimes.to_matrix` then maps offense
+codes to crimes and pivots to the monthly crime table.
+
+Month boundaries are in UTC (how hosted layers store dates) unless a `tz` is
+given, e.g. `tz="America/New_York"` to count by local month (across daylight
+saving time) on layers of an Eastern time agency.
+"""
+
+
+_session = None
+
+
+def get_session():
+    global _session
+    if _session is None:
+        _session = mount_session()
+    return _session
+
+
+def request(url, params):
+    """
+    posts a request to an arcgis rest endpoint and returns its json,
+    raising on errors reported in the (http 200) response body
+    """
+    r = get_session().post(url, data={"f": "json", **params})
+    r.raise_for_status()
+    j = r.json()
+    if "error" in j:
+        raise ValueError(f"arcgis error from {url}: {j['error']}")
+    return j
+
+
+def layer_info(url):
+    """
+    returns the layer description (fields, maxRecordCount, ...) of a feature layer url
+    """
+    return request(url, dict())
+
+
+def find_field(info, *names):
+    """
+    returns the name of the first of `names` that is a field of the layer,
+    matched case-insensitively (field names differ in case between layer versions)
+    """
+    fields = {f["name"].lower(): f["name"] for f in info["fields"]}
+    for name in names:
+        if name.lower() in fields:
+            return fields[name.lower()]
+    raise KeyError(f"none of {names} found in layer fields")
+
+
+def paged(url, params, page_size):
+    """
+    runs a layer query, following `resultOffset` while the server reports
+    that its transfer limit was exceeded, and returns all feature attributes
+    """
+    rows, offset = list(), 0
+    while True:
+        j = request(
+            f"{url}/query",
+            {**params, "resultOffset": offset, "resultRecordCount": page_size},
+        )
+        rows.extend(f["attributes"] for f in j["features"])
+        if not j.get("exceededTransferLimit") or not j["features"]:
+            return rows
+        offset += len(j["features"])
+
+
+def features(url, fields, where="1=1"):
+    """
+    returns the attributes of all features matching `where`, restricted to `fields`
+    """
+    page_size = layer_info(url).get("maxRecordCount") or 1_000
+    return paged(
+        url,
+        {"where": where, "outFields": ",".join(fields), "returnGeometry": "false"},
+        page_size,
+    )
+
+
+def monthly_statistics(
+    url, date, category, first, last, where=None, statistics=None, tz=None, threads=8
+):
+    """
+    returns a (year, month, category, <statistics>) table of per month statistics
+    grouped by the `category` field, for months from `first` to `last`;
+    `statistics` is a list of (statisticType, field, name) tuples
+    (by default, a count of features as `count`) and months start at midnight
+    in the time zone `tz` (by default, utc)
+    """
+    statistics = statistics or [("count", category, "count")]
+    page_size = layer_info(url).get("maxRecordCount") or 1_000
+    out_statistics = json.dumps(
+        [
+            {"statisticType": s, "onStatisticField": f, "outStatisticFieldName": n}
+            for s, f, n in statistics
+        ]
+    )
+
+    # one partition per calendar month in range
+    months = list()
+    month = dt(first.year, first.month, 1)
+    while month <= last:
+        months.append(month)
+        month += relativedelta(months=1)
+
+    def utc(time):
+        if tz is None:
+            return time
+        local = time.replace(tzinfo=ZoneInfo(tz))
+        return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+    def get_month(month):
+        start = utc(month)
+        end = utc(month + relativedelta(months=1))
+        clause = (
+            f"{date} >= timestamp '{start:%Y-%m-%d %H:%M:%S}' "
+            f"AND {date} < timestamp '{end:%Y-%m-%d %H:%M:%S}'"
+        )
+        if where:
+            clause = f"({where}) AND {clause}"
+        rows = paged(
+            url,
+            {
+                "where": clause,
+                "outStatistics": out_statistics,
+                "groupByFieldsForStatistics": category,
+            },
+            page_size,
+        )
+
+        # attribute names come back in the layer's own case
+        records = list()
+        for row in rows:
+            row = {k.lower(): v for k, v in row.items()}
+            record = {
+                "year": month.year,
+                "month": month.month,
+                "category": row[category.lower()],
+            }
+            record.update({n: row[n.lower()] for _, _, n in statistics})
+            records.append(record)
+        return records
+
+    records = thread(get_month, months, threads=threads) or list()
+    return pd.DataFrame(
+        records, columns=["year", "month", "category"] + [n for _, _, n in statistics]
+    )
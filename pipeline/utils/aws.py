@@ -1,10 +1,24 @@
 import boto3
+import gzip
 import json
+import operator
 import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import tempfile
+import threading
 
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from pympler import asizeof
+from io import BytesIO
+from pyarrow import fs
+
+import http_cache
+from parallelize import TokenBucket
 
 
 load_dotenv()
@@ -13,30 +27,167 @@ load_dotenv()
 aws_access_key_id = os.getenv("AWS_ACCESS_KEY_ID")
 aws_secret_access_key = os.getenv("AWS_SECRET_ACCESS_KEY")
 BUCKET = "rtci"
+BUCKET_URL = f"https://{BUCKET}.s3.us-east-1.amazonaws.com/"
+
+# process-wide s3 clients (keyed by pid so forked workers never share one)
+_shared_clients = dict()
+_shared_lock = threading.Lock()
+
+# types of hive partition columns used for parquet datasets (otherwise inferred as int32)
+PARTITION_TYPES = {"state": pa.string(), "year": pa.int64()}
+
+# csv fallback equivalents of pyarrow filter operators
+FILTER_OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda s, v: s.isin(v),
+}
+
+# uploads larger than this are sent as concurrent multipart uploads
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=8,
+)
 
 
 def get_s3_client():
-    config = Config(connect_timeout=60 * 10, retries={"max_attempts": 5})
-    return boto3.client(
-        "s3",
-        config=config,
-        region_name="us-east-1",
-        aws_access_key_id=aws_access_key_id,
-        aws_secret_access_key=aws_secret_access_key,
+    # boto3 clients are thread-safe, so every helper in this process shares one
+    # client and its (keep-alive) connection pool instead of building one per call
+    pid = os.getpid()
+    with _shared_lock:
+        if pid not in _shared_clients:
+            config = Config(
+                connect_timeout=60 * 10,
+                retries={"max_attempts": 5, "mode": "adaptive"},
+                max_pool_connections=50,
+                tcp_keepalive=True,
+            )
+            _shared_clients.clear()
+            _shared_clients[pid] = boto3.client(
+                "s3",
+                config=config,
+                region_name="us-east-1",
+                aws_access_key_id=aws_access_key_id,
+                aws_secret_access_key=aws_secret_access_key,
+            )
+        return _shared_clients[pid]
+
+
+def get_arrow_fs():
+    return fs.S3FileSystem(
+        access_key=aws_access_key_id,
+        secret_key=aws_secret_access_key,
+        region="us-east-1",
     )
 
 
-def list_files(prefix=""):
+def read_df(path, columns=None, filters=None, partition_cols=None):
+    """
+    reads a table published with `snapshot_parquet` (e.g. `data/aggregated`),
+    preferring its typed parquet copy so only the requested columns and the
+    row groups/partitions matching `filters` are downloaded, and falling back
+    to the csv copy of the same table if no parquet copy exists
+    """
+    try:
+        if partition_cols:
+            table = pq.read_table(
+                f"{BUCKET}/{path}.parquet",
+                filesystem=get_arrow_fs(),
+                columns=columns,
+                filters=filters,
+                partitioning=ds.partitioning(
+                    pa.schema([(c, PARTITION_TYPES[c]) for c in partition_cols]),
+                    flavor="hive",
+                ),
+            )
+        else:
+            # single-file tables go through the local http cache,
+            # so later stages of the same run only revalidate them
+            with http_cache.fetch(f"{BUCKET_URL}{path}.parquet") as f:
+                table = pq.read_table(f, columns=columns, filters=filters)
+        return table.to_pandas()
+    except (FileNotFoundError, OSError):
+        df = http_cache.read_csv(f"{BUCKET_URL}{path}.csv", usecols=columns)
+        for col, op, value in filters or []:
+            df = df[FILTER_OPS[op](df[col], value)]
+        return df
+
+
+def scan_df(path, columns=None, filters=None, partition_cols=None):
+    """
+    returns a pyarrow scanner over the parquet copy of a table published with
+    `snapshot_parquet`/`snapshot_parts`, so tables too large to hold in memory
+    can be read one record batch at a time (`scanner.to_batches()`)
+    """
+    dataset = ds.dataset(
+        f"{BUCKET}/{path}.parquet",
+        filesystem=get_arrow_fs(),
+        format="parquet",
+        partitioning=(
+            ds.partitioning(
+                pa.schema([(c, PARTITION_TYPES[c]) for c in partition_cols]),
+                flavor="hive",
+            )
+            if partition_cols
+            else None
+        ),
+    )
+    return dataset.scanner(
+        columns=columns,
+        filter=pq.filters_to_expression(filters) if filters else None,
+    )
+
+
+def fetch_json_frames(keys, threads=16, rate=25):
+    """
+    downloads and parses json snapshots concurrently (bounded by a token-bucket
+    rate limit of `rate` requests per second), yielding (key, dataframe) pairs
+    as they arrive so callers can merge them without waiting for the full set
+    """
     s3_client = get_s3_client()
-    filenames = list()
+    limiter = TokenBucket(rate)
+
+    def fetch(key):
+        limiter.acquire()
+        response = s3_client.get_object(Bucket=BUCKET, Key=key)
+        body = response["Body"].read()
+        if response.get("ContentEncoding") == "gzip":
+            body = gzip.decompress(body)
+        return pd.read_json(BytesIO(body))
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = {executor.submit(fetch, key): key for key in keys}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def list_objects(prefix=""):
+    # like `list_files`, but keeps the etag and last modified time of each object
+    s3_client = get_s3_client()
+    objects = list()
     paginator = s3_client.get_paginator("list_objects_v2")
     pages = paginator.paginate(
         Bucket=BUCKET, Prefix=prefix, PaginationConfig={"PageSize": 1000}
     )
     for page in pages:
-        if page.get("Contents"):
-            filenames.extend([file["Key"] for file in page.get("Contents")])
-    return filenames
+        for file in page.get("Contents", []):
+            objects.append(
+                {
+                    "key": file["Key"],
+                    "etag": file["ETag"].strip('"'),
+                    "last_modified": file["LastModified"].isoformat(),
+                }
+            )
+    return objects
+
+
+def list_files(prefix=""):
+    return [obj["key"] for obj in list_objects(prefix=prefix)]
 
 
 def list_directories(prefix="", pagesize=1000):
@@ -55,67 +206,221 @@ def list_directories(prefix="", pagesize=1000):
     return directories
 
 
-def snapshot_json(logger, json_data, path, timestamp=None, filename=None):
+def snapshot_path(path, timestamp=None, filename=None):
     if timestamp and not filename:
-        path += str(timestamp)
+        return path + str(timestamp)
     elif filename and not timestamp:
-        path += str(filename)
-    else:
-        path += f"{timestamp}/{filename}"
-    s3_client = get_s3_client()
-    s3_client.put_object(
-        Body=bytes(json.dumps(json_data, indent=2, default=str).encode("utf-8")),
-        ContentType="application/json",
+        return path + str(filename)
+    return path + f"{timestamp}/{filename}"
+
+
+def put_body(logger, body, key, content_type, compress=False):
+    # public objects are stored as is, since not every reader of the bucket
+    # (curl, R, the s3 console) decodes a `Content-Encoding`; internal ones
+    # (read back only through this module) can be stored gzipped
+    extra = dict()
+    if compress:
+        body = gzip.compress(body, mtime=0)
+        extra["ContentEncoding"] = "gzip"
+    get_s3_client().put_object(
+        Body=body,
         Bucket=BUCKET,
-        Key=path + ".json",
+        Key=key,
+        ContentType=content_type,
+        **extra,
+    )
+    logger.info(f"transfer size: {len(body)} bytes")
+
+
+def snapshot_json(
+    logger, json_data, path, timestamp=None, filename=None, compress=False
+):
+    path = snapshot_path(path, timestamp, filename)
+    put_body(
+        logger,
+        json.dumps(json_data, default=str).encode("utf-8"),
+        path + ".json",
+        "application/json",
+        compress=compress,
     )
-    logger.info(f"transfer size: {asizeof.asizeof(json_data)} bytes")
 
 
 def snapshot_pdf(logger, src_filename, path, timestamp=None, filename=None):
-    if timestamp and not filename:
-        path += str(timestamp)
-    elif filename and not timestamp:
-        path += str(filename)
-    else:
-        path += f"{timestamp}/{filename}"
-    s3_client = get_s3_client()
+    # pdfs are left uncompressed, since textract reads them directly from s3
+    path = snapshot_path(path, timestamp, filename)
     with open(src_filename, "rb") as file_data:
-        s3_client.put_object(
+        get_s3_client().put_object(
             Body=file_data,
             Bucket=BUCKET,
             Key=path + ".pdf",
             ContentType="application/pdf",
         )
-        logger.info(f"transfer size: {asizeof.asizeof(file_data)} bytes")
+    logger.info(f"transfer size: {os.path.getsize(src_filename)} bytes")
 
 
-def snapshot_df(logger, df, path, timestamp=None, filename=None):
-    if timestamp and not filename:
-        path += str(timestamp)
-    elif filename and not timestamp:
-        path += str(filename)
-    else:
-        path += f"{timestamp}/{filename}"
+def csv_args(compress):
+    """
+    returns the upload arguments of a csv object, gzipped if `compress`
+    """
+    if compress:
+        return {"ContentType": "text/csv", "ContentEncoding": "gzip"}
+    return {"ContentType": "text/csv"}
+
+
+def snapshot_df(logger, df, path, timestamp=None, filename=None, compress=False):
+    path = snapshot_path(path, timestamp, filename)
+
+    # write the csv (gzipped if `compress`) into a spooled buffer (only spilling to
+    # disk for large frames like `aggregated.csv`), then stream it up as a
+    # multipart upload
+    with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as buffer:
+        if compress:
+            df.to_csv(buffer, index=False, compression={"method": "gzip", "mtime": 0})
+        else:
+            df.to_csv(buffer, index=False, encoding="utf-8")
+        size = buffer.tell()
+        buffer.seek(0)
+        get_s3_client().upload_fileobj(
+            buffer,
+            BUCKET,
+            path + ".csv",
+            ExtraArgs=csv_args(compress),
+            Config=TRANSFER_CONFIG,
+        )
+    logger.info(f"transfer size: {size} bytes")
+
+
+def snapshot_parquet(
+    logger, df, path, timestamp=None, filename=None, partition_cols=None
+):
+    path = snapshot_path(path, timestamp, filename) + ".parquet"
+
+    # write a typed, zstd-compressed parquet file (or hive-partitioned
+    # directory of files) locally, then upload it under the same key layout
+    with tempfile.TemporaryDirectory() as tmp:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if partition_cols:
+            pq.write_to_dataset(
+                table,
+                root_path=tmp,
+                partition_cols=partition_cols,
+                basename_template="part-{i}.parquet",
+                compression="zstd",
+            )
+        else:
+            pq.write_table(table, f"{tmp}/data.parquet", compression="zstd")
+        upload_parquet(logger, tmp, path, partition_cols)
+
+
+def snapshot_parts(
+    logger,
+    parts,
+    schema,
+    path,
+    timestamp=None,
+    filename=None,
+    partition_cols=None,
+    constants=None,
+    compress=False,
+):
+    """
+    publishes a table held as an ordered list of local parquet files (e.g. per-ori
+    checkpoints) as both a csv (gzipped if `compress`) and a (partitioned) parquet
+    dataset, reading one part at a time so the full table is never held in memory
+    """
+    constants = constants or dict()
+    key = snapshot_path(path, timestamp, filename)
+
+    def batches():
+        for part in parts:
+            table = pq.read_table(part).cast(
+                pa.schema([f for f in schema if f.name not in constants])
+            )
+            for name, value in constants.items():
+                table = table.append_column(
+                    schema.field(name),
+                    pa.array([value] * len(table), schema.field(name).type),
+                )
+            yield from table.select(schema.names).to_batches()
+
+    # csv, written into a spooled buffer and streamed up as a multipart upload
+    with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as buffer:
+        out = gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0) if compress else buffer
+        header = True
+        for batch in batches():
+            out.write(
+                batch.to_pandas().to_csv(index=False, header=header).encode("utf-8")
+            )
+            header = False
+        if compress:
+            out.close()
+        size = buffer.tell()
+        buffer.seek(0)
+        get_s3_client().upload_fileobj(
+            buffer,
+            BUCKET,
+            key + ".csv",
+            ExtraArgs=csv_args(compress),
+            Config=TRANSFER_CONFIG,
+        )
+    logger.info(f"transfer size: {size} bytes")
+
+    # parquet, written batch by batch into one file or one file per partition
+    with tempfile.TemporaryDirectory() as tmp:
+        if partition_cols:
+            ds.write_dataset(
+                batches(),
+                tmp,
+                schema=schema,
+                format="parquet",
+                partitioning=partition_cols,
+                partitioning_flavor="hive",
+                basename_template="part-{i}.parquet",
+                file_options=ds.ParquetFileFormat().make_write_options(
+                    compression="zstd"
+                ),
+            )
+        else:
+            with pq.ParquetWriter(
+                f"{tmp}/data.parquet", schema, compression="zstd"
+            ) as writer:
+                for batch in batches():
+                    writer.write_batch(batch)
+        upload_parquet(logger, tmp, key + ".parquet", partition_cols)
+
+
+def upload_parquet(logger, tmp, path, partition_cols=None):
+    """
+    uploads a locally written parquet file or hive-partitioned directory to `path`
+    """
+    # non-partitioned tables are a single object at `path`
+    files = dict()
+    for root, _, fns in os.walk(tmp):
+        for fn in fns:
+            local = os.path.join(root, fn)
+            rel = os.path.relpath(local, tmp)
+            files[path if not partition_cols else f"{path}/{rel}"] = local
+
     s3_client = get_s3_client()
-    s3_client.put_object(
-        Body=df.to_csv(index=False),
-        Bucket=BUCKET,
-        Key=path + ".csv",
-    )
-    logger.info(f"transfer size: {asizeof.asizeof(df)} bytes")
+    for key, local in files.items():
+        s3_client.upload_file(
+            local,
+            BUCKET,
+            key,
+            ExtraArgs={"ContentType": "application/vnd.apache.parquet"},
+            Config=TRANSFER_CONFIG,
+        )
+    size = sum(os.path.getsize(local) for local in files.values())
+
+    # remove partitions left over from previous writes that no longer exist
+    if partition_cols:
+        for key in list_files(prefix=f"{path}/"):
+            if key not in files:
+                s3_client.delete_object(Bucket=BUCKET, Key=key)
+    logger.info(f"transfer size: {size} bytes")
 
 
 def snapshot_fig(logger, fig, path, timestamp=None, filename=None):
     html = fig.to_html(full_html=False, include_plotlyjs="cdn").encode("utf-8")
-    if timestamp and not filename:
-        path += str(timestamp)
-    elif filename and not timestamp:
-        path += str(filename)
-    else:
-        path += f"{timestamp}/{filename}"
-    s3_client = get_s3_client()
-    s3_client.put_object(
-        Body=html, Bucket=BUCKET, Key=path + ".html", ContentType="text/html"
-    )
-    logger.info(f"transfer size: {asizeof.asizeof(fig)} bytes")
+    path = snapshot_path(path, timestamp, filename)
+    put_body(logger, html, path + ".html", "text/html")
@@ -0,0 +1,239 @@
+import json
+import os
+import threading
+
+from multiprocessing.util import Finalize
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+
+"""
+A per-process pool of headless Chrome browsers for selenium scrapers
+(handed out by `selenium_configs.chrome_driver`).
+
+Launching Chrome is the most expensive part of a short selenium scrape, and
+retries in scrapers like `MS.py` quit and relaunch it several times per run.
+Browsers leased from the pool are returned to it when a scraper calls
+`driver.quit()`: their extra windows, cookies, site storage and cache are
+cleared and they are parked on a blank page for the next lease (by a scraper
+launching chrome with the same options; idle browsers launched with other
+options are shut down instead), until they have been used
+`RTCI_BROWSER_MAX_USES` times or their process tree grows beyond
+`RTCI_BROWSER_MAX_RSS_MB`, at which point they are really shut down.
+At most `RTCI_BROWSER_POOL_SIZE` browsers are alive per process at once.
+
+The chromedriver binary is resolved through webdriver-manager once and its
+path cached on disk, so later launches (in this or any other process) skip the
+version lookup and download.
+"""
+
+
+DRIVER_PATH_CACHE = os.getenv("RTCI_CHROMEDRIVER_CACHE", "/tmp/rtci_chromedriver_path")
+POOL_SIZE = int(os.getenv("RTCI_BROWSER_POOL_SIZE", 1))
+MAX_USES = int(os.getenv("RTCI_BROWSER_MAX_USES", 20))
+MAX_RSS_MB = int(os.getenv("RTCI_BROWSER_MAX_RSS_MB", 1500))
+
+_pool = {"pid": None, "pool": None}
+_pool_lock = threading.Lock()
+
+
+def driver_path():
+    """
+    returns the path to the chromedriver binary, installing it only if the cached
+    path is missing or no longer exists
+    """
+    if os.path.exists(DRIVER_PATH_CACHE):
+        with open(DRIVER_PATH_CACHE) as f:
+            path = f.read().strip()
+        if os.path.exists(path):
+            return path
+
+    path = ChromeDriverManager().install()
+    tmp = f"{DRIVER_PATH_CACHE}.{os.getpid()}"
+    with open(tmp, "w") as f:
+        f.write(path)
+    os.replace(tmp, DRIVER_PATH_CACHE)
+    return path
+
+
+def process_tree_rss(pid):
+    """
+    returns the resident memory (in mb) of a process and all of its descendants
+    (chromedriver plus the chrome browser, renderer and gpu processes it spawned)
+    """
+    children = dict()
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, list()).append(int(entry))
+
+    rss, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        stack.extend(children.get(p, list()))
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss += int(line.split()[1])
+        except OSError:
+            continue
+    return rss / 1024
+
+
+def options_key(options):
+    """
+    returns a key identifying the launch options of a browser, except for its
+    download directory (which is set per lease)
+    """
+    experimental = dict(options.experimental_options)
+    prefs = dict(experimental.get("prefs", dict()))
+    prefs.pop("download.default_directory", None)
+    experimental["prefs"] = prefs
+    return json.dumps(
+        {"arguments": sorted(options.arguments), "experimental": experimental},
+        sort_keys=True,
+        default=str,
+    )
+
+
+class PooledChrome(webdriver.Chrome):
+    """
+    chrome webdriver whose `quit()` hands it back to its pool
+    """
+
+    def __init__(self, pool, key, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = pool
+        self.key = key
+        self.uses = 0
+
+    def quit(self):
+        self.pool.release(self)
+
+    def terminate(self):
+        try:
+            super().quit()
+        except Exception:
+            pass
+
+
+class BrowserPool:
+    def __init__(self, size=POOL_SIZE, max_uses=MAX_USES, max_rss_mb=MAX_RSS_MB):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_rss_mb = max_rss_mb
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.idle = list()
+        self.leased = set()
+
+    def lease(self, options, download_dir):
+        """
+        returns an idle browser launched with the same `options` (or launches one
+        if none is idle), set to download files into `download_dir`
+        """
+        key = options_key(options)
+        with self.lock:
+            matching = [d for d in self.idle if d.key == key]
+            stale = [d for d in self.idle if d.key != key]
+            driver = matching.pop() if matching else None
+            self.idle = matching
+        for d in stale:
+            d.terminate()
+            self.slots.release()
+
+        if driver is None:
+            self.slots.acquire()
+            try:
+                driver = PooledChrome(
+                    self, key, service=Service(driver_path()), options=options
+                )
+            except Exception:
+                self.slots.release()
+                raise
+        with self.lock:
+            self.leased.add(driver)
+
+        driver.execute_cdp_cmd(
+            "Page.setDownloadBehavior",
+            {"behavior": "allow", "downloadPath": download_dir},
+        )
+        return driver
+
+    def release(self, driver):
+        """
+        resets a returned browser and parks it for the next lease, or shuts it
+        down if it is broken, worn out or using too much memory
+        """
+        with self.lock:
+            if driver not in self.leased:
+                return
+            self.leased.discard(driver)
+
+        driver.uses += 1
+        try:
+            for handle in driver.window_handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(driver.window_handles[0])
+
+            # clear the site's storage while it is still loaded, then every cookie
+            # and cached response, before leaving it
+            origin = driver.execute_script("return window.location.origin")
+            if origin and origin.startswith("http"):
+                driver.execute_cdp_cmd(
+                    "Storage.clearDataForOrigin",
+                    {"origin": origin, "storageTypes": "all"},
+                )
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", dict())
+            driver.execute_cdp_cmd("Network.clearBrowserCache", dict())
+
+            driver.set_page_load_timeout(30)
+            driver.get("about:blank")
+            driver.set_page_load_timeout(300)
+            driver.implicitly_wait(0)
+            reusable = (
+                driver.uses < self.max_uses
+                and process_tree_rss(driver.service.process.pid) < self.max_rss_mb
+            )
+        except (WebDriverException, AttributeError, OSError):
+            reusable = False
+
+        if reusable:
+            with self.lock:
+                self.idle.append(driver)
+        else:
+            driver.terminate()
+            self.slots.release()
+
+    def close(self):
+        """
+        shuts down all browsers, leased or idle
+        """
+        with self.lock:
+            drivers = self.idle + list(self.leased)
+            self.idle, self.leased = list(), set()
+        for driver in drivers:
+            driver.terminate()
+
+
+def get_pool():
+    """
+    returns this process's browser pool, creating it after startup or a fork;
+    its browsers are shut down when the process exits, including pool workers
+    (which skip `atexit` handlers but run multiprocessing finalizers)
+    """
+    with _pool_lock:
+        if _pool["pid"] != os.getpid():
+            _pool.update(pid=os.getpid(), pool=BrowserPool())
+            Finalize(None, _pool["pool"].close, exitpriority=10)
+        return _pool["pool"]
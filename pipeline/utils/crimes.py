@@ -1,3 +1,6 @@
+import pandas as pd
+
+
 # source: https://ucr.fbi.gov/nibrs/2011/resources/nibrs-offense-codes
 
 rtci_to_nibrs = {
@@ -128,3 +131,20 @@ rtci_to_nibrs = {
         },
     ],
 }
+
+
+def to_matrix(counts, crosswalk):
+    """
+    maps the categories of a (year, month, category, count) table to crimes with
+    `crosswalk` (dropping unmapped ones) and returns a (year, month) x crime
+    table of summed counts
+    """
+    counts = counts.assign(crime=counts["category"].map(crosswalk))
+    counts = counts[counts["crime"].notna()]
+    return (
+        counts.groupby(["year", "month", "crime"])["count"]
+        .sum()
+        .reset_index()
+        .pivot(index=["year", "month"], columns="crime", values="count")
+        .reset_index()
+    )
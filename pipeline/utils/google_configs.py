@@ -1,8 +1,11 @@
 import gspread
+import os
 import pandas as pd
+import threading
 
 from google.oauth2.service_account import Credentials
 from gspread_dataframe import set_with_dataframe
+from time import monotonic
 
 
 # For information on setting up Google API interactivity, see:
@@ -13,6 +16,14 @@ gc_files = {
     "agencies": "https://docs.google.com/spreadsheets/d/1LXidpQnMRyqpVn4zwZJY3kL5XOeKgVOzQuHbSjV3zds/edit?gid=0"
 }
 
+# seconds for which a pulled sheet is reused by later `pull_sheet` calls in the same process
+SNAPSHOT_TTL = 300
+
+# process-level caches of the authorized client, worksheet handles and sheet contents
+# (keyed by pid so forked worker processes never reuse their parent's connections)
+_cache = {"pid": None, "client": None, "worksheets": dict(), "snapshots": dict()}
+_cache_lock = threading.RLock()
+
 
 def authorize():
     scopes = [
@@ -30,28 +41,73 @@ def authorize():
     return gspread.authorize(credentials)
 
 
+def get_cache():
+    """
+    returns this process's cache, resetting it after a fork
+    """
+    with _cache_lock:
+        if _cache["pid"] != os.getpid():
+            _cache.update(
+                pid=os.getpid(), client=None, worksheets=dict(), snapshots=dict()
+            )
+        return _cache
+
+
+def get_client():
+    """
+    returns the process's authorized client, created once
+    (its session refreshes the service account token whenever it expires)
+    """
+    cache = get_cache()
+    with _cache_lock:
+        if cache["client"] is None:
+            cache["client"] = authorize()
+        return cache["client"]
+
+
 def open_sheet(sheet, key=None, url=None):
     assert key or url
-    gc = authorize()
-    if key:
-        gs = gc.open_by_key(key)
-    else:
-        gs = gc.open_by_url(url)
-
-    worksheet = gs.worksheet(sheet)
-    return worksheet
+    cache = get_cache()
+    with _cache_lock:
+        if (key or url, sheet) not in cache["worksheets"]:
+            gc = get_client()
+            if key:
+                gs = gc.open_by_key(key)
+            else:
+                gs = gc.open_by_url(url)
+            cache["worksheets"][(key or url, sheet)] = gs.worksheet(sheet)
+        return cache["worksheets"][(key or url, sheet)]
+
+
+def invalidate_sheet(sheet, key=None, url=None):
+    """
+    drops the cached contents of a sheet after it has been written to
+    """
+    cache = get_cache()
+    with _cache_lock:
+        cache["snapshots"].pop((key or url, sheet), None)
 
 
 def clear_sheet(sheet, key=None, url=None):
     worksheet = open_sheet(sheet, key, url)
     worksheet.clear()
+    invalidate_sheet(sheet, key, url)
     return
 
 
-def pull_sheet(sheet, key=None, url=None):
+def pull_sheet(sheet, key=None, url=None, max_age=SNAPSHOT_TTL):
+    cache = get_cache()
+    with _cache_lock:
+        snapshot = cache["snapshots"].get((key or url, sheet))
+    if snapshot and monotonic() - snapshot[0] < max_age:
+        return snapshot[1].copy()
+
     worksheet = open_sheet(sheet, key, url)
     list_of_dicts = worksheet.get_all_records()
-    return pd.DataFrame(list_of_dicts)
+    df = pd.DataFrame(list_of_dicts)
+    with _cache_lock:
+        cache["snapshots"][(key or url, sheet)] = (monotonic(), df)
+    return df.copy()
 
 
 def update_sheet(sheet, df, key=None, url=None):
@@ -63,4 +119,5 @@ def update_sheet(sheet, df, key=None, url=None):
         include_column_header=True,
         resize=True,
     )
+    invalidate_sheet(sheet, key, url)
     return
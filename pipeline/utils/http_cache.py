@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import pandas as pd
+import threading
+
+from requests_configs import mount_session
+
+
+"""
+A read-through disk cache for objects fetched over http(s), mostly the
+`https://rtci.s3.us-east-1.amazonaws.com/...` tables that several pipeline
+stages read during one nightly run (`aggregated.csv`, `cde_oris.csv`,
+`geographies.csv`, ...).
+
+Each url is stored once on disk together with its ETag. Later reads revalidate
+with a conditional GET (`If-None-Match`), so an unchanged object costs one
+304 response instead of a full download. The cache directory is shared by all
+processes on the machine and is trimmed least-recently-used first once it
+grows beyond `CACHE_MAX_BYTES`. Requests time out after `RTCI_HTTP_TIMEOUT`
+seconds without a response.
+"""
+
+
+CACHE_DIR = os.getenv("RTCI_CACHE_DIR", "/tmp/rtci_http_cache")
+CACHE_MAX_BYTES = int(os.getenv("RTCI_CACHE_MAX_BYTES", 2 * 1024**3))
+TIMEOUT = int(os.getenv("RTCI_HTTP_TIMEOUT", 300))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = mount_session()
+        return _session
+
+
+def fetch(url):
+    """
+    returns an open (binary) local copy of `url`, downloading it only if it is
+    not cached yet or its ETag has changed; the copy is opened before it can be
+    evicted, so it stays readable until closed even if another process trims
+    the cache meanwhile
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    body_path = os.path.join(CACHE_DIR, f"{key}.body")
+    meta_path = os.path.join(CACHE_DIR, f"{key}.json")
+
+    headers = dict()
+    body = None
+    try:
+        body = open(body_path, "rb")
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+    except FileNotFoundError:
+        pass
+
+    r = get_session().get(url, headers=headers, timeout=TIMEOUT)
+
+    # unchanged since last download, just mark as recently used
+    if r.status_code == 304 and "If-None-Match" in headers:
+        try:
+            os.utime(body_path)
+        except FileNotFoundError:
+            pass
+        return body
+    if body:
+        body.close()
+    r.raise_for_status()
+
+    # write atomically so concurrent readers never see a partial file
+    tmp = f"{body_path}.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, "wb") as f:
+        f.write(r.content)
+    body = open(tmp, "rb")
+    os.replace(tmp, body_path)
+    with open(tmp, "w") as f:
+        json.dump({"url": url, "etag": r.headers.get("ETag")}, f)
+    os.replace(tmp, meta_path)
+
+    evict(keep=body_path)
+    return body
+
+
+def evict(keep=None):
+    """
+    removes least recently used entries (other than `keep`) until the cache
+    fits in `CACHE_MAX_BYTES`
+    """
+    entries = list()
+    for fn in os.listdir(CACHE_DIR):
+        if fn.endswith(".body"):
+            path = os.path.join(CACHE_DIR, fn)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        if path == keep:
+            continue
+        for fn in [path, path[: -len(".body")] + ".json"]:
+            try:
+                os.remove(fn)
+            except FileNotFoundError:
+                pass
+        total -= size
+
+
+def read_csv(url, **kwargs):
+    with fetch(url) as f:
+        return pd.read_csv(f, **kwargs)
+
+
+def read_json(url):
+    with fetch(url) as f:
+        return json.load(f)
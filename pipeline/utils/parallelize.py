@@ -1,4 +1,7 @@
+import threading
+
 from multiprocessing.pool import ThreadPool
+from time import monotonic, sleep
 from tqdm import tqdm
 
 
@@ -14,3 +17,67 @@ def thread(worker, jobs, threads=5):
     pool.join()
     if results:
         return results
+
+
+class TokenBucket:
+    """
+    thread-safe token bucket rate limiter, allowing bursts of up to
+    `capacity` calls and a sustained `rate` of calls per second
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+
+
+class AdaptiveLimiter:
+    """
+    thread-safe concurrency limit that adapts to a server's health: the limit grows
+    by one after `window` consecutive healthy calls (up to `maximum`) and halves
+    (down to `minimum`) whenever a call reports the server as overloaded
+    """
+
+    def __init__(self, limit, minimum=1, maximum=None, window=10):
+        self.limit = limit
+        self.minimum = minimum
+        self.maximum = maximum or limit
+        self.window = window
+        self.active = 0
+        self.successes = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+
+    def release(self, overloaded=False):
+        with self.condition:
+            self.active -= 1
+            if overloaded:
+                self.limit = max(self.minimum, self.limit // 2)
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.window and self.limit < self.maximum:
+                    self.limit += 1
+                    self.successes = 0
+            self.condition.notify_all()
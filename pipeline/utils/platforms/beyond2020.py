@@ -0,0 +1,333 @@
+import calendar
+import os
+import pandas as pd
+import re
+import sys
+
+from bs4 import BeautifulSoup as bS
+from datetime import datetime as dt
+from tenacity import retry, stop_after_attempt, wait_random
+
+sys.path.append("../utils")
+from parallelize import TokenBucket, thread
+from requests_configs import mount_session
+from super import Scraper
+
+
+"""
+The Beyond2020 class below scrapes the Beyond 2020 public report viewer
+(`.../public/View/RSReport.aspx?ReportId=...`, an ASP.NET ReportViewer page)
+over plain http instead of driving it through a headless browser.
+
+The viewer is an ASP.NET WebForms page whose state lives in hidden form fields
+(`__VIEWSTATE`, `__EVENTVALIDATION`, ...). Choosing a report parameter (agency,
+year, month) is a form postback with `__EVENTTARGET` set to the dropdown, and
+"View Report" is a postback with the button set. When the viewer renders
+asynchronously, the report body is fetched by one more postback to its
+`Reserved_AsyncLoadTarget`. Each of these is replayed with `requests`, carrying
+the hidden fields of the previous response forward.
+
+The report parameters are single-valued dropdowns, so every agency-month is
+still one report render. Agencies are scraped concurrently instead, each with its
+own session (the viewer keeps per-session report state), and requests to a site
+are rate limited across those sessions.
+
+The scrapers of these viewers (MA, MS, ND, NE, WY) still default to their
+selenium versions; their `Beyond2020` subclasses only run when
+`RTCI_BEYOND2020_HTTP=1` is set, until they have been validated against the live
+viewers. Both versions parse rendered reports with `report_records`.
+
+Subclasses set the report `url`, the dropdown names of their report parameters
+and the report layout (`cleared_column`, `blank_counts`), or override
+`process_soup(soup, agency, year, month)` for reports that need more than one
+`report_records` call. A viewer either has separate year and month dropdowns, or
+(when `year_select` is None) a single month dropdown of "Mon YYYY" options.
+"""
+
+
+def http_enabled():
+    """
+    whether the http client runs instead of the selenium version of a scraper
+    """
+    return os.getenv("RTCI_BEYOND2020_HTTP") == "1"
+
+
+def report_records(
+    soup, agency, year, month, fields, occurrences=1, cleared_column=2, blanks=False
+):
+    """
+    parses the reported and cleared counts of each of `fields` out of one rendered
+    report into {ori, year, month, field, reported, cleared} records; a field label
+    appears `occurrences` times (counts are read next to its last occurrence),
+    clearances are `cleared_column` cells right of the label and blank counts are
+    read as 0 if `blanks` is set
+    """
+
+    def count(td):
+        text = td.text.strip()
+        if blanks and text == "":
+            return 0
+        return int(text)
+
+    records = list()
+    for field in fields:
+        tds = soup.find_all("td", string=field)
+        assert len(tds) == occurrences
+        cells = tds[-1].find_next_siblings("td")
+        records.append(
+            {
+                "ori": agency.replace("\xa0", " ").rsplit(" - ", 1)[-1],
+                "year": year,
+                "month": month,
+                "field": field,
+                "reported": count(cells[0]),
+                "cleared": count(cells[cleared_column - 1]),
+            }
+        )
+    return records
+
+
+class Beyond2020(Scraper):
+    def __init__(self):
+        super().__init__()
+        self.url = None
+        self.agency_select = "ctl00$MainContent$RptViewer$ctl08$ctl07$ddValue"
+        self.year_select = "ctl00$MainContent$RptViewer$ctl08$ctl03$ddValue"
+        self.month_select = "ctl00$MainContent$RptViewer$ctl08$ctl05$ddValue"
+        self.view_button = "ctl00$MainContent$RptViewer$ctl08$ctl00"
+        self.report_div = "VisibleReportContentctl00_MainContent_RptViewer_ctl13"
+        self.years = list(range(self.first.year, self.last.year + 1))
+        self.exclude_oris = []
+        self.map = dict()
+
+        # report layout: cells from a field label to its clearance count, and
+        # whether blank counts mean 0
+        self.cleared_column = 2
+        self.blank_counts = False
+
+        # concurrent agency sessions and request rate (per second) against the site
+        self.threads = 4
+        self.rate = 4
+
+    def scrape(self):
+        self.agencies = self.get_agencies(self.exclude_oris)
+        self.oris = list(self.agencies.values())
+        self.bucket = TokenBucket(self.rate)
+
+        # get list of agency and period values from site
+        page = self.get_page(mount_session())
+        agencies = [
+            s.text
+            for s in page["soup"]
+            .find("select", {"name": self.agency_select})
+            .find_all("option")
+            if s.text.strip().replace("\xa0", " ").rsplit(" - ", 1)[-1] in self.oris
+        ]
+        self.periods = self.get_periods(page["soup"])
+
+        # run through agencies concurrently, each over all periods
+        records = thread(self.get_agency, agencies, threads=self.threads)
+
+        # process and return records
+        return self.process_records(records or list())
+
+    def get_periods(self, soup):
+        """
+        returns a list of (year, month, option) tuples for every month in range,
+        where `option` is the text of the month dropdown option to select
+        """
+        periods = list()
+        if self.year_select:
+            for s in soup.find("select", {"name": self.year_select}).find_all("option"):
+                if int(s.text.strip()) not in self.years:
+                    continue
+                for month in calendar.month_abbr[1:]:
+                    if dt.strptime(f"{s.text}{month}", "%Y%b") <= self.last:
+                        periods.append((s.text, month, month))
+        else:
+            for s in soup.find("select", {"name": self.month_select}).find_all(
+                "option"
+            ):
+                if len(s.text) != 8:
+                    continue
+                date = dt.strptime(s.text.strip().replace("\xa0", " "), "%b %Y")
+                if self.first <= date <= self.last:
+                    month, year = s.text.split("\xa0")
+                    periods.append((year, month, s.text))
+        return periods
+
+    def get_agency(self, agency):
+        """
+        renders and parses the report for every period of one agency
+        in its own viewer session; an agency that fails (after the retries of
+        `post`) fails the scrape, so no empty snapshot replaces its last good one
+        """
+        self.logger.info(f"attempting {agency}...")
+        try:
+            session = mount_session()
+            page = self.get_page(session)
+
+            records = list()
+            for year, month, option in self.periods:
+                # selecting a year can reset the agency, so it is re-selected after
+                # (a no-op when the agency is still selected)
+                if self.year_select:
+                    page = self.select(session, page, self.year_select, year)
+                page = self.select(session, page, self.agency_select, agency)
+                page = self.select(session, page, self.month_select, option)
+                page = self.view_report(session, page)
+                records.extend(self.process_soup(page["soup"], agency, year, month))
+        except Exception as e:
+            self.logger.error(f"failed {agency}: {e}")
+            raise
+        self.logger.info(f"completed {agency}")
+        return records
+
+    def get_page(self, session):
+        """
+        loads a fresh copy of the report viewer
+        """
+        self.bucket.acquire()
+        r = session.get(self.url)
+
+        # raise in case of server errors
+        if r.status_code != 200 or "Welcome" not in r.text:
+            raise Exception(f"bad response ({r.status_code})")
+        return self.to_page(r.text)
+
+    @staticmethod
+    def to_page(html):
+        """
+        parses a viewer response into its soup and the form fields it would post back
+        """
+        soup = bS(html, "lxml")
+        form = dict()
+        for i in soup.find_all("input"):
+            kind = i.get("type", "text").lower()
+            if not i.get("name") or kind in ["submit", "button", "image", "reset"]:
+                continue
+            if kind in ["checkbox", "radio"] and not i.has_attr("checked"):
+                continue
+            form[i["name"]] = i.get("value", "on" if kind == "checkbox" else "")
+        for s in soup.find_all("select"):
+            option = s.find("option", selected=True) or s.find("option")
+            if s.get("name") and option:
+                form[s["name"]] = option.get("value", option.text)
+        return {"soup": soup, "form": form}
+
+    @retry(stop=stop_after_attempt(3), wait=wait_random(min=5, max=10))
+    def post(self, session, form):
+        """
+        posts the viewer form back and returns the resulting page
+        """
+        self.bucket.acquire()
+        r = session.post(self.url, data=form)
+        r.raise_for_status()
+        page = self.to_page(r.text)
+        if "__VIEWSTATE" not in page["form"]:
+            raise ValueError(f"unexpected response from {self.url}")
+        return page
+
+    def select(self, session, page, name, text):
+        """
+        selects the option with text `text` in dropdown `name`, posting the form
+        back when the dropdown triggers a postback (dependent report parameters)
+        """
+        element = page["soup"].find("select", {"name": name})
+        options = [o for o in element.find_all("option") if o.text == text]
+        if not options:
+            raise ValueError(f"option {text} not found in {name}")
+        value = options[0].get("value", options[0].text)
+        if page["form"].get(name) == value:
+            return page
+
+        form = {**page["form"], name: value}
+        if "__doPostBack" not in element.get("onchange", ""):
+            return {"soup": page["soup"], "form": form}
+        form.update({"__EVENTTARGET": name, "__EVENTARGUMENT": ""})
+        return self.post(session, form)
+
+    def view_report(self, session, page):
+        """
+        clicks "View Report" and returns the page once the report body is rendered
+        """
+        button = page["soup"].find("input", {"name": self.view_button})
+        form = {
+            **page["form"],
+            "__EVENTTARGET": "",
+            "__EVENTARGUMENT": "",
+            self.view_button: button.get("value", ""),
+        }
+        report = self.post(session, form)
+
+        # asynchronous rendering loads the report body in a follow-up postback
+        for _ in range(3):
+            div = report["soup"].find("div", id=self.report_div)
+            if div is not None and div.find("td") is not None:
+                return report
+            target = re.search(r"[\w$]+\$Reserved_AsyncLoadTarget", str(report["soup"]))
+            if target is None:
+                break
+            form = {
+                **report["form"],
+                "__EVENTTARGET": target.group(0),
+                "__EVENTARGUMENT": "",
+            }
+            report = self.post(session, form)
+        raise ValueError(f"report did not render for {self.url}")
+
+    def process_soup(self, soup, agency, year, month):
+        """
+        parses one rendered report into a list of
+        {ori, year, month, field, reported, cleared} records
+        """
+        return report_records(
+            soup,
+            agency,
+            int(year),
+            month,
+            self.map,
+            cleared_column=self.cleared_column,
+            blanks=self.blank_counts,
+        )
+
+    def process_records(self, records):
+        # relabel field names and sum components
+        records = pd.DataFrame(records)
+        records["field"] = records["field"].map(self.map)
+        records = records.groupby(["ori", "year", "month", "field"]).sum().reset_index()
+
+        # handle crime counts vs. clearances
+        reported = records.pivot(
+            index=["ori", "year", "month"],
+            columns="field",
+            values="reported",
+        ).reset_index()
+
+        clearances = (
+            records.pivot(
+                index=["ori", "year", "month"],
+                columns="field",
+                values="cleared",
+            )
+            .reset_index()
+            .add_suffix("_cleared")
+            .rename(
+                columns={
+                    "ori_cleared": "ori",
+                    "year_cleared": "year",
+                    "month_cleared": "month",
+                }
+            )
+        )
+        records = pd.merge(
+            reported,
+            clearances,
+            on=["ori", "year", "month"],
+        )
+
+        # reformat month
+        records["month"] = pd.to_datetime(records["month"], format="%b").dt.month
+
+        # return results
+        return records.to_dict("records")
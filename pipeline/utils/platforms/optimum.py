@@ -1,6 +1,5 @@
 import json
 import pandas as pd
-import requests
 import sys
 
 from datetime import datetime as dt
@@ -8,15 +7,34 @@ from functools import reduce
 from tenacity import retry, stop_after_attempt, stop_after_delay, wait_random
 
 sys.path.append("../utils")
-from parallelize import thread
+from parallelize import AdaptiveLimiter, thread
+from requests_configs import mount_session
 from super import Scraper
 
 
+"""
+The Optimum class below scrapes the Optimum "crime trends" report api
+(`*.nibrs.com/Report/GetCrimeTrends`, `.../SRSReport/GetCrimeTrends`).
+
+Requests go through one keep-alive session per scraper, with one job per
+agency (SRS, where a single call returns every crime) or per agency and crime
+(NIBRS, where a list of offense ids is summed into a single series, so each crime
+needs its own call). How many requests are in flight against the api is set by an
+adaptive limit: it halves whenever the api answers with an overload symptom
+(runtime error pages, "Execution Timeout Expired", 429/5xx) and grows back
+slowly while responses are healthy. States that fail under load
+(`self.threader = False`) start at one request at a time rather than running
+fully serially.
+"""
+
+
 class Optimum(Scraper):
     def __init__(self):
         super().__init__()
-        self.threader = True  # some states fail on requests threading
+        self.threader = True  # some states fail under load, start those at 1 request
         self.srs = False  # TX and PA have a newer SRS reporting format/API
+        self.threads = 8  # most requests in flight against the api
+        self.timeout = 180
         self.payload = {
             "ReportType": "Agency",
             "DrillDownReportIDs": -1,
@@ -48,8 +66,15 @@ class Optimum(Scraper):
         # get list of agencies in state from Google sheet
         agencies = self.get_agencies(self.exclude_oris).values()
 
+        # a fresh request limit per scrape, so a limit lowered in one run does not
+        # carry over to the next run in the same worker process
+        self.limiter = AdaptiveLimiter(
+            self.threads if self.threader else 1, maximum=self.threads
+        )
+
         # get list of ori input options from website
-        r = requests.get(self.agency_list_url)
+        self.session = mount_session()
+        r = self.session.get(self.agency_list_url, timeout=self.timeout)
         a = pd.DataFrame(json.loads(r.text))
         a["Value"] = a["Value"].astype(str)
 
@@ -62,22 +87,13 @@ class Optimum(Scraper):
         # specify self.oris for super class
         self.oris.extend([agency[0] for agency in agencies])
 
-        # run through data collection per agency
-        if self.threader:
-            if self.srs:
-                all_agencies = thread(self.get_agency_srs, agencies)
-            else:
-                all_agencies = thread(self.get_agency, agencies)
-        else:
-            all_agencies = list()
-            for agency in agencies:
-                self.logger.info(f"running {agency[0]}...")
-                if self.srs:
-                    all_agencies.extend(self.get_agency_srs(agency))
-                else:
-                    all_agencies.extend(self.get_agency(agency))
-
-        return all_agencies
+        # run through data collection per agency (srs) or per agency and crime,
+        # with the number of requests in flight set by `self.limiter`
+        if self.srs:
+            return thread(self.get_agency_srs, agencies, threads=self.threads)
+        jobs = [(agency, crime) for agency in agencies for crime in self.crimes]
+        series = thread(self.get_agency_crime, jobs, threads=self.threads)
+        return self.merge_series(series)
 
     def get_agency_srs(self, agency):
         # plug agency id code into payload
@@ -104,44 +120,70 @@ class Optimum(Scraper):
 
         return df.to_dict("records")
 
-    def get_agency(self, agency):
-        # plug agency id code into payload
-        agency, value = agency
+    def get_agency_crime(self, job):
+        # plug agency id code and the crime's offense codes into payload
+        (agency, value), crime = job
         payload = self.payload.copy()
-        payload.update({"ReportIDs": value})
-
-        # run through crimes and collect data
-        out = list()
-        for crime in self.crimes:
-            offense = ",".join([c["Offense Code"].lower() for c in self.crimes[crime]])
-            payload.update({"OffenseIDs": offense})
-            j = self.get_agency_crime_data(payload)
-
-            # collect dates and crime counts
-            dates = [dt.strptime(d, "%Y/%b") for d in j["periodlist"]]
-            crimes = j["crimeList"]
+        offense = ",".join([c["Offense Code"].lower() for c in self.crimes[crime]])
+        payload.update({"ReportIDs": value, "OffenseIDs": offense})
+        j = self.get_agency_crime_data(payload)
 
-            assert len(crimes) == 1
-            crimes = crimes[0]
+        # collect dates and crime counts
+        dates = [dt.strptime(d, "%Y/%b") for d in j["periodlist"]]
+        crimes = j["crimeList"]
 
-            # capture data if it exists, otherwise pass zeros
-            if crimes["data"]:
-                out.append(pd.DataFrame({"date": dates, crime: crimes["data"]}))
-            else:
-                self.logger.warning(f"no data for {agency}:{crime}")
-                out.append(pd.DataFrame({"date": dates, crime: None}))
+        assert len(crimes) == 1
+        crimes = crimes[0]
 
-        df = reduce(lambda df1, df2: pd.merge(df1, df2, on="date"), out)
-        df["ori"] = agency
+        # capture data if it exists, otherwise pass zeros
+        if crimes["data"]:
+            data = crimes["data"]
+        else:
+            self.logger.warning(f"no data for {agency}:{crime}")
+            data = None
+
+        return {"ori": agency, "crime": crime, "dates": dates, "data": data}
+
+    def merge_series(self, series):
+        """
+        merges the per crime series of each agency into one record per agency-month
+        """
+        by_agency = dict()
+        for s in series or list():
+            by_agency.setdefault(s["ori"], dict())[s["crime"]] = s
+
+        all_agencies = list()
+        for agency, crimes in by_agency.items():
+            out = [
+                pd.DataFrame(
+                    {"date": crimes[crime]["dates"], crime: crimes[crime]["data"]}
+                )
+                for crime in self.crimes
+            ]
+            df = reduce(lambda df1, df2: pd.merge(df1, df2, on="date"), out)
+            df["ori"] = agency
+            all_agencies.extend(df.to_dict("records"))
 
-        return df.to_dict("records")
+        return all_agencies
 
     @retry(
         stop=(stop_after_delay(60) | stop_after_attempt(3)),
         wait=wait_random(min=5, max=10),
     )
     def get_agency_crime_data(self, payload):
-        r = requests.get(self.data_url, params=payload)
+        self.limiter.acquire()
+        overloaded = True
+        try:
+            r = self.session.get(self.data_url, params=payload, timeout=self.timeout)
+            overloaded = (
+                r.status_code == 429
+                or r.status_code >= 500
+                or "<title>Runtime Error</title>" in r.text
+                or "<title>Error Page</title>" in r.text
+                or "Execution Timeout Expired" in r.text
+            )
+        finally:
+            self.limiter.release(overloaded)
 
         # result is HTML instead of JSON
         assert (
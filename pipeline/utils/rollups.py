@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from scipy import sparse
+
+
+"""
+Helpers for rolling agency-level values up to geographic entities
+(states, divisions, regions, the nation and their population size bins).
+
+Group membership is held in a sparse (group x ori) 0/1 matrix, so the sums
+for every group come out of one sparse-dense matrix product. This replaces
+filtering the agency table once per group.
+"""
+
+
+def membership_matrix(groups, members):
+    """
+    builds a sparse (group x member) 0/1 matrix from a list of member ids per group
+    (ids not found in `members` are ignored, repeated ids are counted once)
+    """
+    members = pd.Index(members)
+    rows = np.repeat(np.arange(len(groups)), [len(g) for g in groups])
+    cols = members.get_indexer([m for g in groups for m in g])
+    rows, cols = rows[cols >= 0], cols[cols >= 0]
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, cols)), shape=(len(groups), len(members))
+    )
+    matrix.data[:] = 1
+    return matrix
+
+
+def rollup(matrix, values):
+    """
+    sums member rows of `values` (a 1d or 2d array aligned with the matrix columns)
+    into one row per group
+    """
+    return np.asarray(matrix @ np.nan_to_num(np.asarray(values, dtype=float)))
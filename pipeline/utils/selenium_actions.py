@@ -1,24 +1,162 @@
+import functools
+
 # from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver import ActionChains
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as ec
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.support.ui import WebDriverWait
 
-from time import sleep
+from time import perf_counter
+
+
+# page-side tracker for `wait_for_idle`: counts in-flight xhr/fetch requests (and
+# pending navigations) and stamps the time of the last request or dom mutation
+# on `window.__rtciIdle`
+IDLE_SCRIPT = """
+if (!window.__rtciIdle) {
+    var idle = {pending: 0, last: Date.now()};
+    var touch = function () { idle.last = Date.now(); };
+    window.__rtciIdle = idle;
+
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        idle.pending++;
+        touch();
+        this.addEventListener("loadend", function () { idle.pending--; touch(); });
+        return send.apply(this, arguments);
+    };
+    if (window.fetch) {
+        var fetch = window.fetch;
+        window.fetch = function () {
+            idle.pending++;
+            touch();
+            return fetch.apply(this, arguments).finally(function () {
+                idle.pending--;
+                touch();
+            });
+        };
+    }
+
+    // a full page postback keeps the old document busy until it unloads; when
+    // the navigation turns into a file download the document never unloads,
+    // so the navigation stops counting as pending after a few seconds
+    window.addEventListener("beforeunload", function () {
+        idle.pending++;
+        touch();
+        setTimeout(function () { idle.pending--; touch(); }, 5000);
+    });
+
+    var observe = function () {
+        new MutationObserver(touch).observe(document.documentElement, {
+            childList: true, subtree: true, attributes: true, characterData: true
+        });
+    };
+    if (document.documentElement) {
+        observe();
+    } else {
+        document.addEventListener("DOMContentLoaded", observe);
+    }
+}
+"""
+
+IDLE_STATE_SCRIPT = """
+var idle = window.__rtciIdle;
+if (!idle) { return [document.readyState, -1, 0]; }
+return [document.readyState, idle.pending, Date.now() - idle.last];
+"""
+
+
+def timed(action):
+    """
+    records the call count and time spent in a browser action on `self.timings`
+    (inclusive of nested actions, logged at the end of `Scraper.run`)
+    """
+
+    @functools.wraps(action)
+    def wrapper(self, *args, **kwargs):
+        start = perf_counter()
+        try:
+            return action(self, *args, **kwargs)
+        finally:
+            if not hasattr(self, "timings"):
+                self.timings = dict()
+            count, seconds = self.timings.get(action.__name__, (0, 0.0))
+            self.timings[action.__name__] = (
+                count + 1,
+                seconds + perf_counter() - start,
+            )
+
+    return wrapper
+
+
+def install_idle_tracking(self):
+    """
+    registers the idle tracker (via cdp) to run in every new document of the
+    driver, so full page postbacks are tracked from their first request on
+    """
+    if getattr(self.driver, "idle_tracking", False):
+        return
+    try:
+        self.driver.execute_cdp_cmd(
+            "Page.addScriptToEvaluateOnNewDocument", {"source": IDLE_SCRIPT}
+        )
+    except (AttributeError, WebDriverException):
+        # not a chromium driver, the tracker is injected per page instead
+        pass
+    self.driver.idle_tracking = True
+
+
+@timed
+def wait_for_idle(self, wait=20, quiet=0.5):
+    """
+    waits until the page has loaded, has no xhr/fetch requests in flight and
+    its dom has not changed for `quiet` seconds (instead of sleeping a fixed time);
+    if the page never settles within `wait` seconds, carries on as a sleep would
+    """
+    install_idle_tracking(self)
+
+    # start a fresh quiet window, so requests fired by the preceding action are seen
+    try:
+        self.driver.execute_script(
+            "if (window.__rtciIdle) { window.__rtciIdle.last = Date.now(); }"
+        )
+    except WebDriverException:
+        pass
+
+    def idle(driver):
+        state, pending, since = driver.execute_script(IDLE_STATE_SCRIPT)
+        if pending < 0:
+            # document loaded before the tracker was registered
+            driver.execute_script(IDLE_SCRIPT)
+            return False
+        return state == "complete" and pending == 0 and since >= quiet * 1000
+
+    try:
+        WebDriverWait(
+            self.driver,
+            wait,
+            poll_frequency=0.1,
+            ignored_exceptions=(WebDriverException,),
+        ).until(idle)
+    except TimeoutException:
+        self.logger.warning(f"page not idle after {wait}s, continuing")
 
 
+@timed
 def click_element(self, tag, feature, value):
     self.wait = WebDriverWait(self.driver, 20)
     xpath = f"//{tag}[@{feature}='{value}']"
     if feature == "text":
         xpath = f"//{tag}[{feature}()='{value}']"
     self.wait.until(ec.visibility_of_element_located((By.XPATH, xpath))).click()
-    sleep(1)
+    wait_for_idle(self)
     self.logger.info(f"clicked {xpath}")
     return
 
 
+@timed
 def click_element_by_index(self, tag, feature, value, index):
     self.wait = WebDriverWait(self.driver, 20)
     xpath = f"//{tag}[@{feature}='{value}']"
@@ -26,11 +164,12 @@ def click_element_by_index(self, tag, feature, value, index):
         xpath = f"//{tag}[{feature}()='{value}']"
     self.wait.until(ec.visibility_of_element_located((By.XPATH, xpath)))
     self.driver.find_elements(By.XPATH, xpath)[index].click()
-    sleep(1)
+    wait_for_idle(self)
     self.logger.info(f"clicked {xpath}")
     return
 
 
+@timed
 def click_element_previous(self, tag, feature, value, previous_tag, steps):
     self.wait = WebDriverWait(self.driver, 20)
     xpath = f"//{tag}[@{feature}='{value}']/preceding-sibling::{previous_tag}[{steps}]"
@@ -41,11 +180,12 @@ def click_element_previous(self, tag, feature, value, previous_tag, steps):
         if xpath.count("'") > 2:
             xpath = f'//{tag}[{feature}()="{value}"]/preceding-sibling::{previous_tag}[{steps}]'
     self.wait.until(ec.visibility_of_element_located((By.XPATH, xpath))).click()
-    sleep(1)
+    wait_for_idle(self)
     self.logger.info(f"clicked {xpath}")
     return
 
 
+@timed
 def click_element_next(self, tag, feature, value, next_tag, steps):
     self.wait = WebDriverWait(self.driver, 20)
     xpath = f"//{tag}[@{feature}='{value}']/following-sibling::{next_tag}[{steps}]"
@@ -56,33 +196,35 @@ def click_element_next(self, tag, feature, value, next_tag, steps):
                 f'//{tag}[{feature}()="{value}"]/following-sibling::{next_tag}[{steps}]'
             )
     self.wait.until(ec.visibility_of_element_located((By.XPATH, xpath))).click()
-    sleep(1)
+    wait_for_idle(self)
     self.logger.info(f"clicked {xpath}")
     return
 
 
+@timed
 def check_for_element(self, tag, feature, value):
     xpath = f"//{tag}[@{feature}='{value}']"
     if feature == "text":
         xpath = f"//{tag}[{feature}()='{value}']"
     element = self.driver.find_element(By.XPATH, xpath)
-    sleep(1)
     if element:
         self.logger.info(f"found {xpath}")
         return True
     return False
 
 
+@timed
 def wait_for_element(self, tag, feature, value, wait=20):
     self.wait = WebDriverWait(self.driver, wait)
     xpath = f"//{tag}[@{feature}='{value}']"
     if feature == "text":
         xpath = f"//{tag}[{feature}()='{value}']"
     self.wait.until(ec.visibility_of_element_located((By.XPATH, xpath)))
-    sleep(1)
+    wait_for_idle(self)
     self.logger.info(f"found {xpath}")
 
 
+@timed
 def click_select_element_value(self, tag, feature, value, option):
     wait_for_element(self, tag, feature, value)
     xpath = f"//{tag}[@{feature}='{value}']"
@@ -91,20 +233,21 @@ def click_select_element_value(self, tag, feature, value, option):
     element = self.driver.find_element(By.XPATH, xpath)
     select = Select(element)
     select.select_by_visible_text(option)
-    sleep(1)
+    wait_for_idle(self)
     self.logger.info(f"selected option {xpath}")
 
 
+@timed
 def hide_element(self, xpath):
     self.driver.execute_script(
         "arguments[0].style.visibility='hidden'",
         self.driver.find_element(By.XPATH, xpath),
     )
-    sleep(1)
     self.logger.info(f"hid {xpath}")
     return
 
 
+@timed
 def drag_element(self, element_from, element_to):
     tag_from, feature_from, value_from = element_from
     tag_to, feature_to, value_to = element_to
@@ -123,6 +266,6 @@ def drag_element(self, element_from, element_to):
         ec.element_to_be_clickable((By.XPATH, xpath_to))
     )
     ActionChains(self.driver).drag_and_drop(drag, drop).perform()
-    sleep(1)
+    wait_for_idle(self)
     self.logger.info(f"dragged {xpath_from} to {xpath_to}")
     return
@@ -1,7 +1,8 @@
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.firefox.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
+
+from browser_pool import driver_path, get_pool
 
 
 # ***** ignore: port configs for remote selenium testing
@@ -47,9 +48,22 @@ def chrome_driver(self):
     # add the preferences as an experimental option
     chrome_options.add_experimental_option("prefs", prefs)
 
-    return webdriver.Chrome(
-        service=Service(ChromeDriverManager().install()), options=chrome_options
-    )
+    # visible browsers (local testing) are launched directly, headless ones are
+    # leased from this process's browser pool and handed back on `driver.quit()`
+    if self.args.visible:
+        return webdriver.Chrome(service=Service(driver_path()), options=chrome_options)
+    return get_pool().lease(chrome_options, self.download_dir)
+
+
+def reset_driver(self):
+    """
+    returns the scraper's browser to the pool (clearing its cookies, cache and
+    windows), leases a clean one and reloads `self.url`, so retries do not
+    have to relaunch chrome
+    """
+    self.driver.quit()
+    self.driver = chrome_driver(self)
+    self.driver.get(self.url)
 
 
 def firefox_driver(self):
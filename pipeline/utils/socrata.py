@@ -0,0 +1,92 @@
+import os
+import pandas as pd
+
+from requests_configs import mount_session
+
+
+"""
+A small client for Socrata open data portals (SODA `/resource/{id}.json`
+endpoints), used by scrapers of city open data incident tables.
+
+Rather than downloading every incident and counting them in pandas,
+`monthly_counts` pushes the aggregation down to the portal as one SoQL query
+(`date_trunc_ym(...)`, `GROUP BY`, `count(*)` or `sum(...)`), so a scrape
+transfers one row per month and offense code. Results are paged with `OFFSET` for tables whose
+grouped output is larger than one page. `crimes.to_matrix` then maps offense
+codes to crimes and returns the monthly (year, month) x crime table scrapers
+return.
+
+An app token is sent when `SOCRATA_APP_TOKEN` is set, which raises the
+portal's request rate limits.
+"""
+
+
+PAGE_SIZE = 50_000
+
+_session = None
+
+
+def get_session():
+    global _session
+    if _session is None:
+        _session = mount_session()
+    return _session
+
+
+def query(domain, dataset, soql, page_size=PAGE_SIZE):
+    """
+    runs a SoQL query (without LIMIT/OFFSET, with an ORDER BY for stable paging)
+    and returns all rows, paging through results `page_size` rows at a time
+    """
+    headers = dict()
+    if os.getenv("SOCRATA_APP_TOKEN"):
+        headers["X-App-Token"] = os.getenv("SOCRATA_APP_TOKEN")
+
+    rows, offset = list(), 0
+    while True:
+        r = get_session().get(
+            f"https://{domain}/resource/{dataset}.json",
+            params={"$query": f"{soql} LIMIT {page_size} OFFSET {offset}"},
+            headers=headers,
+        )
+        r.raise_for_status()
+        page = r.json()
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        offset += page_size
+
+
+def monthly_counts(
+    domain, dataset, date, category, where=None, distinct=None, total=None
+):
+    """
+    returns a (year, month, category, count) table of rows per month and `category`
+    value, counting distinct values of the `distinct` column or summing the `total`
+    column instead of counting rows if given
+    """
+    if distinct:
+        count = f"count(DISTINCT `{distinct}`)"
+    elif total:
+        count = f"sum(`{total}`)"
+    else:
+        count = "count(*)"
+    soql = (
+        f"SELECT date_trunc_ym(`{date}`) AS period, `{category}` AS category, "
+        f"{count} AS count"
+    )
+    if where:
+        soql += f" WHERE {where}"
+    soql += " GROUP BY period, category ORDER BY period, category"
+
+    df = pd.DataFrame(
+        query(domain, dataset, soql), columns=["period", "category", "count"]
+    )
+    df = df[df["period"].notna()]
+    period = pd.to_datetime(df["period"], format="ISO8601")
+    df["year"] = period.dt.year
+    df["month"] = period.dt.month
+    # (a sum over only missing values comes back without a count)
+    df["count"] = pd.to_numeric(df["count"]).fillna(0).astype(int)
+    return df[["year", "month", "category", "count"]]
+
@@ -1,5 +1,6 @@
 import argparse
 import inspect
+import numpy as np
 import os
 import pandas as pd
 import sys
@@ -52,6 +53,10 @@ parser.add_argument(
 
 
 class Scraper:
+    # summary of the most recently completed run, read by `ops/scrape_worker.py`
+    # when scrapers are executed in-process rather than as subprocesses
+    last_result = None
+
     def __init__(self):
         self.args = parser.parse_args()
         self.logger = create_logger()
@@ -140,6 +145,17 @@ class Scraper:
         else:
             return s
 
+    @staticmethod
+    def to_numeric(col):
+        """
+        vectorized `check_for_comma` over a whole column: strips thousands separators
+        from strings, treats blank strings as missing and casts everything to float
+        """
+        if col.dtype == object:
+            strings = col.str.replace(",", "", regex=False).str.strip()
+            col = col.where(strings.isna(), strings.replace("", np.nan))
+        return pd.to_numeric(col).astype(float)
+
     def process(self, data):
         # assert data is a non-empty list and every record has a date
         assert isinstance(data, list)
@@ -158,18 +174,14 @@ class Scraper:
         else:
             assert "ori" in df.columns and len(df[df["ori"].isna()]) == 0
 
-        # fill out placeholder columns for missing crimes
+        # convert crime counts to numbers and fill out placeholder columns for missing crimes
         for crime in self.crimes:
-            if crime in df.columns:
-                df[crime] = df[crime].apply(lambda s: self.check_for_comma(s))
-            else:
-                df[crime] = None
-            if f"{crime}_cleared" in df.columns:
-                df[f"{crime}_cleared"] = df[f"{crime}_cleared"].apply(
-                    lambda s: self.check_for_comma(s)
-                )
-            else:
-                df[f"{crime}_cleared"] = None
+            for col in [crime, f"{crime}_cleared"]:
+                if col in df.columns:
+                    df[col] = self.to_numeric(df[col])
+                    df[col] = df[col].astype(object).where(df[col].notna(), None)
+                else:
+                    df[col] = None
 
             # produce 12-month rolling sums per crime
             # df[f"{crime}_mvs_12mo"] = (
@@ -191,14 +203,16 @@ class Scraper:
 
         # check on column counts
         assert len(df.keys()) == 18
-        return df.to_dict("records")
+        return df
 
     def run(self):
         try:
             # collect and process data
             data = self.scrape()
             processed = self.process(data)
-            self.logger.info(f"sample record: {processed[0]}")
+            self.logger.info(
+                f"sample record: {processed.iloc[:1].to_dict('records')[0]}"
+            )
 
             # export data
             if not self.args.test:
@@ -209,7 +223,17 @@ class Scraper:
             self.logger.info(f"earliest data: {self.collected_earliest}")
             self.logger.info(f"latest data: {self.collected_latest}")
             self.logger.info(f"completed oris: {self.oris}")
+            Scraper.last_result = {
+                "oris": list(self.oris),
+                "data_from": self.collected_earliest,
+                "data_to": self.collected_latest,
+                "records": len(processed),
+            }
         finally:
+            # report which browser actions dominated the scrape (see `selenium_actions.timed`)
+            if getattr(self, "timings", None):
+                self.log_timings()
+
             # ensure any selenium driver is cleaned up to prevent zombie Chrome processes
             if hasattr(self, "driver"):
                 try:
@@ -217,13 +241,29 @@ class Scraper:
                 except Exception:
                     pass
 
+    def log_timings(self):
+        """
+        logs the calls and total time per timed browser action, slowest first
+        """
+        elapsed = max(time() - self.run_time, 1)
+        for action, (count, seconds) in sorted(
+            self.timings.items(), key=lambda t: t[1][1], reverse=True
+        ):
+            self.logger.info(
+                f"timing: {action} x{count} {seconds:.1f}s ({seconds / elapsed:.0%} of run)"
+            )
+
     def export(self, processed):
+        # partition data by ori in one pass
+        groups = dict(list(processed.groupby("ori", sort=False)))
         for ori in self.oris:
-            # subset to data for the specified ori and push to aws s3
-            agency_data = [d for d in processed if d["ori"] == ori]
+            # push the data for the specified ori to aws s3 (gzipped, since scrape
+            # snapshots are only read back by `ops/aggregator.py`)
+            agency_data = groups[ori].to_dict("records") if ori in groups else list()
             snapshot_json(
                 logger=self.logger,
                 json_data=agency_data,
                 path=f"scrapes/{self.state}/{ori}/",
                 timestamp=self.run_time,
+                compress=True,
             )